@@ -16,6 +16,7 @@ st.markdown(
     - **หน้าหลัก:** สำหรับเพิ่มสมาชิก, ดูข้อมูล, และชำระเงิน
     - **แก้ไขหรือลบข้อมูล:** สำหรับจัดการข้อมูลสมาชิกที่มีอยู่
     - **เครื่องมือแอดมิน:** สำหรับคำนวณดอกเบี้ยประจำรอบ
+    - **ภาพรวม:** ยอดรวมตามพื้นที่และบัญชีเงินกู้ สัดส่วนหนี้เกินกำหนด และแนวโน้มรายเดือน
     """
 )
 st.markdown("""พัฒนาโดย เอกพล แข็งแรง""")
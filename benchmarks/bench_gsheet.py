@@ -0,0 +1,218 @@
+# benchmarks/bench_gsheet.py
+# วัดจำนวนคำขอ API, เวลา และหน่วยความจำ ของแต่ละฟังก์ชันใน gsheet_utils และแต่ละหน้า
+# โดยใช้ Google Sheet จำลอง (benchmarks/fake_sheets.py) ไม่ต้องต่อ Google จริง
+#
+# วิธีใช้:
+#   python benchmarks/bench_gsheet.py                       # 5,000 สมาชิก / 20,000 สัญญา
+#   python benchmarks/bench_gsheet.py --latency-ms 150      # จำลองความหน่วงของเครือข่าย
+#   python benchmarks/bench_gsheet.py --json baseline.json  # บันทึกผลไว้เทียบครั้งหน้า
+#   python benchmarks/bench_gsheet.py --compare baseline.json  # ถ้าช้าลง/เรียก API มากขึ้น exit 1
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import date, datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+# ใช้สำเนา SQLite และโฟลเดอร์ Snapshot แยกต่างหาก (ต้องตั้งก่อน import replica_utils / snapshot_utils)
+BENCH_DIR = tempfile.mkdtemp(prefix="loanapp-bench-")
+os.environ["LOANAPP_REPLICA_PATH"] = os.path.join(BENCH_DIR, "replica.db")
+os.environ["LOANAPP_SNAPSHOT_DIR"] = os.path.join(BENCH_DIR, "snapshots")
+os.environ["LOANAPP_JOURNAL_PATH"] = os.path.join(BENCH_DIR, "journal.db")
+warnings.simplefilter("ignore")
+logging.disable(logging.WARNING)  # ข้อความเตือนของ Streamlit ตอนรันนอก `streamlit run`
+
+import pandas as pd
+
+import gsheet_utils
+import interest_utils
+import journal_utils
+import ledger_utils
+import rollup_utils
+import snapshot_utils
+from benchmarks.fake_sheets import FakeSpreadsheet, make_workbook
+
+# เวลาช้าลงเกินกี่เท่า (และเกินกี่ ms) ถึงนับว่าถดถอย
+TIME_REGRESSION_RATIO = 1.5
+TIME_REGRESSION_MIN_MS = 5.0
+
+PAGES = [
+    "pages/1_🏠_หน้าหลัก.py",
+    "pages/2_🛠_แก้ไขหรือลบข้อมูล.py",
+    "pages/3_⚙️_ตรวจสอบดอกเบี้ย.py",
+    "pages/4_📊_ภาพรวม.py",
+]
+
+
+def measure(name: str, sh: FakeSpreadsheet, fn) -> dict:
+    sh.reset_calls()
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    wall_ms = (time.perf_counter() - started) * 1000
+    peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    result = {"name": name, "wall_ms": round(wall_ms, 2), "peak_kb": round(peak_kb), **sh.stats()}
+    print(f"{name:<45} {result['api_calls']:>5} {wall_ms:>10.1f} {peak_kb:>10.0f}  {result['calls']}")
+    return result
+
+
+def run_page(path: str):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, path), default_timeout=120).run()
+    if at.exception:
+        raise RuntimeError(f"{path}: {at.exception[0].message}")
+
+
+def run(members: int, loans: int, latency_ms: float, pages: bool) -> list:
+    print(f"สร้างข้อมูลจำลอง: สมาชิก {members:,} คน / สัญญา {loans:,} ฉบับ / ความหน่วง {latency_ms} ms ต่อคำขอ")
+    sh = FakeSpreadsheet(make_workbook(members, loans), latency=latency_ms / 1000)
+    gsheet_utils.PREFETCH_IN_BACKGROUND = False
+    gsheet_utils.connect_to_sheet = lambda: sh  # หน้าเว็บทุกหน้าได้ Sheet จำลองแทน
+
+    print(f"\n{'รายการ':<45} {'API':>5} {'เวลา (ms)':>10} {'หน่วยความจำ (KB)':>10}  รายละเอียด")
+    results = []
+    results.append(measure("prefetch_all_sheets (เปิดแอปครั้งแรก)", sh,
+                           lambda: gsheet_utils.prefetch_all_sheets(sh, force=True)))
+
+    def load_cold(name):
+        gsheet_utils.clear_all_caches()
+        gsheet_utils.get_data_as_dataframe(name, sh)
+    for name in ["Members", "Loans", "PaymentHistory"]:
+        results.append(measure(f"get_data_as_dataframe {name} (miss)", sh, lambda n=name: load_cold(n)))
+        results.append(measure(f"get_data_as_dataframe {name} (hit)", sh,
+                               lambda n=name: gsheet_utils.get_data_as_dataframe(n, sh)))
+
+    members_df = gsheet_utils.get_data_as_dataframe("Members", sh)
+    loans_df = gsheet_utils.get_data_as_dataframe("Loans", sh)
+    active = loans_df[loans_df["Status"].isin(["ยังค้างชำระ", "เกินกำหนดชำระ"])]
+    member_id = str(active["MemberID"].iloc[0])
+    loan_id = str(active["LoanID"].iloc[0])
+    other_member = str(members_df["MemberID"].iloc[-1])
+
+    results.append(measure("get_member_by_id", sh, lambda: gsheet_utils.get_member_by_id(sh, member_id)))
+    results.append(measure("get_loan_summary_by_member", sh,
+                           lambda: gsheet_utils.get_loan_summary_by_member(sh, member_id)))
+    results.append(measure("get_address_suggestions", sh, lambda: gsheet_utils.get_address_suggestions(sh)))
+    results.append(measure("get_portfolio_interest (ทั้งพอร์ต)", sh, lambda: interest_utils.get_portfolio_interest(sh)))
+    results.append(measure("ledger_utils.refresh (ครั้งแรก)", sh, lambda: ledger_utils.refresh(sh)))
+    results.append(measure("ledger_utils.get_member_balances", sh, lambda: ledger_utils.get_member_balances(sh, member_id)))
+    results.append(measure("rollup_utils.refresh (สร้างตารางสรุป)", sh, lambda: rollup_utils.refresh(sh)))
+    snapshot_path = snapshot_utils.export_snapshot(sh)
+    results.append(measure("snapshot_utils.export_snapshot (zstd)", sh, lambda: snapshot_utils.export_snapshot(sh)))
+    results.append(measure("snapshot_utils.load_table (Loans)", sh, lambda: snapshot_utils.load_table(snapshot_path, "Loans")))
+
+    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def payment():
+        tx = gsheet_utils.SheetTransaction(sh)
+        tx.append_row("PaymentHistory", ["T-BENCH-1", stamp, member_id, loan_id, 100, 10])
+        tx.increment("Loans", "LoanID", loan_id, {"AmountPaid": 100, "InterestPaid": 10})
+        tx.update_when_paid("Loans", "LoanID", loan_id, {"Status": "ชำระครบแล้ว"})
+        tx.update("Members", "MemberID", member_id, {"LastUpdated": stamp})
+        assert tx.commit()
+    results.append(measure("ชำระหนี้ (SheetTransaction)", sh, payment))
+
+    def deposit():
+        tx = gsheet_utils.SheetTransaction(sh)
+        tx.increment("Members", "MemberID", other_member, {"Savings": 100})
+        tx.update("Members", "MemberID", other_member, {"LastUpdated": stamp})
+        tx.append_row("SavingsHistory", ["D-BENCH-1", stamp, other_member, 100])
+        assert tx.commit()
+    results.append(measure("ฝากเงินสัจจะ", sh, deposit))
+
+    # Write-behind: เวลาที่หน้าเว็บรอ (เข้าคิว) แยกจากเวลาที่ส่งขึ้น Sheet (รวม 20 รายการในคำขอเดียว)
+    journal_utils.FLUSH_IN_BACKGROUND = False
+
+    def queued_deposits():
+        for i in range(20):
+            tx = gsheet_utils.SheetTransaction(sh)
+            tx.increment("Members", "MemberID", other_member, {"Savings": 100})
+            tx.update("Members", "MemberID", other_member, {"LastUpdated": stamp})
+            tx.append_row("SavingsHistory", [f"D-BENCH-Q{i}", stamp, other_member, 100])
+            assert tx.commit_later()
+    results.append(measure("ฝากเงินสัจจะ x20 (เข้าคิว)", sh, queued_deposits))
+    results.append(measure("ส่งคิว 20 รายการขึ้น Sheet", sh, lambda: journal_utils.drain(sh)))
+
+    def share_purchase():
+        tx = gsheet_utils.SheetTransaction(sh)
+        tx.increment("Members", "MemberID", other_member, {"Shares": 100})
+        tx.update("Members", "MemberID", other_member, {
+            "LastSharePurchaseDate": date.today().isoformat(), "LastUpdated": stamp})
+        tx.append_row("ShareHistory", ["S-BENCH-1", stamp, other_member, 2, 100, "Purchase"])
+        assert tx.commit()
+    results.append(measure("ซื้อหุ้นประจำปี", sh, share_purchase))
+
+    def approve_loan():
+        today = date.today().isoformat()
+        gsheet_utils.add_loan_contract(sh, ["L-BENCH-1", other_member, 1, today, today, 10000, 0, 0, "ยังค้างชำระ", stamp])
+    results.append(measure("อนุมัติสัญญาเงินกู้ใหม่", sh, approve_loan))
+
+    def bulk_import():
+        rows, errors = gsheet_utils.validate_import(sh, "Members", pd.DataFrame({
+            "Name": [f"สมาชิกนำเข้า {i}" for i in range(1000)], "Village": "บ้านนำเข้า",
+            "SubDistrict": "ในเมือง", "District": "เมืองขอนแก่น", "Province": "ขอนแก่น",
+        }))
+        assert not errors and gsheet_utils.append_rows_bulk("Members", sh, rows) == 1000
+    results.append(measure("นำเข้าสมาชิก 1,000 คน (CSV)", sh, bulk_import))
+
+    def overdue_sweep():
+        df = gsheet_utils.get_data_as_dataframe("Loans", sh)
+        overdue = df[(df["DueDate"] <= datetime.now()) & df["Status"].isin(["Active", "ยังค้างชำระ"])]
+        gsheet_utils.update_loans_status_bulk(sh, overdue["LoanID"].astype(str).unique().tolist(), "เกินกำหนดชำระ")
+    results.append(measure("ปรับสถานะสัญญาเกินกำหนด (ทั้งหมด)", sh, overdue_sweep))
+
+    if pages:
+        for path in PAGES:
+            page_name = os.path.splitext(os.path.basename(path))[0]
+            results.append(measure(f"หน้า {page_name}", sh, lambda p=path: run_page(p)))
+    return results
+
+
+def compare(results: list, baseline_path: str) -> list:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None:
+            continue
+        if r["api_calls"] > old["api_calls"]:
+            regressions.append(f"{r['name']}: API {old['api_calls']} -> {r['api_calls']} ครั้ง")
+        if r["wall_ms"] > old["wall_ms"] * TIME_REGRESSION_RATIO and r["wall_ms"] - old["wall_ms"] > TIME_REGRESSION_MIN_MS:
+            regressions.append(f"{r['name']}: เวลา {old['wall_ms']:.1f} -> {r['wall_ms']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดประสิทธิภาพ gsheet_utils กับ Google Sheet จำลอง")
+    parser.add_argument("--members", type=int, default=5000)
+    parser.add_argument("--loans", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="ความหน่วงต่อคำขอ API (ms)")
+    parser.add_argument("--no-pages", action="store_true", help="ไม่ต้องวัดการเปิดแต่ละหน้า")
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    parser.add_argument("--compare", help="ไฟล์ JSON ผลครั้งก่อน สำหรับตรวจการถดถอย")
+    args = parser.parse_args()
+
+    results = run(args.members, args.loans, args.latency_ms, pages=not args.no_pages)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"members": args.members, "loans": args.loans, "latency_ms": args.latency_ms,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            print("\nพบการถดถอย:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nไม่พบการถดถอยเมื่อเทียบกับ", args.compare)
+
+
+if __name__ == "__main__":
+    main()
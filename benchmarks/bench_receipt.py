@@ -0,0 +1,83 @@
+# benchmarks/bench_receipt.py
+# วัดเวลาและหน่วยความจำในการสร้างใบเสร็จ PDF เทียบแบบเดิม (receipt_baseline) กับแบบใช้แม่แบบ (pdf_utils)
+# แต่ละแบบวัดใน Process ใหม่ แยกเวลา import โมดูล / ใบแรก (โหลดฟอนต์ สร้างแม่แบบ) / ใบถัดไป
+# วิธีใช้: python benchmarks/bench_receipt.py [จำนวนรอบ]
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # ฟอนต์อ้างอิงแบบ relative path (fonts/...)
+warnings.simplefilter("ignore")
+
+VARIANTS = {
+    "baseline": "แบบเดิม (ก่อนใช้แม่แบบ)",
+    "template": "แบบใช้แม่แบบ (pdf_utils)",
+}
+
+SAMPLE_RECEIPT = {
+    "member_info": {
+        "Name": "นายสมชาย ใจดี", "AddressNo": "12/3", "Village": "บ้านหนองบัว",
+        "SubDistrict": "ในเมือง", "District": "เมือง", "Province": "ขอนแก่น",
+    },
+    "payment_date": "18 ตุลาคม 2569",
+    "loan_id": "L-1700000000",
+    "line_items": [
+        {"label": "ชำระเงินต้น (L-1700000000)", "amount": 5000.0},
+        {"label": "ชำระดอกเบี้ย (L-1700000000)", "amount": 300.0},
+    ],
+    "balance_summary": [{"label": "ยอดหนี้คงเหลือ (L-1700000000)", "amount": 45000.0, "unit": "บาท"}],
+}
+
+def _measure(variant: str, rounds: int) -> dict:
+    """วัดใน Process นี้ (ต้องยังไม่เคย import ตัวสร้างใบเสร็จ)"""
+    # ในแอป fpdf / streamlit ถูก import ไว้แล้วก่อนออกใบเสร็จใบแรก จึงไม่นับเวลา import ไลบรารี
+    import fpdf, streamlit  # noqa: F401
+    started = time.perf_counter()
+    if variant == "baseline":
+        from benchmarks.receipt_baseline import generate_receipt_pdf
+    else:
+        from pdf_utils import generate_receipt_pdf
+    import_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    generate_receipt_pdf(SAMPLE_RECEIPT)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for i in range(rounds):
+        generate_receipt_pdf(dict(SAMPLE_RECEIPT, payment_date=f"{i % 28 + 1} ตุลาคม 2569"))
+    warm_ms = (time.perf_counter() - started) * 1000 / rounds
+
+    tracemalloc.start()
+    generate_receipt_pdf(SAMPLE_RECEIPT)
+    peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return {"import_ms": import_ms, "cold_ms": cold_ms, "warm_ms": warm_ms, "peak_kb": peak_kb}
+
+def main(rounds: int = 50):
+    results = {}
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, __file__, str(rounds), variant],
+                                check=True, capture_output=True, text=True).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'แบบ':<28}{'import (ms)':>12}{'ใบแรก (ms)':>12}{f'ใบถัดไป เฉลี่ย {rounds} ใบ (ms)':>28}"
+          f"{'หน่วยความจำสูงสุด/ใบ (KB)':>28}")
+    for variant, label in VARIANTS.items():
+        r = results[variant]
+        print(f"{label:<28}{r['import_ms']:>12.1f}{r['cold_ms']:>12.1f}{r['warm_ms']:>28.1f}{r['peak_kb']:>28.0f}")
+    base, new = results["baseline"], results["template"]
+    print(f"ใบถัดไปเร็วขึ้น {base['warm_ms'] / new['warm_ms']:.2f} เท่า, ใบแรกเร็วขึ้น {base['cold_ms'] / new['cold_ms']:.2f} เท่า")
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    if len(sys.argv) > 2:
+        print(json.dumps(_measure(sys.argv[2], rounds)))
+    else:
+        main(rounds)
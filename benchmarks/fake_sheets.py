@@ -0,0 +1,308 @@
+# benchmarks/fake_sheets.py
+# Google Sheet จำลองในหน่วยความจำ (แทน gspread.Spreadsheet / Worksheet) สำหรับวัดผล
+# - นับจำนวนคำขอ API แยกตามเมธอด และขนาดข้อมูลที่รับ/ส่ง (โดยประมาณ จาก JSON)
+# - ใส่ความหน่วง (latency) ต่อคำขอได้ เพื่อจำลองเครือข่ายจริง
+# - ข้อมูลเก็บเป็นข้อความเหมือนค่าที่ Sheets API ส่งกลับมา
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import gspread
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+import schema_utils
+
+
+class CallLog:
+    """ตัวนับคำขอที่ใช้ร่วมกันทั้ง Spreadsheet"""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # (วินาที) ต่อคำขอ
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def record(self, method: str, sent=None, received=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            self.bytes_sent += len(json.dumps(sent, default=str)) if sent is not None else 0
+            self.bytes_received += len(json.dumps(received, default=str)) if received is not None else 0
+        return received
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "api_calls": sum(self.calls.values()),
+                "calls": dict(self.calls),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+
+def _as_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id: int, title: str, rows: list):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = [[_as_text(v) for v in r] for r in rows]
+        self._log = spreadsheet.log
+
+    # --- ตัวช่วยภายใน (ไม่นับเป็นคำขอ) ---
+    def _ensure(self, row: int, col: int):
+        while len(self.rows) < row:
+            self.rows.append([])
+        current = self.rows[row - 1]
+        if len(current) < col:
+            current.extend([""] * (col - len(current)))
+
+    def _set(self, row: int, col: int, value):
+        self._ensure(row, col)
+        self.rows[row - 1][col - 1] = _as_text(value)
+
+    def _read_grid(self, grid: dict) -> list:
+        start_row = grid.get("startRowIndex", 0)
+        end_row = grid.get("endRowIndex", len(self.rows))
+        start_col = grid.get("startColumnIndex", 0)
+        end_col = grid.get("endColumnIndex")
+        values = []
+        for r in self.rows[start_row:end_row]:
+            cells = r[start_col:end_col] if end_col is not None else r[start_col:]
+            while cells and cells[-1] == "":
+                cells = cells[:-1]
+            values.append(list(cells))
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _read_a1(self, a1: str) -> list:
+        return self._read_grid(a1_range_to_grid_range(a1))
+
+    def _append(self, values: list) -> int:
+        self.rows.append([_as_text(v) for v in values])
+        return len(self.rows)
+
+    def _updated_range(self, first: int, last: int, width: int) -> str:
+        return f"{self.title}!A{first}:{rowcol_to_a1(last, max(width, 1))}"
+
+    # --- เมธอดแบบ gspread.Worksheet (นับเป็นคำขอ API) ---
+    def get_all_values(self, **kwargs):
+        return self._log.record("get_all_values", received=self._read_grid({}))
+
+    def get_values(self, range_name: str = None, **kwargs):
+        values = self._read_a1(range_name) if range_name else self._read_grid({})
+        return self._log.record("get_values", sent=range_name, received=values)
+
+    def batch_get(self, ranges: list, **kwargs):
+        values = [gspread.worksheet.ValueRange(self._read_a1(a1)) for a1 in ranges]
+        self._log.record("batch_get", sent=ranges, received=[list(v) for v in values])
+        return values
+
+    def row_values(self, row: int, **kwargs):
+        values = self._read_grid({"startRowIndex": row - 1, "endRowIndex": row})
+        return self._log.record("row_values", received=values[0] if values else [])
+
+    def col_values(self, col: int, **kwargs):
+        values = [r[col - 1] if len(r) >= col else "" for r in self.rows]
+        return self._log.record("col_values", received=values)
+
+    def cell(self, row: int, col: int, **kwargs):
+        self._ensure(row, col)
+        value = self.rows[row - 1][col - 1]
+        self._log.record("cell", received=value)
+        return gspread.Cell(row, col, value)
+
+    def find(self, query: str, in_row: int = None, in_column: int = None, **kwargs):
+        found = None
+        for r, values in enumerate(self.rows, start=1):
+            if in_row is not None and r != in_row:
+                continue
+            for c, value in enumerate(values, start=1):
+                if (in_column is None or c == in_column) and value == str(query):
+                    found = gspread.Cell(r, c, value)
+                    break
+            if found:
+                break
+        self._log.record("find", sent=query, received=self.rows)  # API อ่านทั้งแท็บมาค้น
+        return found
+
+    def findall(self, query: str, in_row: int = None, in_column: int = None, **kwargs):
+        found = [
+            gspread.Cell(r, c, value)
+            for r, values in enumerate(self.rows, start=1) if in_row is None or r == in_row
+            for c, value in enumerate(values, start=1)
+            if (in_column is None or c == in_column) and value == str(query)
+        ]
+        self._log.record("findall", sent=query, received=self.rows)
+        return found
+
+    def append_row(self, values: list, **kwargs):
+        row = self._append(values)
+        return self._log.record("append_row", sent=values, received={
+            "updates": {"updatedRange": self._updated_range(row, row, len(values))}
+        })
+
+    def append_rows(self, values: list, **kwargs):
+        first = len(self.rows) + 1
+        for v in values:
+            self._append(v)
+        width = max((len(v) for v in values), default=1)
+        return self._log.record("append_rows", sent=values, received={
+            "updates": {"updatedRange": self._updated_range(first, len(self.rows), width)}
+        })
+
+    def update_cell(self, row: int, col: int, value):
+        self._set(row, col, value)
+        return self._log.record("update_cell", sent=value, received={})
+
+    def update_cells(self, cell_list: list, **kwargs):
+        for c in cell_list:
+            self._set(c.row, c.col, c.value)
+        return self._log.record("update_cells", sent=[c.value for c in cell_list], received={})
+
+    def batch_update(self, data: list, **kwargs):
+        for item in data:
+            grid = a1_range_to_grid_range(item["range"])
+            for dr, row_values in enumerate(item["values"]):
+                for dc, value in enumerate(row_values):
+                    self._set(grid.get("startRowIndex", 0) + dr + 1, grid.get("startColumnIndex", 0) + dc + 1, value)
+        return self._log.record("ws_batch_update", sent=data, received={})
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        del self.rows[start_index - 1:(end_index or start_index)]
+        return self._log.record("delete_rows", received={})
+
+
+class FakeSpreadsheet:
+    """ใช้แทน gspread.Spreadsheet ที่ได้จาก connect_to_sheet()"""
+    def __init__(self, sheets: dict, latency: float = 0.0, title: str = "FakeLoanApp"):
+        self.title = title
+        self.log = CallLog(latency)
+        self._worksheets = {
+            name: FakeWorksheet(self, sheet_id, name, rows)
+            for sheet_id, (name, rows) in enumerate(sheets.items())
+        }
+
+    def worksheet(self, title: str):
+        self.log.record("worksheet", sent=title)
+        if title not in self._worksheets:
+            raise WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self, **kwargs):
+        self.log.record("worksheets")
+        return list(self._worksheets.values())
+
+    def values_batch_get(self, ranges: list, params: dict = None):
+        value_ranges = []
+        for name in ranges:
+            title, _, a1 = name.rpartition("!")
+            if not title:
+                title, a1 = a1, ""
+            ws = self._worksheets[title.strip("'").replace("''", "'")]
+            value_ranges.append({"range": name, "values": ws._read_a1(a1) if a1 else ws._read_grid({})})
+        return self.log.record("values_batch_get", sent=ranges, received={"valueRanges": value_ranges})
+
+    def batch_update(self, body: dict):
+        by_id = {ws.id: ws for ws in self._worksheets.values()}
+        for request in body.get("requests", []):
+            if "appendCells" in request:
+                append = request["appendCells"]
+                for row in append["rows"]:
+                    by_id[append["sheetId"]]._append([_cell_value(c) for c in row["values"]])
+            elif "updateCells" in request:
+                update = request["updateCells"]
+                grid = update["range"]
+                ws = by_id[grid["sheetId"]]
+                for dr, row in enumerate(update["rows"]):
+                    for dc, cell in enumerate(row["values"]):
+                        ws._set(grid["startRowIndex"] + dr + 1, grid["startColumnIndex"] + dc + 1, _cell_value(cell))
+            else:
+                raise NotImplementedError(f"FakeSpreadsheet ไม่รองรับคำสั่ง {list(request)}")
+        return self.log.record("batch_update", sent=body, received={"replies": []})
+
+    # --- สถิติ ---
+    def reset_calls(self):
+        self.log.reset()
+
+    def stats(self) -> dict:
+        return self.log.snapshot()
+
+
+def _cell_value(cell: dict):
+    value = cell.get("userEnteredValue", {})
+    return next(iter(value.values()), "") if value else ""
+
+
+# --- ข้อมูลตัวอย่างขนาดใกล้เคียงของจริง ---
+VILLAGES = ["บ้านหนองบัว", "บ้านโนนสูง", "บ้านดอนแดง", "บ้านนาคำ", "บ้านโคกกลาง", "บ้านหัวนา", "บ้านป่าแดง", "บ้านท่าช้าง"]
+SUB_DISTRICTS = ["ในเมือง", "บ้านเป็ด", "ศิลา", "พระลับ", "สำราญ"]
+DISTRICTS = ["เมืองขอนแก่น", "บ้านฝาง", "น้ำพอง"]
+FIRST_NAMES = ["สมชาย", "สมหญิง", "ประเสริฐ", "วิไล", "บุญมี", "สุดา", "ทองดี", "มาลี", "สมศักดิ์", "จันทร์เพ็ญ"]
+LAST_NAMES = ["ใจดี", "ศรีสุข", "บุญมา", "แก้วกา", "พรมมา", "สายทอง", "ทองคำ", "มีสุข"]
+LOAN_ACCOUNTS = [1, 2, 4]
+
+def make_workbook(members: int = 5000, loans: int = 20000, history_per_member: int = 4,
+                  seed: int = 7, today: date = None) -> dict:
+    """
+    สร้างข้อมูลทุกแท็บตาม schema_utils.SHEET_COLUMNS (แถวแรก = หัวตาราง)
+    คืนค่า dict {ชื่อแท็บ: [[...], ...]} สำหรับส่งให้ FakeSpreadsheet
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    columns = schema_utils.SHEET_COLUMNS
+    sheets = {name: [list(header)] for name, header in columns.items()}
+
+    member_ids = [f"M-{1_600_000_000 + i}" for i in range(members)]
+    for i, member_id in enumerate(member_ids):
+        dob = date(1950, 1, 1) + timedelta(days=rng.randrange(0, 365 * 50))
+        sheets["Members"].append([
+            member_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}", str(rng.randrange(1, 300)),
+            rng.choice(VILLAGES), rng.choice(SUB_DISTRICTS), rng.choice(DISTRICTS), "ขอนแก่น",
+            dob.isoformat(), rng.randrange(0, 50) * 100, rng.randrange(0, 40) * 50,
+            f"{today.isoformat()} 09:00:00", f"{today.year - rng.randrange(0, 3)}-11-05",
+        ])
+
+    for i in range(loans):
+        issue = today - timedelta(days=rng.randrange(0, 730))
+        principal = rng.randrange(5, 100) * 1000
+        paid = min(principal, rng.randrange(0, 100) * 500)
+        status = "ชำระครบแล้ว" if paid >= principal else rng.choice(["ยังค้างชำระ", "ยังค้างชำระ", "เกินกำหนดชำระ"])
+        sheets["Loans"].append([
+            f"L-{1_600_000_000 + i}", rng.choice(member_ids), rng.choice(LOAN_ACCOUNTS),
+            issue.isoformat(), (issue + timedelta(days=365)).isoformat(),
+            principal, paid, rng.randrange(0, 20) * 100, status, issue.isoformat(),
+        ])
+
+    tx = 0
+    for member_id in member_ids:
+        for _ in range(history_per_member):
+            tx += 1
+            stamp = f"{(today - timedelta(days=rng.randrange(0, 365))).isoformat()} 10:00:00"
+            kind = tx % 3
+            if kind == 0:
+                sheets["PaymentHistory"].append([f"T-{tx}", stamp, member_id, f"L-{1_600_000_000 + rng.randrange(loans)}",
+                                                 rng.randrange(1, 20) * 100, rng.randrange(0, 5) * 100])
+            elif kind == 1:
+                sheets["SavingsHistory"].append([f"D-{tx}", stamp, member_id, rng.randrange(1, 10) * 100])
+            else:
+                sheets["ShareHistory"].append([f"S-{tx}", stamp, member_id, 2, 100, "Purchase"])
+
+    return sheets
@@ -0,0 +1,194 @@
+# gsheet_client.py
+# HTTP Client ของ gspread ที่รู้จักโควตาของ Google Sheets API
+# - Token Bucket: คุมจำนวนคำขอต่อนาทีไม่ให้เกินโควตา (รอคิวแทนการโดนปฏิเสธ)
+# - Exponential Backoff: ลองใหม่อัตโนมัติเมื่อเจอ 429 / 5xx
+# - Coalescing: คำขออ่าน (GET) ที่เหมือนกันและยิงพร้อมกันจากหลาย Session ใช้ผลลัพธ์ร่วมกัน
+# - Metrics: นับจำนวนคำขอ, การลองใหม่, เวลาที่ใช้ และจำนวนไบต์ที่รับมา
+import json as jsonlib
+import random
+import threading
+import time
+from http import HTTPStatus
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+import perf_utils
+
+# --- ค่าคงที่ ---
+# โควตามาตรฐานของ Sheets API คือ 60 คำขอ/นาที/ผู้ใช้ (แยกอ่านกับเขียน)
+READ_REQUESTS_PER_MINUTE = 60
+WRITE_REQUESTS_PER_MINUTE = 60
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0   # (วินาที)
+BACKOFF_MAX = 64.0   # (วินาที)
+
+_RETRYABLE_CODES = {
+    HTTPStatus.REQUEST_TIMEOUT,
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+# คำสั่งที่เพิ่มแถวใหม่ ถ้าส่งซ้ำหลังเซิร์ฟเวอร์ตอบ 5xx อาจได้ข้อมูลซ้ำ (เช่น ชำระเงินซ้ำ)
+_NON_IDEMPOTENT_MARKERS = (":append", "appendCells", "insertDimension", "deleteDimension", "duplicateSheet")
+
+
+class TokenBucket:
+    """ถังโทเคน: เติม rate_per_minute โทเคนต่อนาที จุได้สูงสุด capacity (ยิงรวดได้เท่านี้)"""
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """รอจนได้โทเคน 1 อัน คืนค่าเวลาที่ต้องรอ (วินาที)"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ClientMetrics:
+    """ตัวนับสถิติของคำขอทั้งหมด (ใช้ร่วมกันทั้ง process)"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {
+                "calls": 0, "reads": 0, "writes": 0, "retries": 0, "errors": 0,
+                "coalesced": 0, "throttle_wait_s": 0.0, "latency_total_s": 0.0,
+                "latency_max_s": 0.0, "bytes_received": 0,
+            }
+
+    def add(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                if key == "latency_max_s":
+                    self.counters[key] = max(self.counters[key], value)
+                else:
+                    self.counters[key] += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            data = dict(self.counters)
+        data["latency_avg_s"] = data["latency_total_s"] / data["calls"] if data["calls"] else 0.0
+        return data
+
+
+_metrics = ClientMetrics()
+_read_bucket = TokenBucket(READ_REQUESTS_PER_MINUTE)
+_write_bucket = TokenBucket(WRITE_REQUESTS_PER_MINUTE)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def get_metrics() -> dict:
+    return _metrics.snapshot()
+
+def reset_metrics():
+    _metrics.reset()
+
+def _is_idempotent(method: str, endpoint: str, json) -> bool:
+    if method.lower() == "get":
+        return True
+    payload = endpoint + (jsonlib.dumps(json) if json is not None else "")
+    return not any(marker in payload for marker in _NON_IDEMPOTENT_MARKERS)
+
+def _backoff_delay(attempt: int, response=None) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    # Full jitter: สุ่มในช่วง 0..(base * 2^attempt) กันทุก Session ยิงพร้อมกันอีกรอบ
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class _InflightRequest:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class QuotaAwareHTTPClient(HTTPClient):
+    """ใช้แทน HTTPClient เดิมของ gspread: gspread.service_account_from_dict(..., http_client=QuotaAwareHTTPClient)"""
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        is_read = method.lower() == "get" and data is None and files is None
+        if not is_read:
+            return self._request_with_retry(method, endpoint, params, data, json, files, headers)
+
+        # รวมคำขออ่านที่เหมือนกันซึ่งกำลังรอผลอยู่ ให้เหลือยิงจริงครั้งเดียว
+        key = (endpoint, jsonlib.dumps(params, sort_keys=True, default=str))
+        with _inflight_lock:
+            pending = _inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = _inflight[key] = _InflightRequest()
+        if not owner:
+            _metrics.add(coalesced=1)
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.response
+
+        try:
+            pending.response = self._request_with_retry(method, endpoint, params, data, json, files, headers)
+            return pending.response
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            pending.done.set()
+
+    def _request_with_retry(self, method, endpoint, params, data, json, files, headers):
+        is_read = method.lower() == "get"
+        bucket = _read_bucket if is_read else _write_bucket
+        idempotent = _is_idempotent(method, endpoint, json)
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            started = time.monotonic()
+            try:
+                response = super().request(method, endpoint, params=params, data=data,
+                                           json=json, files=files, headers=headers)
+                elapsed = time.monotonic() - started
+                _metrics.add(calls=1, reads=int(is_read), writes=int(not is_read), throttle_wait_s=waited,
+                             latency_total_s=elapsed, latency_max_s=elapsed,
+                             bytes_received=len(response.content or b""))
+                perf_utils.record_api_call(len(response.content or b""), json if json is not None else data)
+                return response
+            except APIError as err:
+                elapsed = time.monotonic() - started
+                _metrics.add(calls=1, reads=int(is_read), writes=int(not is_read), throttle_wait_s=waited,
+                             latency_total_s=elapsed, latency_max_s=elapsed)
+                # 429 แปลว่าเซิร์ฟเวอร์ยังไม่ได้ทำคำขอนี้ จึงลองใหม่ได้เสมอ
+                # ส่วน 5xx ของคำสั่งเพิ่มแถว อาจถูกบันทึกไปแล้ว จึงไม่ลองซ้ำ
+                retryable = err.code in _RETRYABLE_CODES and (idempotent or err.code == HTTPStatus.TOO_MANY_REQUESTS)
+                if not retryable or attempt >= MAX_RETRIES:
+                    _metrics.add(errors=1)
+                    raise
+                time.sleep(_backoff_delay(attempt, err.response))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                _metrics.add(calls=1, latency_total_s=time.monotonic() - started)
+                if not idempotent or attempt >= MAX_RETRIES:
+                    _metrics.add(errors=1)
+                    raise
+                time.sleep(_backoff_delay(attempt))
+            attempt += 1
+            _metrics.add(retries=1)
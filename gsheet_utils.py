@@ -1,22 +1,59 @@
 # gsheet_utils.py
+import contextvars
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from collections.abc import Hashable
+from datetime import datetime
 import gspread
 import pandas as pd
 import streamlit as st
 from gspread.exceptions import WorksheetNotFound, SpreadsheetNotFound
+from gspread.utils import a1_to_rowcol
+from pytz import timezone
+import gsheet_client
+import perf_utils
+import replica_utils
+import schema_utils
 
 # --- ค่าคงที่ ---
 SHEET_NAME = "MyLoanAppDB"
 
 # --- ฟังก์ชัน Helper ---
 def safe_float(value):
+    if isinstance(value, str):
+        value = value.replace(",", "").strip()  # ค่าจาก Sheet อาจมีตัวคั่นหลักพัน เช่น "1,500"
     return float(value) if value not in [None, ''] else 0.0
 
+# --- รหัสอ้างอิง (ID) ---
+# เวลาเป็นไมโครวินาที + รหัสเครื่อง: ไม่ซ้ำกันแม้หลาย Session หรือหลายเซิร์ฟเวอร์สร้างพร้อมกัน และเรียงตามเวลา
+NODE_ID = os.environ.get("LOANAPP_NODE_ID") or secrets.token_hex(2)
+_id_lock = threading.Lock()
+_last_id_stamp = 0
+
+def new_id(prefix: str) -> str:
+    """เช่น new_id("T") -> "T-1760779200123456-a3f9" """
+    global _last_id_stamp
+    with _id_lock:
+        # ถ้าเรียกซ้ำในไมโครวินาทีเดียวกัน (หรือนาฬิกาถอยหลัง) ให้ขยับไป 1 เสมอ
+        _last_id_stamp = max(time.time_ns() // 1000, _last_id_stamp + 1)
+        stamp = _last_id_stamp
+    return f"{prefix}-{stamp}-{NODE_ID}"
+
 # --- การเชื่อมต่อ ---
+def open_spreadsheet(service_account_info: dict) -> gspread.Spreadsheet:
+    """เปิด Google Sheet หลัก (ใช้ได้ทั้งในหน้าเว็บและสคริปต์ที่รันนอก Streamlit)"""
+    # ทุกคำขอผ่าน QuotaAwareHTTPClient (คุมโควตา + ลองใหม่อัตโนมัติเมื่อเจอ 429/5xx)
+    gc = gspread.service_account_from_dict(service_account_info, http_client=gsheet_client.QuotaAwareHTTPClient)
+    return gc.open(SHEET_NAME)
+
 @st.cache_resource
 def connect_to_sheet():
     try:
-        gc = gspread.service_account_from_dict(st.secrets["gcp_service_account"])
-        sh = gc.open(SHEET_NAME)
+        sh = open_spreadsheet(st.secrets["gcp_service_account"])
+        _start_prefetch(sh)
         return sh
     except SpreadsheetNotFound:
         st.error(f"ไม่พบ Google Sheet ชื่อ: '{SHEET_NAME}' กรุณาตรวจสอบการตั้งค่า")
@@ -27,18 +64,363 @@ def connect_to_sheet():
 
 # --- ฟังก์ชันเคลียร์ Cache ---
 def clear_all_caches():
-    get_data_as_dataframe.clear()
-    get_address_suggestions.clear()
-    get_member_by_id.clear()
-    get_active_loans_by_member.clear()
+    _load_dataframe.clear()
+    _get_address_suggestions.clear()
+    _get_member_by_id.clear()
+    _get_active_loans_by_member.clear()
+    _get_loan_summary_by_member.clear()
+
+# --- เวอร์ชันข้อมูล (ล้าง Cache เฉพาะส่วนที่เกี่ยวข้อง) ---
+# ฟังก์ชันที่ cache ไว้จะรับเลขเวอร์ชันเป็นพารามิเตอร์ เมื่อเลขเปลี่ยน Cache เดิมก็ไม่ถูกใช้อีก
+# - ("Members",)          : เปลี่ยนทุกครั้งที่แท็บ Members ถูกเขียนหรือซิงก์ใหม่
+# - ("Members", "sync")   : เปลี่ยนเฉพาะตอนซิงก์ทั้งแท็บ (ข้อมูลทุกคนอาจเปลี่ยน)
+# - ("Members", member_id): เปลี่ยนเมื่อมีการเขียนข้อมูลของสมาชิกคนนั้น
+_data_versions = {}
+_version_lock = threading.Lock()
+
+# --- แหล่งข้อมูล: Google Sheet (ค่าเริ่มต้น) หรือ Snapshot ในเครื่อง (อ่านอย่างเดียว ดู snapshot_utils) ---
+# ตั้งค่าแยกตาม Thread ของแต่ละ Session ทุกหน้าต้องตั้งค่าเองทุกรอบ (Thread เดิมถูกใช้ซ้ำข้ามหน้า)
+# ระหว่างใช้ Snapshot เลขเวอร์ชันทุกตัวจะเป็น ("snapshot", โฟลเดอร์) Cache จึงไม่ปนกับข้อมูลจริง
+# เวอร์ชันจึงใช้ได้แค่เป็นคีย์ของ Cache / เทียบว่าเท่ากันหรือไม่ (นำไปลบกันได้เฉพาะผ่าน changes_since)
+_snapshot = contextvars.ContextVar("loanapp_snapshot", default=None)
+
+def use_snapshot(path: str = None):
+    """ให้การอ่านผ่าน get_data_as_dataframe ในรอบนี้มาจาก Snapshot (None = Google Sheet)"""
+    _snapshot.set(path)
+
+def active_snapshot():
+    return _snapshot.get()
+
+def data_version(worksheet_name: str) -> Hashable:
+    snapshot = _snapshot.get()
+    if snapshot is not None:
+        return ("snapshot", snapshot)
+    return _data_versions.get((worksheet_name,), 0)
+
+def sync_version(worksheet_name: str) -> Hashable:
+    """เปลี่ยนเฉพาะตอนซิงก์ทั้งแท็บ (ข้อมูลเดิมในสำเนาอาจถูกแก้)"""
+    snapshot = _snapshot.get()
+    if snapshot is not None:
+        return ("snapshot", snapshot)
+    return _data_versions.get((worksheet_name, "sync"), 0)
+
+def member_version(worksheet_name: str, member_id) -> tuple:
+    snapshot = _snapshot.get()
+    if snapshot is not None:
+        return ("snapshot", snapshot)
+    return (
+        sync_version(worksheet_name),
+        _data_versions.get((worksheet_name, str(member_id)), 0),
+    )
+
+# บันทึกว่าแต่ละเวอร์ชันเปลี่ยนข้อมูลของสมาชิกคนไหน ให้ตารางสรุปอัปเดตเฉพาะส่วนที่เปลี่ยนได้
+CHANGE_LOG_SIZE = 500
+_change_log = {}
+
+def invalidate(worksheet_name: str, member_ids=(), full_sync: bool = False):
+    """ประกาศว่าข้อมูลแท็บนี้เปลี่ยนแล้ว (ระบุ member_ids เพื่อล้างเฉพาะข้อมูลของสมาชิกนั้น)"""
+    with _version_lock:
+        ids = {str(m) for m in member_ids if m not in (None, "")}
+        keys = [(worksheet_name,)] + [(worksheet_name, m) for m in ids]
+        if full_sync:
+            keys.append((worksheet_name, "sync"))
+        for key in keys:
+            _data_versions[key] = _data_versions.get(key, 0) + 1
+        # ไม่ระบุสมาชิก หรือซิงก์ทั้งแท็บ = ข้อมูลใครเปลี่ยนก็ได้ (None)
+        log = _change_log.setdefault(worksheet_name, deque(maxlen=CHANGE_LOG_SIZE))
+        log.append((_data_versions[(worksheet_name,)], None if full_sync or not ids else ids))
+
+def changes_since(worksheet_name: str, version: Hashable):
+    """
+    MemberID ที่ถูกเขียนหลังเวอร์ชัน version (set ว่าง = ไม่มีอะไรเปลี่ยน)
+    คืนค่า None ถ้าบอกไม่ได้ (ซิงก์ทั้งแท็บ, ประวัติเก่าเกินที่เก็บไว้ หรือ version มาจาก Snapshot) ต้องคำนวณใหม่ทั้งหมด
+    """
+    if not isinstance(version, int) or _snapshot.get() is not None:
+        return None
+    with _version_lock:
+        current = _data_versions.get((worksheet_name,), 0)
+        entries = [ids for v, ids in _change_log.get(worksheet_name, ()) if v > version]
+    if len(entries) != current - version or any(ids is None for ids in entries):
+        return None
+    return set().union(*entries)
+
+def _member_of_row(worksheet_name: str, data_list: list):
+    header = replica_utils.get_header(worksheet_name) or []
+    return data_list[header.index("MemberID")] if "MemberID" in header[:len(data_list)] else None
+
+def _members_of(worksheet_name: str, id_column: str, item_id) -> list:
+    # หา MemberID ของแถวที่กำลังจะเขียน เพื่อล้าง Cache เฉพาะสมาชิกคนนั้น
+    if id_column == "MemberID":
+        return [item_id]
+    return replica_utils.lookup(worksheet_name, id_column, item_id, "MemberID")
+
+@perf_utils.instrument
+def reload_from_sheet():
+    """ให้การอ่านครั้งถัดไปดึงข้อมูลล่าสุดจาก Google Sheet มาทับสำเนาในเครื่อง"""
+    replica_utils.mark_stale()
+    clear_all_caches()
+
+# --- สำเนาข้อมูลในเครื่อง (SQLite Replica) ---
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+@perf_utils.instrument
+def _sync_sheet(worksheet_name: str, _sh: gspread.Spreadsheet):
+    """ดึงทั้งแท็บจาก Google Sheet มาแทนที่สำเนาในเครื่อง"""
+    if worksheet_name in replica_utils.APPEND_ONLY_SHEETS and _sync_tail(worksheet_name, _sh):
+        return
+    _replace_from_values(worksheet_name, get_worksheet(worksheet_name, _sh).get_all_values())
+
+def _replace_from_values(worksheet_name: str, values: list):
+    import journal_utils  # import ตรงนี้ เพราะ journal_utils เรียกใช้โมดูลนี้
+    header = values[0] if values else []
+    # รายการในคิวที่ยังไม่ได้ส่งไม่มีอยู่ในข้อมูลจาก Sheet: ให้ journal_utils เขียนลงสำเนาซ้ำหลังแทนที่
+    with journal_utils.preserve_pending(worksheet_name):
+        replica_utils.replace_sheet(worksheet_name, header, values[1:])
+        _drop_row_indexes(worksheet_name)
+    invalidate(worksheet_name, full_sync=True)
+
+def _tail_range(worksheet_name: str):
+    """ช่วงที่ต้องอ่านเพื่อซิงก์แบบต่อท้าย (เริ่มที่แถวสุดท้ายที่รู้จัก) หรือ None ถ้ายังไม่มีสำเนา"""
+    known_row, _ = replica_utils.last_row(worksheet_name)
+    header = replica_utils.get_header(worksheet_name)
+    if known_row is None or not header:
+        return None
+    last_col = gspread.utils.rowcol_to_a1(1, len(header)).rstrip("1")
+    return f"A{known_row}:{last_col}"
+
+def _apply_tail(worksheet_name: str, tail: list) -> bool:
+    """
+    ต่อท้ายแถวใหม่จากช่วงที่อ่านมา (แถวแรกของ tail คือแถวสุดท้ายที่สำเนารู้จัก)
+    ถ้าแถวนั้นไม่ตรงกับสำเนา (มีคนแก้/ลบใน Sheet) คืนค่า False เพื่อให้ซิงก์ทั้งแท็บแทน
+    """
+    known_row, known_values = replica_utils.last_row(worksheet_name)
+    header = replica_utils.get_header(worksheet_name)
+    if not tail or known_row is None:
+        return False
+    first = [str(v) for v in ([gspread.utils.numericise(v) for v in tail[0]] + [""] * len(header))[:len(header)]]
+    if first != [str(v) for v in known_values]:
+        return False
+
+    new_rows = tail[1:]
+    replica_utils.append_rows(worksheet_name, new_rows, known_row + 1)
+    if new_rows:
+        _drop_row_indexes(worksheet_name)
+        invalidate(worksheet_name, [_member_of_row(worksheet_name, row) for row in new_rows])
+    return True
+
+def _sync_tail(worksheet_name: str, _sh: gspread.Spreadsheet) -> bool:
+    """ซิงก์แท็บประวัติแบบต่อท้าย: อ่านเฉพาะแถวสุดท้ายที่รู้จักลงไป (คำขอเดียว)"""
+    tail_range = _tail_range(worksheet_name)
+    if tail_range is None:
+        return False
+    return _apply_tail(worksheet_name, get_worksheet(worksheet_name, _sh).get_values(tail_range))
+
+# --- โหลดล่วงหน้าทุกแท็บในคำขอเดียว (Prefetch) ---
+PREFETCH_IN_BACKGROUND = True
+_prefetch_thread = None
+_background_errors = {}  # {"prefetch" หรือชื่อแท็บ: (เวลา, ข้อความ)} งานเบื้องหลังที่ล้มเหลวรอบล่าสุด
+
+def get_background_errors() -> dict:
+    """ข้อผิดพลาดของการโหลดล่วงหน้า/ซิงก์เบื้องหลังที่ยังไม่หาย (แสดงในแผง Debug ของ perf_utils)"""
+    return dict(_background_errors)
+
+@perf_utils.instrument
+def prefetch_all_sheets(_sh: gspread.Spreadsheet, worksheet_names: list = None, force: bool = False) -> list:
+    """
+    ดึงทุกแท็บที่ยังไม่มีหรือหมดอายุในสำเนา ด้วย values_batch_get ครั้งเดียว
+    (แท็บประวัติที่มีสำเนาแล้วจะอ่านเฉพาะส่วนท้าย) คืนค่ารายชื่อแท็บที่ถูกโหลด
+    """
+    names = [
+        name for name in (worksheet_names or replica_utils.MIRRORED_SHEETS)
+        if force or not replica_utils.is_fresh(name)
+    ]
+    if not names:
+        return []
+    ranges, tails = [], set()
+    for name in names:
+        tail_range = _tail_range(name) if name in replica_utils.APPEND_ONLY_SHEETS else None
+        if tail_range:
+            tails.add(name)
+        ranges.append(gspread.utils.absolute_range_name(name, tail_range))
+
+    response = _sh.values_batch_get(ranges)
+    for name, value_range in zip(names, response.get("valueRanges", [])):
+        values = value_range.get("values", [])
+        if name in tails:
+            if not _apply_tail(name, values):
+                _sync_sheet(name, _sh)
+        else:
+            _replace_from_values(name, values)
+    return names
+
+def _start_prefetch(_sh: gspread.Spreadsheet):
+    global _prefetch_thread
+
+    def run():
+        try:
+            prefetch_all_sheets(_sh)
+            _background_errors.pop("prefetch", None)
+        except Exception as e:
+            # เช่น มีแท็บที่ยังไม่ได้สร้าง -> ปล่อยให้แต่ละแท็บโหลดเองตามปกติ
+            _background_errors["prefetch"] = (datetime.now(timezone("Asia/Bangkok")), f"{type(e).__name__}: {e}")
+
+    if PREFETCH_IN_BACKGROUND:
+        _prefetch_thread = threading.Thread(target=run, daemon=True)
+        _prefetch_thread.start()
+    else:
+        run()
+
+def _refresh_in_background(worksheet_name: str, _sh: gspread.Spreadsheet):
+    # ถ้าสำเนามีข้อมูลอยู่แล้ว ให้หน้าเว็บใช้ของเดิมไปก่อน แล้วซิงก์ใหม่เบื้องหลัง
+    with _refresh_lock:
+        if worksheet_name in _refreshing:
+            return
+        _refreshing.add(worksheet_name)
+
+    def run():
+        try:
+            _sync_sheet(worksheet_name, _sh)
+            _background_errors.pop(worksheet_name, None)
+        except Exception as e:
+            # ใช้สำเนาเดิมต่อไป แล้วลองใหม่ตอนอ่านครั้งถัดไป
+            _background_errors[worksheet_name] = (datetime.now(timezone("Asia/Bangkok")), f"{type(e).__name__}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(worksheet_name)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def ensure_replica(worksheet_name: str, _sh: gspread.Spreadsheet):
+    """ให้สำเนาของแท็บนี้พร้อมอ่าน (ยังไม่มี = ซิงก์เลย, หมดอายุ = ซิงก์เบื้องหลัง)"""
+    if not replica_utils.has_sheet(worksheet_name) and _prefetch_thread is not None:
+        # ถ้ากำลังโหลดล่วงหน้าอยู่ ให้รอผลจากคำขอนั้นแทนการยิงคำขอซ้ำ
+        _prefetch_thread.join(timeout=30)
+    if not replica_utils.has_sheet(worksheet_name):
+        _sync_sheet(worksheet_name, _sh)
+    elif not replica_utils.is_fresh(worksheet_name):
+        _refresh_in_background(worksheet_name, _sh)
+
+def _read_replica(worksheet_name: str, _sh: gspread.Spreadsheet) -> pd.DataFrame:
+    ensure_replica(worksheet_name, _sh)
+    return replica_utils.load_sheet(worksheet_name)
+
+# --- ดัชนีแถว (ID -> เลขแถวใน Sheet) ---
+# สร้างจากสำเนาที่โหลดไว้แล้ว เพื่อเขียนลงแถวเป้าหมายได้ทันทีโดยไม่ต้อง find/findall
+# - append: เพิ่มแถวใหม่เข้าไปในดัชนี
+# - delete / ซิงก์ใหม่: ทิ้งดัชนีของแท็บนั้น แล้วสร้างใหม่ตอนใช้ครั้งถัดไป
+_row_indexes = {}
+_index_lock = threading.Lock()
+
+@perf_utils.instrument(cached=True)
+@st.cache_resource
+@perf_utils.cache_miss
+def get_worksheet(worksheet_name: str, _sh: gspread.Spreadsheet):
+    # _sh.worksheet() เรียก API ทุกครั้ง จึงเก็บ Worksheet object ไว้ใช้ซ้ำ
+    return _sh.worksheet(worksheet_name)
+
+def get_header(worksheet_name: str, _sh: gspread.Spreadsheet) -> list:
+    """หัวตาราง (แถวที่ 1) จากสำเนา แทนการเรียก row_values(1) ทุกครั้ง"""
+    header = replica_utils.get_header(worksheet_name)
+    if header is None:
+        _sync_sheet(worksheet_name, _sh)
+        header = replica_utils.get_header(worksheet_name)
+    return header
+
+def get_row_index(worksheet_name: str, id_column: str, _sh: gspread.Spreadsheet) -> dict:
+    """คืนค่า dict ของ ID -> [เลขแถว, ...] (เรียงจากบนลงล่าง)"""
+    key = (worksheet_name, id_column)
+    with _index_lock:
+        index = _row_indexes.get(key)
+    if index is None:
+        df = _read_replica(worksheet_name, _sh)
+        index = {}
+        if id_column in df.columns:
+            for row, item_id in zip(df.index, df[id_column].astype(str)):
+                index.setdefault(item_id, []).append(int(row))
+        with _index_lock:
+            _row_indexes[key] = index
+    return index
+
+def find_rows(worksheet_name: str, id_column: str, item_id, _sh: gspread.Spreadsheet) -> list:
+    """เลขแถวทั้งหมดที่ ID ตรงกัน (ไม่พบจะ raise KeyError)"""
+    rows = get_row_index(worksheet_name, id_column, _sh).get(str(item_id))
+    if not rows:
+        raise KeyError(item_id)
+    return rows
+
+def _rows_hold_ids(worksheet_name: str, id_column: str, expected: dict, _sh: gspread.Spreadsheet) -> bool:
+    """
+    อ่านคอลัมน์ ID ของแถวเป้าหมายจาก Sheet (คำขอเดียว) แล้วเทียบกับ expected {เลขแถว: ID}
+    ดัชนีแถวมาจากสำเนาที่อาจเก่าได้ถึง REPLICA_MAX_AGE ถ้ามีคนแทรก/ลบแถวใน Sheet เลขแถวจะเลื่อน
+    """
+    if not expected:
+        return True
+    letter = gspread.utils.rowcol_to_a1(1, get_header(worksheet_name, _sh).index(id_column) + 1).rstrip("1")
+    first, last = min(expected), max(expected)
+    response = _sh.values_batch_get([gspread.utils.absolute_range_name(worksheet_name, f"{letter}{first}:{letter}{last}")])
+    values = (response.get("valueRanges") or [{}])[0].get("values", [])
+    for row, item_id in expected.items():
+        cell = values[row - first] if row - first < len(values) else []
+        if not cell or str(cell[0]).strip() != str(item_id):
+            return False
+    return True
+
+def find_verified_rows(worksheet_name: str, id_column: str, item_id, _sh: gspread.Spreadsheet) -> list:
+    """
+    find_rows ที่ตรวจกับ Sheet แล้วก่อนเขียน/ลบ ถ้าแถวเลื่อนไป ซิงก์แท็บใหม่แล้วหาอีกครั้ง (ครั้งเดียว)
+    ไม่พบ ID = KeyError, ยังไม่ตรงหลังซิงก์ = WriteConflict
+    """
+    rows = find_rows(worksheet_name, id_column, item_id, _sh)
+    if _rows_hold_ids(worksheet_name, id_column, dict.fromkeys(rows, item_id), _sh):
+        return rows
+    _sync_sheet(worksheet_name, _sh)
+    rows = find_rows(worksheet_name, id_column, item_id, _sh)
+    if not _rows_hold_ids(worksheet_name, id_column, dict.fromkeys(rows, item_id), _sh):
+        raise WriteConflict(f"{worksheet_name} {item_id}")
+    return rows
+
+def _index_appended_row(worksheet_name: str, data_list: list, row_number):
+    header = replica_utils.get_header(worksheet_name) or []
+    with _index_lock:
+        for (name, id_column), index in list(_row_indexes.items()):
+            if name != worksheet_name:
+                continue
+            if row_number is None or id_column not in header:
+                del _row_indexes[(name, id_column)]
+                continue
+            position = header.index(id_column)
+            if position < len(data_list):
+                index.setdefault(str(data_list[position]), []).append(row_number)
+
+def _drop_row_indexes(worksheet_name: str):
+    with _index_lock:
+        for key in [k for k in _row_indexes if k[0] == worksheet_name]:
+            del _row_indexes[key]
+
+def _appended_row_number(response):
+    # append_row ตอบกลับช่วงที่เขียนจริง เช่น "Members!A12:L12" -> 12
+    try:
+        updated_range = response["updates"]["updatedRange"]
+        return a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+    except (KeyError, TypeError, IndexError, AttributeError):
+        return None
 
 # --- ฟังก์ชันดึงข้อมูล ---
-@st.cache_data(ttl=60)
+@perf_utils.instrument(cached=True)
 def get_data_as_dataframe(worksheet_name: str, _sh: gspread.Spreadsheet):
+    return _load_dataframe(worksheet_name, _sh, data_version(worksheet_name))
+
+@st.cache_data(ttl=60)
+@perf_utils.cache_miss
+def _load_dataframe(worksheet_name: str, _sh: gspread.Spreadsheet, version: Hashable):
     try:
-        worksheet = _sh.worksheet(worksheet_name)
-        data = worksheet.get_all_records()
-        return pd.DataFrame(data)
+        if isinstance(version, tuple) and version[0] == "snapshot":
+            import snapshot_utils  # import ตรงนี้ เพราะ snapshot_utils เรียกใช้โมดูลนี้
+            return snapshot_utils.load_table(version[1], worksheet_name)
+        # แปลงชนิดข้อมูลตาม Schema ครั้งเดียวตอนโหลด (ทุกหน้าใช้ต่อได้ทันที)
+        df = _read_replica(worksheet_name, _sh).reset_index(drop=True)
+        return schema_utils.apply_schema(worksheet_name, df)
     except WorksheetNotFound:
         st.error(f"ไม่พบแท็บ (Worksheet) ชื่อ: '{worksheet_name}'")
         return pd.DataFrame()
@@ -46,8 +428,13 @@ def get_data_as_dataframe(worksheet_name: str, _sh: gspread.Spreadsheet):
         st.error(f"เกิดข้อผิดพลาดในการดึงข้อมูล ({worksheet_name}): {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
+@perf_utils.instrument(cached=True)
 def get_address_suggestions(_sh: gspread.Spreadsheet):
+    return _get_address_suggestions(_sh, data_version("Members"))
+
+@st.cache_data(ttl=60)
+@perf_utils.cache_miss
+def _get_address_suggestions(_sh: gspread.Spreadsheet, version: Hashable):
     df = get_data_as_dataframe("Members", _sh)
     if df.empty: return {k: [] for k in ["villages", "sub_districts", "districts", "provinces"]}
     return {
@@ -57,22 +444,31 @@ def get_address_suggestions(_sh: gspread.Spreadsheet):
         "provinces": sorted(df["Province"].dropna().unique().tolist())
     }
 
-@st.cache_data(ttl=5)
+@perf_utils.instrument(cached=True)
 def get_member_by_id(_sh: gspread.Spreadsheet, member_id: str):
+    return _get_member_by_id(_sh, member_id, member_version("Members", member_id))
+
+@st.cache_data(ttl=5)
+@perf_utils.cache_miss
+def _get_member_by_id(_sh: gspread.Spreadsheet, member_id: str, version: tuple):
     df = get_data_as_dataframe("Members", _sh)
     if not df.empty:
         member_data = df[df['MemberID'] == member_id]
         if not member_data.empty:
-            return member_data.to_dict('records')[0]
+            record = member_data.to_dict('records')[0]
+            # วันที่ว่าง (NaT) คืนเป็น None ให้หน้าเว็บเช็คได้ง่าย
+            return {k: (None if v is pd.NaT else v) for k, v in record.items()}
     return None
 
-@st.cache_data(ttl=30)
+@perf_utils.instrument(cached=True)
 def get_active_loans_by_member(_sh: gspread.Spreadsheet, member_id: str):
+    return _get_active_loans_by_member(_sh, member_id, member_version("Loans", member_id))
+
+@st.cache_data(ttl=30)
+@perf_utils.cache_miss
+def _get_active_loans_by_member(_sh: gspread.Spreadsheet, member_id: str, version: tuple):
     df = get_data_as_dataframe("Loans", _sh)
     if not df.empty:
-        df['PrincipalAmount'] = pd.to_numeric(df['PrincipalAmount'], errors='coerce').fillna(0)
-        df['AmountPaid'] = pd.to_numeric(df['AmountPaid'], errors='coerce').fillna(0)
-        
         member_loans = df[
             (df['MemberID'] == member_id) &
             (df['Status'].isin(['ยังค้างชำระ', 'เกินกำหนดชำระ', 'Active'])) # <-- เพิ่ม Active (กันพลาด)
@@ -86,26 +482,73 @@ def get_active_loans_by_member(_sh: gspread.Spreadsheet, member_id: str):
     return pd.DataFrame()
 
 
+LOAN_SUMMARY_COLUMNS = ["LoanID", "LoanAccount", "IssueDate", "DueDate", "PrincipalAmount", "AmountPaid", "InterestPaid", "Remaining"]
+
+@perf_utils.instrument(cached=True)
+def get_loan_summary_by_member(_sh: gspread.Spreadsheet, member_id: str):
+    return _get_loan_summary_by_member(_sh, member_id, member_version("Loans", member_id))
+
+@st.cache_data(ttl=30)
+@perf_utils.cache_miss
+def _get_loan_summary_by_member(_sh: gspread.Spreadsheet, member_id: str, version: tuple):
+    """
+    สรุปยอดของแต่ละสัญญาที่ยังค้างชำระ (1 แถวต่อ LoanID) ด้วย groupby ครั้งเดียว
+    ใช้ร่วมกันทั้งตัวเลือกสัญญา, ช่องแสดงยอด และยอดคงเหลือในใบเสร็จ
+    """
+    loans = get_active_loans_by_member(_sh, member_id)
+    if loans.empty:
+        return pd.DataFrame(columns=LOAN_SUMMARY_COLUMNS)
+    summary = loans.groupby("LoanID", sort=False, observed=True).agg(
+        LoanAccount=("LoanAccount", "first"),
+        IssueDate=("IssueDate", "first"),
+        DueDate=("DueDate", "first"),
+        PrincipalAmount=("PrincipalAmount", "sum"),
+        AmountPaid=("AmountPaid", "sum"),
+        InterestPaid=("InterestPaid", "sum"),
+    ).reset_index()
+    summary["Remaining"] = summary["PrincipalAmount"] - summary["AmountPaid"]
+    return summary[LOAN_SUMMARY_COLUMNS]
+
+
 # --- ฟังก์ชันแก้ไข/เพิ่ม/ลบ ข้อมูล ---
+def _wait_for_journal(_sh: gspread.Spreadsheet, error_callback=None) -> bool:
+    """
+    การเขียนแบบรอผลต้องต่อท้ายรายการที่ยังค้างในคิว (journal_utils) ไม่อย่างนั้นลำดับการเขียนจะสลับกัน
+    คืนค่า False (และแจ้งผู้ใช้ หรือส่งข้อความให้ error_callback) ถ้าคิวยังส่งไม่หมดในเวลาที่รอ ผู้เรียกต้องไม่เขียนต่อ
+    """
+    import journal_utils  # import ตรงนี้ เพราะ journal_utils เรียกใช้โมดูลนี้
+    if journal_utils.drain(_sh):
+        return True
+    (error_callback or st.error)("ยังมีรายการในคิวที่ส่งขึ้น Google Sheet ไม่หมด จึงยังไม่บันทึกรายการนี้ (กันลำดับการเขียนสลับกัน) "
+             "กรุณาตรวจสถานะคิวใน Sidebar แล้วลองใหม่")
+    return False
+
+@perf_utils.instrument
 def add_row_to_sheet(worksheet_name: str, _sh: gspread.Spreadsheet, data_list: list):
+    if not _wait_for_journal(_sh):
+        return False
     try:
-        worksheet = _sh.worksheet(worksheet_name)
-        worksheet.append_row(data_list)
-        clear_all_caches()
+        worksheet = get_worksheet(worksheet_name, _sh)
+        response = worksheet.append_row(data_list)
+        row_number = _appended_row_number(response)
+        replica_utils.append_row(worksheet_name, data_list, row_number)
+        _index_appended_row(worksheet_name, data_list, row_number)
+        invalidate(worksheet_name, [_member_of_row(worksheet_name, data_list)])
         return True
     except Exception as e:
         st.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล ({worksheet_name}): {e}")
         return False
 
+@perf_utils.instrument
 def update_member_data(worksheet_name: str, _sh: gspread.Spreadsheet, item_id: str, id_column: str, updates_dict: dict):
+    if not _wait_for_journal(_sh):
+        return False
     try:
-        worksheet = _sh.worksheet(worksheet_name)
-        id_col_index = worksheet.find(id_column, in_column=1).col
-        cell = worksheet.find(item_id, in_column=id_col_index)
-        row_to_update = cell.row
+        worksheet = get_worksheet(worksheet_name, _sh)
+        row_to_update = find_verified_rows(worksheet_name, id_column, item_id, _sh)[0]
         
         cells_to_update = []
-        header_row = worksheet.row_values(1)
+        header_row = get_header(worksheet_name, _sh)
         
         for column_name, new_value in updates_dict.items():
             try:
@@ -116,25 +559,37 @@ def update_member_data(worksheet_name: str, _sh: gspread.Spreadsheet, item_id: s
         
         if cells_to_update:
             worksheet.update_cells(cells_to_update)
+            replica_utils.update_by_id(worksheet_name, id_column, item_id, updates_dict)
             
-        clear_all_caches()
+        invalidate(worksheet_name, _members_of(worksheet_name, id_column, item_id))
         return True
-    except (gspread.CellNotFound, AttributeError):
+    except WriteConflict as e:
+        st.warning(f"แถวของ {e} ใน Google Sheet ถูกแทรก/ลบระหว่างนี้ ยังไม่ได้บันทึก กรุณาลองใหม่")
+        return False
+    except KeyError:
         st.error(f"ไม่พบ ID '{item_id}' ที่จะอัปเดตใน '{worksheet_name}'")
         return False
     except Exception as e:
         st.error(f"เกิดข้อผิดพลาดในการอัปเดตข้อมูล ({worksheet_name}): {e}")
         return False
 
+@perf_utils.instrument
 def delete_row_by_id(worksheet_name: str, _sh: gspread.Spreadsheet, item_id: str, id_column: str):
+    if not _wait_for_journal(_sh):
+        return False
     try:
-        worksheet = _sh.worksheet(worksheet_name)
-        id_col_index = worksheet.find(id_column, in_column=1).col
-        cell = worksheet.find(item_id, in_column=id_col_index)
-        worksheet.delete_rows(cell.row)
-        clear_all_caches()
+        worksheet = get_worksheet(worksheet_name, _sh)
+        row_to_delete = find_verified_rows(worksheet_name, id_column, item_id, _sh)[0]
+        member_ids = _members_of(worksheet_name, id_column, item_id)
+        worksheet.delete_rows(row_to_delete)
+        replica_utils.delete_by_id(worksheet_name, id_column, item_id)
+        _drop_row_indexes(worksheet_name)
+        invalidate(worksheet_name, member_ids)
         return True
-    except (gspread.CellNotFound, AttributeError):
+    except WriteConflict as e:
+        st.warning(f"แถวของ {e} ใน Google Sheet ถูกแทรก/ลบระหว่างนี้ ยังไม่ได้ลบ กรุณาลองใหม่")
+        return False
+    except KeyError:
         st.error(f"ไม่พบ ID '{item_id}' ที่จะลบใน '{worksheet_name}'")
         return False
     except Exception as e:
@@ -145,70 +600,35 @@ def delete_row_by_id(worksheet_name: str, _sh: gspread.Spreadsheet, item_id: str
 def add_loan_contract(_sh: gspread.Spreadsheet, loan_data_list: list):
     return add_row_to_sheet("Loans", _sh, loan_data_list)
 
+@perf_utils.instrument
 def update_loan_payment(_sh: gspread.Spreadsheet, loan_id: str, principal_paid_increment: float, interest_paid_increment: float):
-    try:
-        worksheet = _sh.worksheet("Loans")
-        header_row = worksheet.row_values(1)
-        loan_id_col = header_row.index("LoanID") + 1
-        cells = worksheet.findall(loan_id, in_column=loan_id_col)
-        if not cells: raise gspread.CellNotFound
-        
-        row_index = cells[0].row 
-        amount_paid_col = header_row.index("AmountPaid") + 1
-        interest_paid_col = header_row.index("InterestPaid") + 1
-        current_amount_paid = safe_float(worksheet.cell(row_index, amount_paid_col).value)
-        current_interest_paid = safe_float(worksheet.cell(row_index, interest_paid_col).value)
-        new_amount_paid = current_amount_paid + principal_paid_increment
-        new_interest_paid = current_interest_paid + interest_paid_increment
-        cells_to_update = [
-            gspread.Cell(row_index, amount_paid_col, new_amount_paid),
-            gspread.Cell(row_index, interest_paid_col, new_interest_paid)
-        ]
-        worksheet.update_cells(cells_to_update)
-        clear_all_caches()
-        return True
-    except (gspread.CellNotFound, AttributeError):
-        st.error(f"ไม่พบ LoanID '{loan_id}' ที่จะอัปเดตการชำระเงิน")
-        return False
-    except ValueError:
-         st.error(f"ไม่พบคอลัมน์ที่จำเป็น ('LoanID', 'AmountPaid', 'InterestPaid') ในแท็บ Loans")
-         return False
-    except Exception as e:
-        st.error(f"เกิดข้อผิดพลาดในการอัปเดตการชำระเงินกู้: {e}")
-        return False
-            
+    """บวกยอดชำระเพิ่มจากยอดล่าสุดใน Sheet (ไม่ทับยอดที่ Session อื่นเพิ่งบันทึก)"""
+    return SheetTransaction(_sh).increment("Loans", "LoanID", loan_id, {
+        "AmountPaid": principal_paid_increment, "InterestPaid": interest_paid_increment
+    }).commit()
+
+@perf_utils.instrument
 def update_loan_status(_sh: gspread.Spreadsheet, loan_id: str, new_status: str):
     """
     อัปเดต Status ของสัญญาที่ระบุ (อัปเดตทุกแถวที่ตรงกัน)
-    *** นี่คือเวอร์ชันแก้ไขที่ "ดุ" ขึ้น ***
     """
+    if not _wait_for_journal(_sh):
+        return False
     try:
-        # 1. เพิ่มข้อความดีบัก
-        st.write(f"--- ⚙️ gsheet_utils: กำลังอัปเดต ID: {loan_id} เป็น '{new_status}' ---")
-        
-        worksheet = _sh.worksheet("Loans")
-        header_row = worksheet.row_values(1)
-            
-        loan_id_col = header_row.index("LoanID") + 1
+        worksheet = get_worksheet("Loans", _sh)
+        header_row = get_header("Loans", _sh)
         status_col = header_row.index("Status") + 1
-            
-        cells_to_update = worksheet.findall(loan_id, in_column=loan_id_col)
-        if not cells_to_update:
-             st.warning(f"ไม่พบ LoanID '{loan_id}' ในคอลัมน์ {loan_id_col}")
-             raise gspread.CellNotFound
-        
-        st.write(f"พบ {len(cells_to_update)} แถวที่ตรงกันสำหรับ {loan_id}...")
-        
-        # 2. แก้ไข: เปลี่ยนจาก batch เป็น single update ทีละเซลล์
-        for cell in cells_to_update:
-            worksheet.update_cell(cell.row, status_col, new_status)
-            st.write(f"อัปเดตแถว {cell.row} สำเร็จ")
-        # 3. สิ้นสุดการแก้ไข
-
-        clear_all_caches()
-        st.write(f"--- ⚙️ เคลียร์ Cache และเสร็จสิ้น {loan_id} ---")
+        rows_to_update = find_verified_rows("Loans", "LoanID", loan_id, _sh)
+
+        worksheet.update_cells([gspread.Cell(row, status_col, new_status) for row in rows_to_update])
+        replica_utils.update_by_id("Loans", "LoanID", loan_id, {"Status": new_status}, all_rows=True)
+
+        invalidate("Loans", _members_of("Loans", "LoanID", loan_id))
         return True
-    except (gspread.CellNotFound, AttributeError):
+    except WriteConflict as e:
+        st.warning(f"แถวของ {e} ใน Google Sheet ถูกแทรก/ลบระหว่างนี้ ยังไม่ได้อัปเดตสถานะ กรุณาลองใหม่")
+        return False
+    except KeyError:
         st.error(f"ไม่พบ LoanID '{loan_id}' ที่จะอัปเดตสถานะ")
         return False
     except ValueError:
@@ -218,32 +638,562 @@ def update_loan_status(_sh: gspread.Spreadsheet, loan_id: str, new_status: str):
         st.error(f"เกิดข้อผิดพลาดในการอัปเดตสถานะเงินกู้: {e}")
         return False
 
+@perf_utils.instrument
+def update_loans_status_bulk(_sh: gspread.Spreadsheet, loan_ids: list, new_status: str,
+                             progress_callback=None, chunk_size: int = 500, error_callback=None):
+    """
+    เปลี่ยน Status ของหลายสัญญาพร้อมกัน (ทุกแถวของแต่ละ LoanID)
+    เขียนเป็นชุดละ chunk_size แถวต่อ 1 คำขอ และข้ามแถวที่มีสถานะนี้อยู่แล้ว
+    progress_callback(จำนวนที่เขียนแล้ว, จำนวนทั้งหมด) ถูกเรียกหลังเขียนแต่ละชุด
+    chunk_size=None : เขียนทุกแถวในคำขอเดียว
+    error_callback(ข้อความ) : ใช้แจ้งสาเหตุที่ล้มเหลวแทน st.warning/st.error (เช่น สคริปต์ที่ไม่มีหน้าเว็บ)
+    คืนค่าจำนวนแถวที่เปลี่ยนจริง (หรือ None ถ้าล้มเหลว)
+    """
+    if not _wait_for_journal(_sh, error_callback):
+        return None
+    try:
+        worksheet = get_worksheet("Loans", _sh)
+        header_row = get_header("Loans", _sh)
+        status_letter = gspread.utils.rowcol_to_a1(1, header_row.index("Status") + 1).rstrip("1")
+        wanted = {str(loan_id) for loan_id in loan_ids}
+
+        def find_targets():
+            loans_df = _read_replica("Loans", _sh)
+            return loans_df[
+                loans_df["LoanID"].astype(str).isin(wanted) &
+                (loans_df["Status"].astype(str) != new_status)
+            ]
+
+        # เลขแถวมาจากสำเนา: ตรวจคอลัมน์ LoanID ใน Sheet ก่อน ถ้าแถวเลื่อนให้ซิงก์ใหม่แล้วหาอีกครั้ง
+        targets = find_targets()
+        if not _rows_hold_ids("Loans", "LoanID", dict(zip(targets.index, targets["LoanID"])), _sh):
+            _sync_sheet("Loans", _sh)
+            targets = find_targets()
+            if not _rows_hold_ids("Loans", "LoanID", dict(zip(targets.index, targets["LoanID"])), _sh):
+                raise WriteConflict("Loans")
+        rows = [int(row) for row in targets.index]
+        total = len(rows)
+        chunk_size = chunk_size or max(total, 1)
+        for start in range(0, total, chunk_size):
+            chunk = rows[start:start + chunk_size]
+            worksheet.batch_update([{"range": f"{status_letter}{row}", "values": [[new_status]]} for row in chunk])
+            if progress_callback:
+                progress_callback(min(start + chunk_size, total), total)
+
+        for loan_id in targets["LoanID"].astype(str).unique():
+            replica_utils.update_by_id("Loans", "LoanID", loan_id, {"Status": new_status}, all_rows=True)
+        if total:
+            invalidate("Loans", targets["MemberID"].astype(str).unique().tolist())
+        return total
+    except WriteConflict:
+        (error_callback or st.warning)("แถวในแท็บ Loans ของ Google Sheet ถูกแทรก/ลบระหว่างนี้ ยังไม่ได้อัปเดตสถานะ กรุณาลองใหม่")
+        return None
+    except ValueError:
+        (error_callback or st.error)("ไม่พบคอลัมน์ที่จำเป็น ('LoanID', 'Status') ในแท็บ Loans")
+        return None
+    except Exception as e:
+        (error_callback or st.error)(f"เกิดข้อผิดพลาดในการอัปเดตสถานะเงินกู้แบบกลุ่ม: {e}")
+        return None
+
+# --- นำเข้าข้อมูลแบบกลุ่ม (CSV) ---
+IMPORT_CHUNK_SIZE = 500
+IMPORT_ID_COLUMNS = {"Members": "MemberID", "Loans": "LoanID"}
+IMPORT_REQUIRED_COLUMNS = {
+    "Members": ["Name", "Village", "SubDistrict", "District", "Province"],
+    "Loans": ["MemberID", "LoanAccount", "IssueDate", "DueDate", "PrincipalAmount"],
+}
+# คอลัมน์เวลาที่ระบบเติมให้ (ว่าง = เวลาที่นำเข้า)
+IMPORT_TIMESTAMP_COLUMNS = ["LastUpdated", "DataEntryDate"]
+IMPORT_DEFAULT_LOAN_STATUS = "ยังค้างชำระ"
+
+def _parse_import_dates(values: pd.Series) -> pd.Series:
+    # รับได้ทั้ง 2025-07-05 และ 05/07/2025 (ปี พ.ศ. เช่น 05/07/2568 จะแปลงเป็น ค.ศ.)
+    parsed = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce")
+    parts = values.str.extract(r"^(\d{1,2})/(\d{1,2})/(\d{4})$").astype("float64")
+    year = parts[2].where(parts[2] < 2400, parts[2] - 543)
+    slashed = pd.to_datetime(pd.DataFrame({"year": year, "month": parts[1], "day": parts[0]}), errors="coerce")
+    return parsed.fillna(slashed)
+
+def validate_import(_sh: gspread.Spreadsheet, worksheet_name: str, df: pd.DataFrame) -> tuple:
+    """
+    ตรวจข้อมูลที่จะนำเข้า (Members / Loans) และเรียงคอลัมน์ตามหัวตารางของแท็บ
+    - คอลัมน์ที่ไม่มีในไฟล์ใช้ค่าเริ่มต้น (ยอดเงิน = 0, เวลาบันทึก = ตอนนี้)
+    - ไม่ระบุรหัส (MemberID / LoanID) จะสร้างให้
+    คืนค่า (แถวที่พร้อมเขียน, ข้อผิดพลาด) ถ้ามีข้อผิดพลาดแม้แถวเดียว จะไม่คืนแถวใดเลย
+    """
+    header = get_header(worksheet_name, _sh)
+    schema = schema_utils.SHEET_SCHEMAS.get(worksheet_name, {})
+    id_column = IMPORT_ID_COLUMNS[worksheet_name]
+    df = df.rename(columns=lambda c: str(c).strip())
+    errors = []
+    unknown = [c for c in df.columns if c not in header]
+    if unknown:
+        errors.append(f"ไม่รู้จักคอลัมน์: {', '.join(unknown)} (ใช้ได้: {', '.join(header)})")
+    missing = [c for c in IMPORT_REQUIRED_COLUMNS[worksheet_name] if c not in df.columns]
+    if missing:
+        errors.append(f"ไม่มีคอลัมน์ที่จำเป็น: {', '.join(missing)}")
+    if errors or df.empty:
+        return [], errors or ["ไม่มีข้อมูลในไฟล์"]
+
+    df = df.reindex(columns=header).fillna("").astype(str).apply(lambda s: s.str.strip()).reset_index(drop=True)
+    line = df.index + 2  # เลขบรรทัดในไฟล์ CSV (บรรทัดที่ 1 = หัวตาราง)
+
+    def report(mask, message):
+        if mask.any():
+            lines = ", ".join(str(n) for n in line[mask][:10]) + (" ..." if mask.sum() > 10 else "")
+            errors.append(f"{message} (บรรทัด {lines})")
+
+    for column in IMPORT_REQUIRED_COLUMNS[worksheet_name]:
+        report(df[column] == "", f"ไม่ได้กรอก {column}")
+
+    columns = {column: df[column].tolist() for column in header}
+    for column in schema.get("money", []) + schema.get("integer", []):
+        if column in df.columns:
+            numbers = pd.to_numeric(df[column].str.replace(",", ""), errors="coerce")
+            report(numbers.isna() & (df[column] != ""), f"{column} ไม่ใช่ตัวเลข")
+            numbers = numbers.fillna(0)
+            columns[column] = [int(v) for v in numbers] if column in schema.get("integer", []) else \
+                [float(v) for v in numbers]
+    now = datetime.now(timezone("Asia/Bangkok")).strftime("%Y-%m-%d %H:%M:%S")
+    for column in schema.get("dates", []):
+        if column not in df.columns:
+            continue
+        if column in IMPORT_TIMESTAMP_COLUMNS:
+            columns[column] = [v or now for v in df[column]]
+            continue
+        dates = _parse_import_dates(df[column])
+        report(dates.isna() & (df[column] != ""), f"{column} ไม่ใช่วันที่ (ใช้ 2025-07-05 หรือ 05/07/2025)")
+        columns[column] = ["" if pd.isna(d) else d.strftime("%Y-%m-%d") for d in dates]
+
+    ids = df[id_column]
+    report(ids.duplicated(keep=False) & (ids != ""), f"{id_column} ซ้ำกันในไฟล์")
+    existing = get_row_index(worksheet_name, id_column, _sh)
+    report(ids.isin(list(existing)), f"{id_column} มีอยู่แล้วในระบบ")
+    if worksheet_name == "Loans":
+        members = get_row_index("Members", "MemberID", _sh)
+        report((df["MemberID"] != "") & ~df["MemberID"].isin(list(members)), "ไม่พบ MemberID ในแท็บ Members")
+        columns["Status"] = [v or IMPORT_DEFAULT_LOAN_STATUS for v in df["Status"]]
+        columns[id_column] = [
+            v or new_id(f"L-{member_id}-{account}")
+            for v, member_id, account in zip(ids, df["MemberID"], df["LoanAccount"])
+        ]
+    else:
+        columns[id_column] = [v or new_id("M") for v in ids]
+    if errors:
+        return [], errors
+    return [list(row) for row in zip(*(columns[column] for column in header))], []
+
+@perf_utils.instrument
+def append_rows_bulk(worksheet_name: str, _sh: gspread.Spreadsheet, rows: list,
+                     progress_callback=None, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """
+    เพิ่มหลายแถวต่อท้ายแท็บ ชุดละ chunk_size แถวต่อ 1 คำขอ (append_rows) แล้วล้าง Cache ครั้งเดียวตอนจบ
+    progress_callback(จำนวนที่เขียนแล้ว, จำนวนทั้งหมด) ถูกเรียกหลังเขียนแต่ละชุด
+    คืนค่าจำนวนแถวที่เขียน (หรือ None ถ้าล้มเหลว แถวที่เขียนไปแล้วยังอยู่ใน Sheet)
+    """
+    if not _wait_for_journal(_sh):
+        return None
+    written = []
+    try:
+        worksheet = get_worksheet(worksheet_name, _sh)
+        total = len(rows)
+        chunk_size = chunk_size or max(total, 1)
+        for start in range(0, total, chunk_size):
+            chunk = rows[start:start + chunk_size]
+            first_row = _appended_row_number(worksheet.append_rows(chunk))
+            if first_row is None:
+                replica_utils.mark_stale(worksheet_name)
+            else:
+                replica_utils.append_rows(worksheet_name, chunk, first_row, mark_synced=False)
+            written.extend(chunk)
+            if progress_callback:
+                progress_callback(len(written), total)
+        return total
+    except Exception as e:
+        st.error(f"เกิดข้อผิดพลาดในการนำเข้าข้อมูล ({worksheet_name}) เขียนแล้ว {len(written)} จาก {len(rows)} แถว: {e}")
+        return None
+    finally:
+        if written:
+            _drop_row_indexes(worksheet_name)
+            invalidate(worksheet_name, [_member_of_row(worksheet_name, row) for row in written])
+
+# --- ธุรกรรมแบบรวมคำขอ (Unit of Work) ---
+def _cell_data(value):
+    # แปลงค่าเป็น CellData ของ Sheets API (เทียบเท่าการเขียนแบบ RAW)
+    if value is None:
+        return {"userEnteredValue": {"stringValue": ""}}
+    if isinstance(value, bool):
+        return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+class WriteConflict(Exception):
+    """ค่าใน Sheet ไม่ตรงกับที่คาดไว้ (มีผู้ใช้อื่นแก้ไขไปก่อน)"""
+
+# ล็อกระดับแถว (แบ่งเป็นช่อง) ให้ Session ในเซิร์ฟเวอร์เดียวกันที่เขียนแถวเดียวกันต่อคิวกัน
+# ส่วน Session ที่เขียนคนละแถวยังทำงานพร้อมกันได้
+_ROW_LOCK_STRIPES = 64
+_row_locks = [threading.Lock() for _ in range(_ROW_LOCK_STRIPES)]
+
+def _lock_rows(targets) -> list:
+    # จองตามลำดับเลขช่องเสมอ ป้องกัน Deadlock
+    locks = [_row_locks[i] for i in sorted({hash(t) % _ROW_LOCK_STRIPES for t in targets})]
+    for lock in locks:
+        lock.acquire()
+    return locks
+
+def _same_value(a, b) -> bool:
+    try:
+        return abs(safe_float(a) - safe_float(b)) < 1e-9
+    except (TypeError, ValueError):
+        return str(a).strip() == str(b).strip()
+
+def _is_paid(paid: float, total: float) -> bool:
+    return paid >= total - 1e-9
+
+class SheetTransaction:
+    """
+    รวบรวมการเขียนหลายแท็บ แล้วส่งไป Google Sheet ใน batch_update ครั้งเดียว
+    ก่อนเขียนจะอ่านแถวที่จะแก้ล่าสุดจาก Sheet 1 ครั้ง (ไม่เชื่อสำเนาในเครื่อง)
+    - increment: บวกจากยอดล่าสุดใน Sheet ยอดของ Session อื่นจึงไม่หาย
+    - update(..., expected=...): ถ้าค่าใน Sheet ไม่ตรงกับที่ผู้ใช้เห็น จะไม่บันทึก (WriteConflict)
+    - update_when_paid: ตัดสินจากยอดล่าสุดใน Sheet (หลัง increment ในธุรกรรมเดียวกัน) เช่น ปิดสัญญาเมื่อชำระครบ
+    - commit_later(): บันทึกลงคิวในเครื่อง (journal_utils) แล้วส่งขึ้น Sheet เบื้องหลัง
+    """
+    def __init__(self, _sh: gspread.Spreadsheet):
+        self._sh = _sh
+        self._operations = []
+
+    @classmethod
+    def from_operations(cls, _sh: gspread.Spreadsheet, operations: list):
+        """สร้างธุรกรรมจากรายการคำสั่งที่เก็บไว้ (เช่น อ่านกลับมาจากไฟล์ journal ที่เป็น JSON)"""
+        tx = cls(_sh)
+        tx._operations = [(kind, worksheet_name, list(payload) if kind == "append" else tuple(payload))
+                          for kind, worksheet_name, payload in operations]
+        return tx
+
+    @property
+    def operations(self) -> list:
+        return list(self._operations)
+
+    def append_row(self, worksheet_name: str, data_list: list):
+        self._operations.append(("append", worksheet_name, data_list))
+        return self
+
+    def update(self, worksheet_name: str, id_column: str, item_id: str, updates_dict: dict, all_rows: bool = False,
+               expected: dict = None):
+        """expected: ค่าที่ต้องตรงกับใน Sheet ก่อนเขียน เช่น {"Savings": ยอดที่แสดงในฟอร์ม}"""
+        self._operations.append(("update", worksheet_name, (id_column, item_id, updates_dict, all_rows, expected or {})))
+        return self
+
+    def increment(self, worksheet_name: str, id_column: str, item_id: str, increments_dict: dict):
+        """บวกเพิ่มจากยอดปัจจุบัน (เช่น AmountPaid += ยอดที่ชำระ) ของแถวแรกที่ ID ตรงกัน"""
+        self._operations.append(("increment", worksheet_name, (id_column, item_id, increments_dict)))
+        return self
+
+    def update_when_paid(self, worksheet_name: str, id_column: str, item_id: str, updates_dict: dict,
+                         paid_column: str = "AmountPaid", total_column: str = "PrincipalAmount"):
+        """
+        อัปเดตทุกแถวที่ ID ตรงกัน เฉพาะเมื่อผลรวม paid_column >= ผลรวม total_column ตอนเขียนจริง
+        เช่น {"Status": "ชำระครบแล้ว"} ต่อจาก increment ของ AmountPaid (ไม่ใช้ยอดเก่าที่หน้าเว็บเห็น)
+        """
+        self._operations.append(("update_when_paid", worksheet_name,
+                                 (id_column, item_id, updates_dict, paid_column, total_column)))
+        return self
+
+    def _target_rows(self) -> dict:
+        """{ลำดับคำสั่ง: [เลขแถว]} ของคำสั่ง update/increment จากดัชนีแถว"""
+        targets = {}
+        for i, (kind, worksheet_name, payload) in enumerate(self._operations):
+            if kind == "append":
+                continue
+            rows = find_rows(worksheet_name, payload[0], payload[1], self._sh)
+            targets[i] = rows if (kind == "update" and payload[3]) or kind == "update_when_paid" else rows[:1]
+        return targets
+
+    def _read_rows(self, keys: list) -> dict:
+        """อ่านแถวล่าสุดจาก Sheet ในคำขอเดียว {(แท็บ, เลขแถว): [ค่า]}"""
+        ranges = []
+        for worksheet_name, row in keys:
+            last_col = gspread.utils.rowcol_to_a1(1, len(get_header(worksheet_name, self._sh))).rstrip("1")
+            ranges.append(gspread.utils.absolute_range_name(worksheet_name, f"A{row}:{last_col}{row}"))
+        response = self._sh.values_batch_get(ranges)
+        return {key: (value_range.get("values") or [[]])[0]
+                for key, value_range in zip(keys, response.get("valueRanges", []))}
+
+    def _rows_moved(self, targets: dict, fresh: dict) -> set:
+        """แท็บที่แถวใน Sheet ไม่ใช่ ID เดิมแล้ว (มีการแทรก/ลบแถว) ต้องซิงก์ใหม่ก่อน"""
+        moved = set()
+        for i, rows in targets.items():
+            _, worksheet_name, payload = self._operations[i]
+            position = get_header(worksheet_name, self._sh).index(payload[0])
+            for row in rows:
+                values = fresh[(worksheet_name, row)]
+                if position >= len(values) or str(values[position]).strip() != str(payload[1]):
+                    moved.add(worksheet_name)
+        return moved
+
+    def _build_requests(self, targets: dict, fresh: dict):
+        requests, appended, pending = [], [], {}
+        for i, (kind, worksheet_name, payload) in enumerate(self._operations):
+            worksheet = get_worksheet(worksheet_name, self._sh)
+            header = get_header(worksheet_name, self._sh)
+            if kind == "append":
+                requests.append({"appendCells": {
+                    "sheetId": worksheet.id,
+                    "rows": [{"values": [_cell_data(v) for v in payload]}],
+                    "fields": "userEnteredValue",
+                }})
+                appended.append((worksheet_name, payload))
+                continue
+
+            rows = targets[i]
+
+            def current(row, column):
+                # ยอดล่าสุดจาก Sheet (หรือจากคำสั่งก่อนหน้าในธุรกรรมเดียวกัน)
+                if (worksheet_name, row, column) in pending:
+                    return pending[(worksheet_name, row, column)]
+                values = fresh[(worksheet_name, row)]
+                col = header.index(column)
+                return values[col] if col < len(values) else ""
+
+            if kind == "update":
+                updates_dict = payload[2]
+                for row in rows:
+                    for column, value in payload[4].items():
+                        if not _same_value(current(row, column), value):
+                            raise WriteConflict(f"{payload[1]} ({column})")
+            elif kind == "update_when_paid":
+                paid = sum(safe_float(current(row, payload[3])) for row in rows)
+                total = sum(safe_float(current(row, payload[4])) for row in rows)
+                updates_dict = payload[2] if _is_paid(paid, total) else {}
+            else:
+                updates_dict = {column: safe_float(current(rows[0], column)) + delta
+                                for column, delta in payload[2].items()}
+
+            for row in rows:
+                for column_name, new_value in updates_dict.items():
+                    col = header.index(column_name)
+                    pending[(worksheet_name, row, column_name)] = new_value
+                    requests.append({"updateCells": {
+                        "range": {"sheetId": worksheet.id, "startRowIndex": row - 1, "endRowIndex": row,
+                                  "startColumnIndex": col, "endColumnIndex": col + 1},
+                        "rows": [{"values": [_cell_data(new_value)]}],
+                        "fields": "userEnteredValue",
+                    }})
+        return requests, appended, pending
+
+    def invalidate_caches(self):
+        """ล้าง Cache ของสมาชิกทุกคนที่ธุรกรรมนี้แตะ"""
+        member_ids = {}
+        for kind, worksheet_name, payload in self._operations:
+            if kind == "append":
+                ids = [_member_of_row(worksheet_name, payload)]
+            else:
+                ids = _members_of(worksheet_name, payload[0], payload[1])
+            member_ids.setdefault(worksheet_name, set()).update(ids)
+        for worksheet_name, ids in member_ids.items():
+            invalidate(worksheet_name, ids)
+
+    def apply_locally(self):
+        """เขียนผลของธุรกรรมลงสำเนาในเครื่องทันที (ยังไม่ส่งขึ้น Sheet) ให้หน้าจอและใบเสร็จเห็นยอดใหม่"""
+        for _, worksheet_name, _ in self._operations:
+            ensure_replica(worksheet_name, self._sh)
+        self.apply_to_replica()
+        self.invalidate_caches()
+
+    def apply_to_replica(self):
+        """
+        เขียนผลลงสำเนาในเครื่องเท่านั้น (ไม่โหลดสำเนา ไม่ล้าง Cache) แถวต่อท้ายที่มี ID นี้อยู่แล้วจะข้าม
+        ใช้ตอนเขียนรายการในคิวซ้ำหลังสำเนาถูกซิงก์ใหม่ (journal_utils.preserve_pending)
+        """
+        for kind, worksheet_name, payload in self._operations:
+            if kind == "append":
+                header = replica_utils.get_header(worksheet_name) or []
+                if header and payload and replica_utils.lookup(worksheet_name, header[0], payload[0], header[0]):
+                    continue
+                row_number = replica_utils.append_row(worksheet_name, payload)
+                _index_appended_row(worksheet_name, payload, row_number)
+            elif kind == "update":
+                id_column, item_id, updates_dict, all_rows, _ = payload
+                replica_utils.update_by_id(worksheet_name, id_column, item_id, updates_dict, all_rows=all_rows)
+            elif kind == "update_when_paid":
+                id_column, item_id, updates_dict, paid_column, total_column = payload
+                paid = sum(safe_float(v) for v in replica_utils.lookup(worksheet_name, id_column, item_id, paid_column))
+                total = sum(safe_float(v) for v in replica_utils.lookup(worksheet_name, id_column, item_id, total_column))
+                if _is_paid(paid, total):
+                    replica_utils.update_by_id(worksheet_name, id_column, item_id, updates_dict, all_rows=True)
+            else:
+                id_column, item_id, increments_dict = payload
+                updates_dict = {}
+                for column, delta in increments_dict.items():
+                    current = replica_utils.lookup(worksheet_name, id_column, item_id, column)
+                    updates_dict[column] = safe_float(current[0] if current else 0) + delta
+                replica_utils.update_by_id(worksheet_name, id_column, item_id, updates_dict)
+
+    @perf_utils.instrument
+    def send(self, replica_applied: bool = False) -> dict:
+        """
+        ส่งธุรกรรมขึ้น Sheet ทันที (ไม่สำเร็จจะ raise) คืนค่าแถวที่เขียน {แท็บ: {เลขแถว: [ค่าล่าสุด]}}
+        replica_applied=True: สำเนาในเครื่องถูกเขียนไปแล้วตอนเข้าคิว (journal_utils)
+        จึงไม่เขียนแถวที่แก้ลงสำเนาและไม่ล้าง Cache ให้ผู้เรียกทำเอง
+        """
+        if not self._operations:
+            return {}
+        locks = []
+        try:
+            targets = self._target_rows()
+            keys = sorted({(self._operations[i][1], row) for i, rows in targets.items() for row in rows})
+            locks = _lock_rows(keys)
+            fresh = self._read_rows(keys) if keys else {}
+            moved = self._rows_moved(targets, fresh)
+            if moved:
+                # แถวใน Sheet เลื่อนไปแล้ว: ซิงก์แท็บนั้นใหม่แล้วหาแถวอีกครั้ง (ครั้งเดียว)
+                for worksheet_name in moved:
+                    _sync_sheet(worksheet_name, self._sh)
+                targets = self._target_rows()
+                keys = sorted({(self._operations[i][1], row) for i, rows in targets.items() for row in rows})
+                fresh = self._read_rows(keys)
+                if self._rows_moved(targets, fresh):
+                    raise WriteConflict(", ".join(sorted(moved)))
+
+            # สำเนาในเครื่องได้ค่าล่าสุดเสมอ แม้ธุรกรรมนี้จะไม่ผ่าน
+            refreshed = {}
+            for (worksheet_name, row), values in fresh.items():
+                refreshed.setdefault(worksheet_name, {})[row] = list(values)
+            if not replica_applied:
+                for worksheet_name, rows in refreshed.items():
+                    replica_utils.replace_rows(worksheet_name, rows)
+
+            requests, appended, pending = self._build_requests(targets, fresh)
+            self._sh.batch_update({"requests": requests})
+
+            # ไม่ต้องอ่านกลับอีกรอบ: แถวที่แก้ = ค่าที่เพิ่งอ่าน + ค่าที่เพิ่งเขียน
+            for (worksheet_name, row, column_name), new_value in pending.items():
+                values = refreshed[worksheet_name][row]
+                col = get_header(worksheet_name, self._sh).index(column_name)
+                values.extend([""] * (col + 1 - len(values)))
+                values[col] = new_value
+
+            for worksheet_name, data_list in appended:
+                if replica_applied:
+                    # แถวนี้เขียนลงสำเนาไว้แล้วตอนเข้าคิว เว้นแต่สำเนาถูกซิงก์ทั้งแท็บใหม่ระหว่างรอส่ง
+                    header = get_header(worksheet_name, self._sh)
+                    if replica_utils.lookup(worksheet_name, header[0], data_list[0], header[0]):
+                        continue
+                # appendCells ไม่บอกเลขแถว จึงถือว่าต่อท้ายแถวสุดท้ายที่สำเนารู้จัก
+                row_number = replica_utils.append_row(worksheet_name, data_list)
+                _index_appended_row(worksheet_name, data_list, row_number)
+
+            if not replica_applied:
+                for worksheet_name, rows in refreshed.items():
+                    replica_utils.replace_rows(worksheet_name, rows)
+                self.invalidate_caches()
+            self._operations = []
+            return refreshed
+        finally:
+            for lock in locks:
+                lock.release()
+
+    @perf_utils.instrument
+    def commit(self) -> bool:
+        if not self._operations:
+            return True
+        if not _wait_for_journal(self._sh):
+            return False
+        try:
+            self.send()
+            return True
+        except WriteConflict as e:
+            # ค่าในหน้าจอเก่าแล้ว: ล้าง Cache ให้รอบถัดไปแสดงค่าล่าสุด
+            for kind, worksheet_name, payload in self._operations:
+                if kind != "append":
+                    invalidate(worksheet_name, _members_of(worksheet_name, payload[0], payload[1]))
+            st.warning(f"ข้อมูล {e} ถูกแก้ไขโดยผู้ใช้อื่นระหว่างนี้ ยังไม่ได้บันทึก กรุณาตรวจสอบยอดล่าสุดแล้วลองใหม่")
+            return False
+        except KeyError as e:
+            st.error(f"ไม่พบ ID {e} ที่จะบันทึกธุรกรรม")
+            return False
+        except ValueError as e:
+            st.error(f"ไม่พบคอลัมน์ที่จำเป็นในการบันทึกธุรกรรม: {e}")
+            return False
+        except Exception as e:
+            st.error(f"เกิดข้อผิดพลาดในการบันทึกธุรกรรม: {e}")
+            return False
+
+    @perf_utils.instrument
+    def commit_later(self, label: str = "", key: str = None) -> bool:
+        """
+        บันทึกลงคิวในเครื่องแล้วคืนค่าทันที (ไม่รอ Google Sheets API) ยอดในสำเนาในเครื่องเปลี่ยนทันที
+        label: คำอธิบายที่แสดงในคิว, key: รหัสอ้างอิง (เช่น TransactionID) ไว้ถามสถานะด้วย journal_utils.get_status()
+        ธุรกรรมที่มี expected ต้องรู้ผลการตรวจค่าชนกันทันที จึงส่งแบบรอผล (commit) แทน
+        """
+        import journal_utils  # import ตรงนี้ เพราะ journal_utils เรียกใช้โมดูลนี้
+        if not journal_utils.WRITE_BEHIND or any(kind == "update" and payload[4] for kind, _, payload in self._operations):
+            return self.commit()
+        if not self._operations:
+            return True
+        try:
+            self._target_rows()  # ID ที่ไม่มีอยู่จริงต้องแจ้งผู้ใช้ตอนนี้ ไม่ใช่ตอนส่งเบื้องหลัง
+            journal_utils.submit(self._sh, self, label, key)
+            self._operations = []
+            return True
+        except KeyError as e:
+            st.error(f"ไม่พบ ID {e} ที่จะบันทึกธุรกรรม")
+            return False
+        except Exception as e:
+            st.error(f"บันทึกรายการลงคิวในเครื่องไม่สำเร็จ: {e}")
+            return False
+
 # --- ฟังก์ชันสำหรับแอดมิน ---
+@perf_utils.instrument
 def get_system_config(_sh: gspread.Spreadsheet, key: str):
     try:
-        worksheet = _sh.worksheet("SystemConfig")
-        cell = worksheet.find(key, in_column=1)
-        value = worksheet.cell(cell.row, 2).value
-        return value
+        df = _read_replica("SystemConfig", _sh)
+        header = replica_utils.get_header("SystemConfig") or []
+        # คอลัมน์ A = Key, คอลัมน์ B = Value (เผื่อกรณีที่ไม่มีแถวหัวตาราง)
+        if len(header) >= 2 and str(header[0]) == key:
+            return str(header[1])
+        if df.shape[1] >= 2:
+            match = df[df.iloc[:, 0].astype(str) == key]
+            if not match.empty:
+                return str(match.iloc[0, 1])
+        st.warning(f"ไม่พบค่า Config '{key}' ใน SystemConfig")
+        return None
     except WorksheetNotFound:
         st.error(f"ไม่พบแท็บ SystemConfig")
         return None
-    except (gspread.CellNotFound, AttributeError):
-        st.warning(f"ไม่พบค่า Config '{key}' ใน SystemConfig")
-        return None
     except Exception as e:
         st.error(f"เกิดข้อผิดพลาดในการดึงค่า Config '{key}': {e}")
         return None
 
+@perf_utils.instrument
 def update_system_config(_sh: gspread.Spreadsheet, key: str, value: str):
+    if not _wait_for_journal(_sh):
+        return False
     try:
-        worksheet = _sh.worksheet("SystemConfig")
-        cell = worksheet.find(key, in_column=1)
-        worksheet.update_cell(cell.row, 2, value)
+        worksheet = get_worksheet("SystemConfig", _sh)
+        header = get_header("SystemConfig", _sh) or []
+        if len(header) < 2:
+            st.error("แท็บ SystemConfig ต้องมีอย่างน้อย 2 คอลัมน์ (Key, Value)")
+            return False
+        if str(header[0]).strip() == key:
+            # แท็บที่ไม่มีแถวหัวตาราง Key แรกอยู่ในแถวที่ 1 (interest_utils ก็นับแถวนี้เป็นกฎ)
+            worksheet.update_cell(1, 2, value)
+            replica_utils.mark_stale("SystemConfig")
+        else:
+            row = find_verified_rows("SystemConfig", header[0], key, _sh)[0]
+            worksheet.update_cell(row, 2, value)
+            replica_utils.update_by_id("SystemConfig", header[0], key, {header[1]: value})
+        invalidate("SystemConfig")
         return True
-    except (gspread.CellNotFound, AttributeError):
+    except KeyError:
         st.error(f"ไม่พบ Config '{key}' ที่จะอัปเดตใน SystemConfig")
         return False
+    except WriteConflict:
+        st.warning("แถวในแท็บ SystemConfig ของ Google Sheet ถูกแทรก/ลบระหว่างนี้ ยังไม่ได้บันทึก กรุณาลองใหม่")
+        return False
     except Exception as e:
         st.error(f"อัปเดต Config '{key}' ไม่สำเร็จ: {e}")
         return False
@@ -0,0 +1,130 @@
+# interest_utils.py
+# คำนวณดอกเบี้ยของสัญญาเงินกู้ทั้งพอร์ตในครั้งเดียว (Vectorized) ตามอัตราที่ตั้งไว้ใน SystemConfig
+#
+# รูปแบบ Key ใน SystemConfig (ค่าเป็น 0.06 หรือ 6% ก็ได้) เลือกอันที่เจาะจงที่สุดก่อน:
+#   InterestRate:<บัญชี>:<ปี>  เช่น InterestRate:4:2025  = บัญชี 4 รอบสัญญาที่เริ่มปี 2025 (ปี ค.ศ. ของ IssueDate)
+#   InterestRate:<บัญชี>       เช่น InterestRate:1       = บัญชี 1 ทุกรอบ
+#   InterestRate               = ทุกบัญชี ทุกรอบ
+# ถ้าไม่ได้ตั้งไว้เลย ใช้ DEFAULT_INTEREST_RATE
+from collections.abc import Hashable
+
+import gspread
+import pandas as pd
+import streamlit as st
+
+import gsheet_utils
+import perf_utils
+
+# --- ค่าคงที่ ---
+DEFAULT_INTEREST_RATE = 0.06  # ดอกเบี้ยต่อรอบสัญญา (คิดจากเงินต้น)
+RATE_KEY = "InterestRate"
+ACTIVE_STATUSES = ['ยังค้างชำระ', 'เกินกำหนดชำระ', 'Active']
+INTEREST_COLUMNS = ["InterestRate", "InterestDue", "InterestArrears"]
+
+# --- ฟังก์ชัน Helper ---
+def parse_rate(value):
+    """ "6%" -> 0.06, "0.06" -> 0.06 (ค่าผิดรูปแบบคืน None)"""
+    text = str(value).strip().replace(",", "")
+    try:
+        return float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    except ValueError:
+        return None
+
+# --- อัตราดอกเบี้ยจาก SystemConfig ---
+def get_interest_rules(_sh: gspread.Spreadsheet) -> dict:
+    return _get_interest_rules(_sh, gsheet_utils.data_version("SystemConfig"))
+
+@st.cache_data(ttl=300)
+@perf_utils.cache_miss
+def _get_interest_rules(_sh: gspread.Spreadsheet, version: Hashable) -> dict:
+    """
+    {Key: อัตรา} เฉพาะ Key ที่ขึ้นต้นด้วย InterestRate เช่น {"InterestRate": 0.06, "InterestRate:4": 0.05}
+    """
+    df = gsheet_utils.get_data_as_dataframe("SystemConfig", _sh)
+    pairs = []
+    if df.shape[1] >= 2:
+        # แท็บที่ไม่มีแถวหัวตาราง แถวแรกจะกลายเป็นชื่อคอลัมน์ (ให้นับเป็นกฎด้วย)
+        pairs.append((str(df.columns[0]), df.columns[1]))
+        pairs.extend(zip(df.iloc[:, 0].astype(str), df.iloc[:, 1]))
+    rules = {}
+    for key, value in pairs:
+        key = key.strip().replace(" ", "")
+        if key == RATE_KEY or key.startswith(RATE_KEY + ":"):
+            rate = parse_rate(value)
+            if rate is None:
+                st.warning(f"อัตราดอกเบี้ย '{key}' ใน SystemConfig ไม่ใช่ตัวเลข: {value}")
+            else:
+                rules[key] = rate
+    return rules
+
+def _rate_series(rules: dict, accounts: pd.Series, periods: pd.Series) -> pd.Series:
+    """อัตราดอกเบี้ยของทุกแถวพร้อมกัน: กฎบัญชี+ปี > กฎบัญชี > กฎรวม > ค่าเริ่มต้น"""
+    accounts = accounts.astype(str)
+    account_keys = RATE_KEY + ":" + accounts
+    period_keys = account_keys + ":" + periods.astype("Int64").astype(str)
+    return (
+        period_keys.map(rules)
+        .fillna(account_keys.map(rules))
+        .fillna(rules.get(RATE_KEY, DEFAULT_INTEREST_RATE))
+        .astype("float64")
+    )
+
+def get_interest_rate(_sh: gspread.Spreadsheet, loan_account, issue_date=None) -> float:
+    """อัตราดอกเบี้ยของสัญญาเดียว (บัญชี + วันเริ่มสัญญา)"""
+    year = pd.Series([pd.Timestamp(issue_date).year if issue_date is not None and not pd.isna(issue_date) else None])
+    return float(_rate_series(get_interest_rules(_sh), pd.Series([loan_account]), year).iloc[0])
+
+# --- คำนวณดอกเบี้ย ---
+def add_interest_columns(_sh: gspread.Spreadsheet, loans: pd.DataFrame) -> pd.DataFrame:
+    """
+    เพิ่มคอลัมน์ InterestRate / InterestDue / InterestArrears ให้ DataFrame สัญญา
+    (ต้องมี LoanAccount, IssueDate, PrincipalAmount, InterestPaid) คืนค่า DataFrame ใหม่
+    """
+    loans = loans.copy()
+    if loans.empty:
+        for column in INTEREST_COLUMNS:
+            loans[column] = pd.Series(dtype="float64")
+        return loans
+    loans["InterestRate"] = _rate_series(get_interest_rules(_sh), loans["LoanAccount"],
+                                         loans["IssueDate"].dt.year).to_numpy()
+    loans["InterestDue"] = loans["PrincipalAmount"] * loans["InterestRate"]
+    loans["InterestArrears"] = (loans["InterestDue"] - loans["InterestPaid"]).clip(lower=0)
+    return loans
+
+@perf_utils.instrument(cached=True)
+def get_portfolio_interest(_sh: gspread.Spreadsheet) -> pd.DataFrame:
+    return _get_portfolio_interest(_sh, gsheet_utils.data_version("Loans"), gsheet_utils.data_version("SystemConfig"))
+
+@st.cache_data(ttl=300)
+@perf_utils.cache_miss
+def _get_portfolio_interest(_sh: gspread.Spreadsheet, loans_version: Hashable, config_version: Hashable) -> pd.DataFrame:
+    """
+    ดอกเบี้ยของทุกสัญญา (1 แถวต่อ LoanID): ที่ต้องชำระ, ชำระแล้ว, ค้างชำระ และเงินต้นคงเหลือ
+    """
+    loans = gsheet_utils.get_data_as_dataframe("Loans", _sh)
+    if loans.empty:
+        return pd.DataFrame()
+    portfolio = loans.groupby("LoanID", sort=False, observed=True).agg(
+        MemberID=("MemberID", "first"),
+        LoanAccount=("LoanAccount", "first"),
+        IssueDate=("IssueDate", "first"),
+        DueDate=("DueDate", "first"),
+        Status=("Status", "first"),
+        PrincipalAmount=("PrincipalAmount", "sum"),
+        AmountPaid=("AmountPaid", "sum"),
+        InterestPaid=("InterestPaid", "sum"),
+    ).reset_index()
+    portfolio["Remaining"] = portfolio["PrincipalAmount"] - portfolio["AmountPaid"]
+    portfolio["IsActive"] = portfolio["Status"].isin(ACTIVE_STATUSES).to_numpy()
+    return add_interest_columns(_sh, portfolio)
+
+def summarize_by_account(portfolio: pd.DataFrame) -> pd.DataFrame:
+    """ยอดรวมดอกเบี้ยของสัญญาที่ยังค้างชำระ แยกตามบัญชี"""
+    active = portfolio[portfolio["IsActive"]]
+    return active.groupby("LoanAccount", observed=True).agg(
+        Loans=("LoanID", "count"),
+        Remaining=("Remaining", "sum"),
+        InterestDue=("InterestDue", "sum"),
+        InterestPaid=("InterestPaid", "sum"),
+        InterestArrears=("InterestArrears", "sum"),
+    ).reset_index()
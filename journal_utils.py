@@ -0,0 +1,529 @@
+# journal_utils.py
+# คิวการเขียนในเครื่อง (Write-behind Journal) ให้หน้ารับเงินไม่ต้องรอ Google Sheets API
+# - SheetTransaction.commit_later() บันทึกธุรกรรมลงไฟล์ SQLite (ลงดิสก์จริงก่อนตอบ) แล้วเขียนสำเนาในเครื่องทันที
+#   หน้าเว็บจึงออกใบเสร็จได้เลย ส่วนการส่งขึ้น Sheet เป็นหน้าที่ของ Thread เบื้องหลัง
+# - Thread เบื้องหลังรวมรายการที่ค้างอยู่ส่งใน batch_update เดียว (ยอดบวกของแถวเดียวกันรวมเป็นคำสั่งเดียว)
+# - ส่งไม่ผ่านเพราะ API/เครือข่าย จะลองใหม่โดยเว้นระยะห่างขึ้นเรื่อยๆ ตามลำดับเดิม
+#   รายการที่ผิดถาวร (ไม่พบ ID, แถวเลื่อน) จะถูกพักไว้ให้แอดมินตรวจในหน้าเครื่องมือแอดมิน
+# - แอปดับระหว่างส่ง: เปิดใหม่จะส่งรายการที่ค้างต่อ รายการที่ไม่แน่ใจว่าถึง Sheet หรือยังจะตรวจจาก
+#   รหัสของแถวที่ต่อท้ายก่อน (batch_update สำเร็จทั้งหมดหรือไม่สำเร็จเลย) กันบันทึกซ้ำ
+# - สำเนาในเครื่องถูกซิงก์ใหม่ทั้งแท็บระหว่างที่ยังมีรายการรอส่ง: เขียนรายการเหล่านั้นลงสำเนาซ้ำ (preserve_pending)
+# - หลาย Process ใช้ไฟล์ journal เดียวกันได้ (เช่น แอปหลายตัว) แต่ส่งขึ้น Sheet ได้เฉพาะ Process ที่ถือไฟล์ล็อก
+#   (JOURNAL_PATH + ".lock") ตัวอื่นเข้าคิวแล้วรอ ส่วนสคริปต์ที่ไม่มีหน้าเว็บ (HEADLESS) ไม่ส่งคิวเลย
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import gspread
+import pandas as pd
+import streamlit as st
+from gspread.exceptions import APIError
+
+import gsheet_utils
+import perf_utils
+import replica_utils
+
+# --- ค่าคงที่ ---
+JOURNAL_PATH = os.environ.get("LOANAPP_JOURNAL_PATH", "journal.db")
+WRITE_BEHIND = os.environ.get("LOANAPP_WRITE_BEHIND", "1") != "0"  # "0" = ส่งขึ้น Sheet ทันทีแบบเดิม
+BATCH_WINDOW = 0.2        # (วินาที) รอให้รายการอื่นมารวมส่งพร้อมกัน
+POLL_INTERVAL = 1.0       # (วินาที) ตรวจคิวที่ถึงเวลาลองใหม่
+MAX_BATCH_ENTRIES = 100
+RETRY_BASE_DELAY = 2.0    # (วินาที) ลองใหม่ครั้งที่ n รอ RETRY_BASE_DELAY * 2^(n-1) แต่ไม่เกิน RETRY_MAX_DELAY
+RETRY_MAX_DELAY = 300.0
+DRAIN_TIMEOUT = 15.0      # (วินาที) การเขียนแบบรอผลจะรอคิวที่ค้างอยู่นานสุดเท่านี้
+KEEP_DAYS = 7             # เก็บรายการที่ส่งแล้วไว้ดูย้อนหลังกี่วัน
+STATUS_REFRESH = 3        # (วินาที) ความถี่ในการอัปเดตสถานะคิวใน Sidebar
+
+PENDING, SENDING, FLUSHED, FAILED, DISCARDED = "pending", "sending", "flushed", "failed", "discarded"
+STATUS_LABELS = {
+    PENDING: "รอส่ง", SENDING: "กำลังส่ง", FLUSHED: "ส่งแล้ว",
+    FAILED: "ส่งไม่สำเร็จ", DISCARDED: "ยกเลิกแล้ว",
+}
+
+FLUSH_IN_BACKGROUND = True  # False = ไม่เริ่ม Thread ส่งเอง ส่งเมื่อเรียก drain() / flush_once() (ใช้ใน benchmark)
+HEADLESS = False            # True = สคริปต์ (เช่น overdue_sweep): ไม่ส่ง/กู้คิวของแอป drain() คืนค่าตามที่ค้างอยู่ทันที
+
+_lock = threading.RLock()        # ไฟล์ journal และการเขียนสำเนาในเครื่องของคิว
+_flush_lock = threading.Lock()   # ส่งได้ทีละรอบ (รักษาลำดับ)
+_changed = threading.Condition()
+_wake = threading.Event()
+_conn = None
+_worker = None
+_recovered = False
+_owner_lock = None               # ไฟล์ล็อกที่ถือไว้ตลอดอายุ Process เมื่อเป็นผู้ส่งคิว
+_journal_ms = deque(maxlen=100)  # เวลาที่หน้าเว็บรอการบันทึกลงคิว (ms) ล่าสุด
+_worker_error = None             # ข้อผิดพลาดล่าสุดของ Thread เบื้องหลังที่ไม่ได้ผูกกับรายการใด (แสดงใน Sidebar)
+
+# --- การเชื่อมต่อ ---
+def _connect():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(JOURNAL_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")  # ตอบผู้ใช้หลังรายการลงดิสก์แล้วเท่านั้น
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, label TEXT, operations TEXT NOT NULL, "
+            "status TEXT NOT NULL, in_doubt INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT, created_at REAL NOT NULL, "
+            "flushed_at REAL, flush_ms REAL, batch_size INTEGER)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status, id)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS journal_key ON journal (key)")
+    return _conn
+
+def _json_default(value):
+    # ค่าจาก pandas/numpy (เช่น numpy.float64) แปลงเป็นค่าธรรมดาของ Python
+    return value.item() if hasattr(value, "item") else str(value)
+
+def _entries(rows) -> list:
+    return [{"id": r[0], "operations": json.loads(r[1]), "in_doubt": bool(r[2]), "attempts": r[3]} for r in rows]
+
+def _notify():
+    with _changed:
+        _changed.notify_all()
+
+# --- เข้าคิว ---
+@perf_utils.instrument
+def submit(_sh: gspread.Spreadsheet, tx, label: str = "", key: str = None) -> int:
+    """บันทึกธุรกรรม (SheetTransaction) ลงคิว แล้วเขียนสำเนาในเครื่องทันที คืนค่าเลขรายการในคิว"""
+    ensure_worker(_sh)
+    started = time.perf_counter()
+    operations = json.dumps(tx.operations, ensure_ascii=False, default=_json_default)
+    # โหลดสำเนาให้พร้อมก่อนเข้าคิว ถ้าต้องซิงก์ตอนนี้ preserve_pending จะได้ไม่เขียนรายการนี้ซ้ำกับ apply_locally
+    for worksheet_name in {name for _, name, _ in tx.operations}:
+        gsheet_utils.ensure_replica(worksheet_name, _sh)
+    with _lock:
+        entry_id = _connect().execute(
+            "INSERT INTO journal (key, label, operations, status, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, label, operations, PENDING, time.time()),
+        ).lastrowid
+        tx.apply_locally()
+    _journal_ms.append((time.perf_counter() - started) * 1000)
+    _wake.set()
+    return entry_id
+
+# --- ผู้ส่งคิว (1 Process ต่อไฟล์ journal) ---
+def _own_queue() -> bool:
+    """
+    จองไฟล์ล็อกแบบ Exclusive (ไม่รอ) ได้ = Process นี้เป็นผู้ส่งคิว ถือไว้จนปิด Process
+    ระบบปฏิบัติการปล่อยล็อกเองเมื่อ Process ดับ ผู้ส่งคนถัดไปจึงกู้รายการ "กำลังส่ง" ที่ค้างได้อย่างปลอดภัย
+    """
+    global _owner_lock
+    with _lock:
+        if _owner_lock is not None:
+            return True
+        if HEADLESS:
+            return False
+        lock_file = open(JOURNAL_PATH + ".lock", "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        _owner_lock = lock_file
+        return True
+
+# --- Thread เบื้องหลัง ---
+def ensure_worker(_sh: gspread.Spreadsheet):
+    """
+    เริ่ม Thread ที่ส่งคิวขึ้น Sheet (ครั้งแรกจะกู้รายการที่ค้างจากการเปิดแอปครั้งก่อนด้วย)
+    ถ้า Process อื่นเป็นผู้ส่งคิวอยู่ ไม่ทำอะไร (รายการที่เข้าคิวจาก Process นี้จะถูกส่งโดย Process นั้น)
+    """
+    global _worker
+    with _lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        if not _own_queue():
+            return
+        _recover()
+        if not FLUSH_IN_BACKGROUND:
+            return
+        _worker = threading.Thread(target=_run, args=(_sh,), name="loanapp-journal", daemon=True)
+        _worker.start()
+
+def _recover():
+    # เรียกเฉพาะตอนถือไฟล์ล็อกแล้ว: รายการ "กำลังส่ง" ที่เหลืออยู่จึงเป็นของผู้ส่งที่ดับไปแล้วเท่านั้น
+    global _recovered
+    if _recovered:
+        return
+    conn = _connect()
+    # ค้างสถานะ "กำลังส่ง" = แอปดับระหว่างส่ง ไม่แน่ใจว่าถึง Sheet หรือยัง
+    conn.execute("UPDATE journal SET status = ?, in_doubt = 1, next_attempt = 0 WHERE status = ?", (PENDING, SENDING))
+    conn.execute("DELETE FROM journal WHERE status IN (?, ?) AND created_at < ?",
+                 (FLUSHED, DISCARDED, time.time() - KEEP_DAYS * 86400))
+    _recovered = True
+
+def _run(_sh: gspread.Spreadsheet):
+    global _worker_error
+    while True:
+        if _wake.wait(timeout=POLL_INTERVAL):
+            _wake.clear()
+            time.sleep(BATCH_WINDOW)
+        try:
+            while flush_once(_sh):
+                pass
+            _worker_error = None
+        except Exception as e:
+            _worker_error = f"{type(e).__name__}: {e}"
+            _notify()
+
+# --- ส่งขึ้น Sheet ---
+def _coalesce(operations: list) -> list:
+    """
+    รวมคำสั่งของแถวเดียวกัน: increment บวกยอดรวมกัน, update (ไม่มี expected) ค่าหลังทับค่าก่อน
+    update_when_paid ของสัญญาเดียวกันรวมเป็นคำสั่งเดียว (ตรวจหลัง increment ที่รวมแล้ว ผลไม่ต่างจากตรวจทีละรายการ
+    เพราะยอดชำระมีแต่เพิ่มขึ้น)
+    """
+    merged, increments, updates, conditional = [], {}, {}, {}
+    for kind, worksheet_name, payload in operations:
+        if kind == "increment":
+            key = (worksheet_name, payload[0], str(payload[1]))
+            if key in increments:
+                for column, delta in payload[2].items():
+                    increments[key][column] = increments[key].get(column, 0) + delta
+                continue
+            increments[key] = dict(payload[2])
+            merged.append((kind, worksheet_name, [payload[0], payload[1], increments[key]]))
+        elif kind == "update" and not payload[4]:
+            key = (worksheet_name, payload[0], str(payload[1]), bool(payload[3]))
+            if key in updates:
+                updates[key].update(payload[2])
+                continue
+            updates[key] = dict(payload[2])
+            merged.append((kind, worksheet_name, [payload[0], payload[1], updates[key], payload[3], {}]))
+        elif kind == "update_when_paid":
+            key = (worksheet_name, payload[0], str(payload[1]), payload[3], payload[4])
+            if key in conditional:
+                conditional[key].update(payload[2])
+                continue
+            conditional[key] = dict(payload[2])
+            merged.append((kind, worksheet_name, [payload[0], payload[1], conditional[key], payload[3], payload[4]]))
+        else:
+            merged.append((kind, worksheet_name, payload))
+    return merged
+
+def _appended_ids(entry: dict) -> set:
+    return {(worksheet_name, str(payload[0])) for kind, worksheet_name, payload in entry["operations"]
+            if kind == "append" and payload}
+
+def _targets(entry: dict) -> set:
+    return {(worksheet_name, str(payload[1])) for kind, worksheet_name, payload in entry["operations"]
+            if kind != "append"}
+
+def _next_batch(rows: list) -> list:
+    if not rows or rows[0][4] > time.time():
+        return []
+    entries = _entries(rows)
+    if entries[0]["in_doubt"]:
+        return entries[:1]  # ต้องตรวจทีละรายการ
+    batch, appended = [], set()
+    for entry in entries:
+        # แก้แถวที่เพิ่งต่อท้ายในรอบเดียวกันไม่ได้ (ยังไม่มีแถวนั้นตอนอ่านก่อนเขียน) ให้ไปรอบถัดไป
+        if entry["in_doubt"] or _targets(entry) & appended:
+            break
+        batch.append(entry)
+        appended |= _appended_ids(entry)
+    return batch
+
+def _claim() -> list:
+    """
+    รายการถัดไปที่จะส่ง (เรียงตามลำดับที่เข้าคิว) แล้วเปลี่ยนสถานะเป็นกำลังส่ง
+    อ่านและเปลี่ยนสถานะใน Transaction เดียวที่จองสิทธิ์เขียนไฟล์ไว้ก่อน (BEGIN IMMEDIATE)
+    Process อื่นจึงหยิบรายการเดียวกันไปส่งซ้ำไม่ได้
+    """
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            batch = _next_batch(conn.execute(
+                "SELECT id, operations, in_doubt, attempts, next_attempt FROM journal "
+                "WHERE status = ? ORDER BY id LIMIT ?", (PENDING, MAX_BATCH_ENTRIES),
+            ).fetchall())
+            claimed = set()
+            if batch:
+                claimed = {row[0] for row in conn.execute(
+                    f"UPDATE journal SET status = ? WHERE status = ? AND id IN ({', '.join('?' * len(batch))}) "
+                    f"RETURNING id", [SENDING, PENDING] + [entry["id"] for entry in batch],
+                ).fetchall()}
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return [entry for entry in batch if entry["id"] in claimed]
+
+def _finish(entries: list, status: str, error: str = None, flush_ms: float = None):
+    ids = [entry["id"] for entry in entries]
+    with _lock:
+        _connect().execute(
+            f"UPDATE journal SET status = ?, last_error = ?, flushed_at = ?, flush_ms = ?, batch_size = ?, in_doubt = 0 "
+            f"WHERE id IN ({', '.join('?' * len(ids))})",
+            [status, error, time.time() if status == FLUSHED else None, flush_ms, len(ids)] + ids,
+        )
+    _notify()
+
+def _retry_later(entries: list, error: Exception, in_doubt: bool):
+    with _lock:
+        conn = _connect()
+        for entry in entries:
+            attempts = entry["attempts"] + 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+            conn.execute(
+                "UPDATE journal SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, in_doubt = ? WHERE id = ?",
+                (PENDING, attempts, time.time() + delay, f"{type(error).__name__}: {error}",
+                 int(in_doubt or entry["in_doubt"]), entry["id"]),
+            )
+    _notify()
+
+def _release(entries: list):
+    # คืนรายการที่ยังไม่ได้ส่งกลับเข้าคิว (สถานะเดิม)
+    with _lock:
+        _connect().execute(f"UPDATE journal SET status = ? WHERE id IN ({', '.join('?' * len(entries))})",
+                           [PENDING] + [entry["id"] for entry in entries])
+
+def _busy_rows(_sh: gspread.Spreadsheet, exclude: set) -> set:
+    """แถว (แท็บ, เลขแถว) ที่รายการอื่นในคิวยังรอแก้อยู่ สำเนาของแถวเหล่านี้มียอดที่ยังไม่ได้ส่งรวมอยู่"""
+    rows = _connect().execute(
+        "SELECT id, operations, in_doubt, attempts FROM journal WHERE status IN (?, ?)", (PENDING, SENDING),
+    ).fetchall()
+    busy = set()
+    for entry in _entries(rows):
+        if entry["id"] in exclude:
+            continue
+        for kind, worksheet_name, payload in entry["operations"]:
+            if kind == "append":
+                continue
+            try:
+                busy.update((worksheet_name, row) for row in gsheet_utils.find_rows(worksheet_name, payload[0], payload[1], _sh))
+            except KeyError:
+                pass
+    return busy
+
+def _send(_sh: gspread.Spreadsheet, entries: list) -> int:
+    operations = _coalesce([operation for entry in entries for operation in entry["operations"]])
+    tx = gsheet_utils.SheetTransaction.from_operations(_sh, operations)
+    started = time.perf_counter()
+    try:
+        refreshed = tx.send(replica_applied=True)
+    except (gsheet_utils.WriteConflict, KeyError, ValueError) as e:
+        if len(entries) > 1:
+            # หารายการที่มีปัญหา: ส่งทีละรายการตามลำดับ
+            done = 0
+            for i, entry in enumerate(entries):
+                sent = _send(_sh, [entry])
+                if not sent:
+                    _release(entries[i + 1:])
+                    break
+                done += sent
+            return done
+        _finish(entries, FAILED, error=f"{type(e).__name__}: {e}")
+        return 1
+    except Exception as e:
+        # API ตอบข้อผิดพลาดกลับมา (4xx / 429) = ยังไม่ได้เขียน, เครือข่ายขาดหรือ 5xx = ไม่แน่ใจ
+        code = getattr(e, "code", None)
+        _retry_later(entries, e, in_doubt=not (isinstance(e, APIError) and isinstance(code, int) and code < 500))
+        return 0
+    flush_ms = (time.perf_counter() - started) * 1000
+
+    # แถวที่ส่งแล้วเขียนค่าล่าสุดจาก Sheet ลงสำเนา ยกเว้นแถวที่รายการอื่นในคิวยังรอแก้
+    with _lock:
+        busy = _busy_rows(_sh, {entry["id"] for entry in entries})
+        for worksheet_name, rows in refreshed.items():
+            replica_utils.replace_rows(worksheet_name, {row: values for row, values in rows.items()
+                                                        if (worksheet_name, row) not in busy})
+    gsheet_utils.SheetTransaction.from_operations(_sh, operations).invalidate_caches()
+    _finish(entries, FLUSHED, flush_ms=flush_ms)
+    return len(entries)
+
+def _resolve_in_doubt(_sh: gspread.Spreadsheet, entry: dict) -> int:
+    """รายการที่อาจส่งถึง Sheet แล้ว: ตรวจรหัสของแถวที่ต่อท้าย ถ้ามีแล้วถือว่าส่งสำเร็จ ไม่ส่งซ้ำ"""
+    appended = sorted(_appended_ids(entry))
+    if not appended:
+        _finish([entry], FAILED, error="ไม่แน่ใจว่าส่งถึง Google Sheet แล้วหรือยัง กรุณาตรวจยอดใน Sheet ก่อนกดส่งซ้ำ")
+        return 1
+    worksheet_name, item_id = appended[0]
+    try:
+        sheet_ids = gsheet_utils.get_worksheet(worksheet_name, _sh).col_values(1)
+    except Exception as e:
+        _retry_later([entry], e, in_doubt=True)
+        return 0
+    if item_id in {str(v) for v in sheet_ids}:
+        # ส่งสำเร็จแล้ว: ให้สำเนาของแท็บที่เกี่ยวข้องซิงก์ใหม่ตอนอ่านครั้งถัดไป
+        for name in {name for _, name, _ in entry["operations"]}:
+            replica_utils.mark_stale(name)
+        _finish([entry], FLUSHED)
+        return 1
+    entry["in_doubt"] = False
+    return _send(_sh, [entry])
+
+@perf_utils.instrument
+def flush_once(_sh: gspread.Spreadsheet) -> int:
+    """ส่งรายการที่ถึงเวลาส่ง 1 รอบ คืนค่าจำนวนรายการที่ปิดได้ (ส่งแล้ว หรือพักไว้เพราะผิดถาวร)"""
+    if not _own_queue():
+        return 0
+    with _flush_lock:
+        entries = _claim()
+        if not entries:
+            return 0
+        if entries[0]["in_doubt"]:
+            return _resolve_in_doubt(_sh, entries[0])
+        return _send(_sh, entries)
+
+def drain(_sh: gspread.Spreadsheet, timeout: float = DRAIN_TIMEOUT) -> bool:
+    """
+    รอจนคิวว่าง (ใช้ก่อนการเขียนแบบรอผล) คืนค่า False ถ้ายังค้างอยู่เมื่อครบเวลา
+    HEADLESS: ไม่ส่งและไม่รอ คืนค่า False ทันทีถ้ายังมีรายการค้าง
+    """
+    if pending_count() == 0:
+        return True
+    if HEADLESS:
+        return False
+    with _lock:
+        # ไม่รอรอบลองใหม่ตามปกติ ส่งทันที
+        _connect().execute("UPDATE journal SET next_attempt = 0 WHERE status = ?", (PENDING,))
+    ensure_worker(_sh)
+    if not FLUSH_IN_BACKGROUND and _own_queue():
+        while flush_once(_sh):
+            pass
+        return pending_count() == 0
+    # ผู้ส่งอาจเป็น Process อื่น: ตรวจจำนวนที่ค้างเป็นระยะ (การแจ้งเตือนข้าม Process ไม่ได้)
+    _wake.set()
+    deadline = time.monotonic() + timeout
+    with _changed:
+        while pending_count() > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _changed.wait(timeout=min(remaining, 0.5))
+    return True
+
+# --- รักษายอดที่ยังไม่ได้ส่งเมื่อสำเนาถูกซิงก์ใหม่ ---
+@contextlib.contextmanager
+def preserve_pending(worksheet_name: str):
+    """
+    ครอบการเขียนทับสำเนาทั้งแท็บด้วยข้อมูลจาก Sheet (gsheet_utils._replace_from_values)
+    แล้วเขียนรายการในคิวที่ยังไม่ถึง Sheet ลงสำเนาซ้ำ ยอดที่หน้าจอและใบเสร็จเห็นจึงไม่ถอยกลับระหว่างรอส่ง
+    """
+    with _lock:
+        yield
+        _reapply(worksheet_name)
+
+def _reapply(worksheet_name: str):
+    rows = _connect().execute(
+        "SELECT id, operations, in_doubt, attempts FROM journal WHERE status IN (?, ?) ORDER BY id", (PENDING, SENDING),
+    ).fetchall()
+    header = replica_utils.get_header(worksheet_name) or []
+    for entry in _entries(rows):
+        operations = [operation for operation in entry["operations"] if operation[1] == worksheet_name]
+        if not operations:
+            continue
+        # แถวที่รายการนี้ต่อท้ายมีอยู่ในข้อมูลจาก Sheet แล้ว = รายการนี้ถึง Sheet แล้วทั้งรายการ ไม่ต้องเขียนซ้ำ
+        # (รายการที่กำลังส่ง/ไม่แน่ใจซึ่งไม่มีแถวต่อท้ายในแท็บนี้ อาจนับซ้ำได้ชั่วคราว จนกว่ารอบส่งจะเขียนค่าจาก Sheet
+        #  กลับลงสำเนา หรือ _resolve_in_doubt สั่งซิงก์ใหม่)
+        if header and any(kind == "append" and payload and replica_utils.lookup(worksheet_name, header[0], payload[0], header[0])
+                          for kind, _, payload in operations):
+            continue
+        gsheet_utils.SheetTransaction.from_operations(None, operations).apply_to_replica()
+
+# --- สถานะคิว ---
+def pending_count() -> int:
+    with _lock:
+        return _connect().execute(
+            "SELECT COUNT(*) FROM journal WHERE status IN (?, ?)", (PENDING, SENDING)).fetchone()[0]
+
+def get_status(key: str):
+    """สถานะของรายการล่าสุดที่มีรหัสอ้างอิง key (PENDING / SENDING / FLUSHED / FAILED / DISCARDED) หรือ None"""
+    with _lock:
+        row = _connect().execute("SELECT status FROM journal WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)).fetchone()
+    return row[0] if row else None
+
+def get_summary() -> dict:
+    """
+    {pending, failed, oldest_pending_s, last_error, worker_error, last_flush_ms, last_batch_size, journal_ms}
+    journal_ms = เวลาเฉลี่ยที่หน้าเว็บรอการบันทึกลงคิว, last_flush_ms = เวลาที่ API ใช้ส่งรอบล่าสุด
+    worker_error = Thread เบื้องหลังขัดข้องในรอบล่าสุด (None = ปกติ)
+    """
+    with _lock:
+        conn = _connect()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(created_at), MAX(last_error) FROM journal WHERE status IN (?, ?)", (PENDING, SENDING)).fetchone()
+        last = conn.execute(
+            "SELECT flush_ms, batch_size FROM journal WHERE status = ? AND flush_ms IS NOT NULL "
+            "ORDER BY flushed_at DESC LIMIT 1", (FLUSHED,)).fetchone()
+    return {
+        "pending": counts.get(PENDING, 0) + counts.get(SENDING, 0),
+        "failed": counts.get(FAILED, 0),
+        "oldest_pending_s": time.time() - oldest[0] if oldest[0] else 0.0,
+        "last_error": oldest[1],
+        "worker_error": _worker_error,
+        "last_flush_ms": last[0] if last else None,
+        "last_batch_size": last[1] if last else None,
+        "journal_ms": sum(_journal_ms) / len(_journal_ms) if _journal_ms else None,
+    }
+
+def list_entries(limit: int = 200) -> pd.DataFrame:
+    """รายการในคิวล่าสุด (ใหม่สุดก่อน) สำหรับหน้าแอดมิน"""
+    with _lock:
+        df = pd.read_sql_query(
+            "SELECT id, key, label, status, attempts, last_error, created_at, flushed_at, flush_ms, batch_size "
+            "FROM journal ORDER BY id DESC LIMIT ?", _connect(), params=(limit,))
+    for column in ("created_at", "flushed_at"):
+        df[column] = pd.to_datetime(df[column], unit="s", utc=True).dt.tz_convert("Asia/Bangkok").dt.tz_localize(None)
+    return df
+
+def retry(entry_id: int):
+    """ส่งรายการที่พักไว้อีกครั้ง (แอดมินตรวจแล้วว่ายังไม่ได้บันทึกใน Sheet)"""
+    with _lock:
+        _connect().execute(
+            "UPDATE journal SET status = ?, attempts = 0, next_attempt = 0, in_doubt = 0 WHERE id = ? AND status = ?",
+            (PENDING, entry_id, FAILED))
+    _wake.set()
+
+def discard(entry_id: int):
+    """ยกเลิกรายการที่พักไว้ แล้วให้สำเนาในเครื่องซิงก์ใหม่จาก Sheet (ทิ้งยอดที่เขียนไว้ล่วงหน้า)"""
+    with _lock:
+        _connect().execute("UPDATE journal SET status = ? WHERE id = ? AND status = ?", (DISCARDED, entry_id, FAILED))
+    gsheet_utils.reload_from_sheet()
+
+# --- แสดงสถานะใน Sidebar ---
+def render_status(_sh: gspread.Spreadsheet):
+    """สถานะคิวใน Sidebar (อัปเดตเองทุก STATUS_REFRESH วินาที) แยกเวลาที่หน้าเว็บรอ กับเวลาที่ API ใช้"""
+    if not WRITE_BEHIND:
+        return
+    ensure_worker(_sh)
+    with st.sidebar:
+        _status_panel()
+
+@st.fragment(run_every=STATUS_REFRESH)
+def _status_panel():
+    summary = get_summary()
+    st.markdown("**คิวส่งขึ้น Google Sheet**")
+    if summary["failed"]:
+        st.error(f"ส่งไม่สำเร็จ {summary['failed']:,} รายการ (ตรวจในหน้าเครื่องมือแอดมิน)")
+    if summary["worker_error"]:
+        st.error(f"ระบบส่งคิวขัดข้อง จะลองใหม่อัตโนมัติ: {summary['worker_error']}")
+    if summary["pending"]:
+        message = f"รอส่ง {summary['pending']:,} รายการ (เก่าสุด {summary['oldest_pending_s']:,.0f} วินาที)"
+        if summary["last_error"]:
+            message += f"\n\nกำลังลองใหม่: {summary['last_error']}"
+        st.warning(message)
+    else:
+        st.success("ส่งครบทุกรายการแล้ว")
+    parts = []
+    if summary["journal_ms"] is not None:
+        parts.append(f"บันทึกในเครื่อง {summary['journal_ms']:,.0f} ms/รายการ")
+    if summary["last_flush_ms"] is not None:
+        parts.append(f"ส่งขึ้น Sheet ล่าสุด {summary['last_flush_ms']:,.0f} ms ({summary['last_batch_size']:,} รายการ/คำขอ)")
+    if parts:
+        st.caption(" · ".join(parts))
@@ -0,0 +1,200 @@
+# ledger_utils.py
+# ยอดคงเหลือที่คำนวณจากแท็บประวัติ (PaymentHistory / SavingsHistory / ShareHistory) ซึ่งเป็นสมุดบัญชีแบบต่อท้ายอย่างเดียว
+# - เก็บยอดรวมต่อสมาชิก / ต่อสัญญาไว้ในหน่วยความจำ และบวกเฉพาะแถวใหม่ที่ต่อท้ายเข้ามา (ไม่อ่านทั้งแท็บซ้ำ)
+# - ใช้ตรวจยอดในเซลล์ Members.Savings/Shares และ Loans.AmountPaid/InterestPaid ว่าตรงกับประวัติหรือไม่
+#
+# ถ้าแถวเดิมในแท็บประวัติเปลี่ยน (ลบแถว หรือซิงก์ทั้งแท็บใหม่) จะคำนวณแท็บนั้นใหม่ทั้งหมด
+# ขณะดู Snapshot (snapshot_utils) จะคำนวณจากไฟล์ Snapshot ครั้งเดียว แยกจากยอดของข้อมูลจริง
+import threading
+
+import gspread
+import pandas as pd
+import streamlit as st
+
+import gsheet_utils
+import perf_utils
+import replica_utils
+
+# --- ค่าคงที่ ---
+# แท็บประวัติ -> [(คอลัมน์ที่ใช้จัดกลุ่ม, {ชื่อยอด: คอลัมน์จำนวนเงิน})]
+# MONTH = จัดกลุ่มตามเดือนของ Timestamp ("YYYY-MM") สำหรับดูแนวโน้ม
+MONTH = "Month"
+LEDGER_VIEWS = {
+    "SavingsHistory": [("MemberID", {"Savings": "Amount"}), (MONTH, {"Deposits": "Amount"})],
+    "ShareHistory": [("MemberID", {"Shares": "Amount"}), (MONTH, {"SharePurchases": "Amount"})],
+    "PaymentHistory": [
+        ("MemberID", {"PrincipalPaid": "PrincipalPaid", "InterestPaid": "InterestPaid"}),
+        ("LoanID", {"AmountPaid": "PrincipalPaid", "InterestPaid": "InterestPaid"}),
+        (MONTH, {"PrincipalPaid": "PrincipalPaid", "InterestPaid": "InterestPaid"}),
+    ],
+}
+MONTHLY_FIELDS = ["Deposits", "SharePurchases", "PrincipalPaid", "InterestPaid"]
+MEMBER_FIELDS = ["Savings", "Shares", "PrincipalPaid", "InterestPaid"]
+LOAN_FIELDS = ["AmountPaid", "InterestPaid"]
+# ยอดในเซลล์ที่ตรวจกับประวัติ: (แท็บ, คอลัมน์ ID, คอลัมน์ยอด, แท็บประวัติ, คอลัมน์ที่จัดกลุ่ม, ชื่อยอดในประวัติ)
+RECONCILED_COLUMNS = [
+    ("Members", "MemberID", "Savings", "SavingsHistory", "MemberID", "Savings"),
+    ("Members", "MemberID", "Shares", "ShareHistory", "MemberID", "Shares"),
+    ("Loans", "LoanID", "AmountPaid", "PaymentHistory", "LoanID", "AmountPaid"),
+    ("Loans", "LoanID", "InterestPaid", "PaymentHistory", "LoanID", "InterestPaid"),
+]
+TOLERANCE = 0.005  # (บาท) ต่างกันไม่เกินนี้ถือว่าตรงกัน
+
+
+class _LedgerState:
+    """ยอดรวมของแท็บประวัติ 1 แท็บ และตำแหน่งแถวสุดท้ายที่บวกไปแล้ว"""
+    def __init__(self, worksheet_name: str):
+        self.worksheet_name = worksheet_name
+        self.generation = gsheet_utils.sync_version(worksheet_name)
+        self.last_row = 1  # แถวหัวตาราง = ยังไม่ได้บวกแถวไหน
+        self.last_values = None
+        self.totals = {id_column: {} for id_column, _ in LEDGER_VIEWS[worksheet_name]}
+
+_states = {}  # แหล่งข้อมูล (None = ข้อมูลจริง หรือโฟลเดอร์ Snapshot) -> {แท็บประวัติ: _LedgerState}
+_lock = threading.Lock()
+
+# --- ฟังก์ชัน Helper ---
+def _key(value) -> str:
+    # ให้ตรงกับ ID ที่ schema_utils แปลงเป็นข้อความ (เช่น 12.0 -> "12")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return "" if value is None else str(value)
+
+def _amount(value) -> float:
+    try:
+        return gsheet_utils.safe_float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _fold(state: _LedgerState, header: list, rows: list):
+    """บวกแถวประวัติเข้าไปในยอดรวม"""
+    views = []
+    for id_column, fields in LEDGER_VIEWS[state.worksheet_name]:
+        group_column = "Timestamp" if id_column == MONTH else id_column
+        if group_column not in header:
+            continue
+        key = (lambda v: str(v)[:7]) if id_column == MONTH else _key
+        positions = {name: header.index(column) for name, column in fields.items() if column in header}
+        views.append((header.index(group_column), key, positions, state.totals[id_column]))
+    for _, values in rows:
+        for id_position, key, positions, totals in views:
+            entry = totals.setdefault(key(values[id_position]), dict.fromkeys(positions, 0.0))
+            for name, position in positions.items():
+                entry[name] += _amount(values[position])
+
+def _current_states() -> dict:
+    return _states.setdefault(gsheet_utils.active_snapshot(), {})
+
+def _refresh_snapshot(_sh: gspread.Spreadsheet, states: dict) -> int:
+    # Snapshot ไม่เปลี่ยนแปลง คำนวณครั้งเดียวจากไฟล์ทั้งแท็บ
+    folded = 0
+    for worksheet_name in LEDGER_VIEWS:
+        if worksheet_name in states:
+            continue
+        df = gsheet_utils.get_data_as_dataframe(worksheet_name, _sh)
+        state = _LedgerState(worksheet_name)
+        rows = list(enumerate(df.itertuples(index=False, name=None), start=2))
+        _fold(state, list(df.columns), rows)
+        states[worksheet_name] = state
+        folded += len(rows)
+    return folded
+
+# --- บวกเฉพาะแถวใหม่ ---
+@perf_utils.instrument
+def refresh(_sh: gspread.Spreadsheet) -> int:
+    """อัปเดตยอดรวมจากแถวประวัติที่ต่อท้ายเข้ามาใหม่ คืนค่าจำนวนแถวที่บวกเพิ่ม"""
+    if gsheet_utils.active_snapshot() is not None:
+        with _lock:
+            return _refresh_snapshot(_sh, _current_states())
+    folded = 0
+    for worksheet_name in LEDGER_VIEWS:
+        gsheet_utils.ensure_replica(worksheet_name, _sh)
+        header = replica_utils.get_header(worksheet_name) or []
+        with _lock:
+            states = _current_states()
+            state = states.get(worksheet_name)
+            if state is None or state.generation != gsheet_utils.sync_version(worksheet_name):
+                state = states[worksheet_name] = _LedgerState(worksheet_name)
+            rows = replica_utils.rows_from(worksheet_name, state.last_row)
+            if state.last_values is not None:
+                # แถวสุดท้ายที่บวกไปแล้วต้องยังอยู่ที่เดิม ไม่อย่างนั้นแถวถูกลบ/แก้ ให้เริ่มใหม่ทั้งแท็บ
+                if not rows or rows[0] != (state.last_row, state.last_values):
+                    state = states[worksheet_name] = _LedgerState(worksheet_name)
+                    rows = replica_utils.rows_from(worksheet_name, 2)
+                else:
+                    rows = rows[1:]
+            if rows:
+                _fold(state, header, rows)
+                state.last_row, state.last_values = rows[-1]
+                folded += len(rows)
+    return folded
+
+# --- อ่านยอดคงเหลือ ---
+def get_member_balances(_sh: gspread.Spreadsheet, member_id: str) -> dict:
+    """ยอดตามประวัติของสมาชิก {Savings, Shares, PrincipalPaid, InterestPaid}"""
+    refresh(_sh)
+    balances = dict.fromkeys(MEMBER_FIELDS, 0.0)
+    with _lock:
+        for state in _current_states().values():
+            balances.update(state.totals.get("MemberID", {}).get(str(member_id), {}))
+    return balances
+
+def get_loan_balances(_sh: gspread.Spreadsheet, loan_id: str) -> dict:
+    """ยอดที่ชำระแล้วตามประวัติของสัญญา {AmountPaid, InterestPaid}"""
+    refresh(_sh)
+    balances = dict.fromkeys(LOAN_FIELDS, 0.0)
+    with _lock:
+        state = _current_states().get("PaymentHistory")
+        if state is not None:
+            balances.update(state.totals["LoanID"].get(str(loan_id), {}))
+    return balances
+
+def get_monthly_totals(_sh: gspread.Spreadsheet) -> pd.DataFrame:
+    """ยอดรวมรายเดือน (index = "YYYY-MM") คอลัมน์ตาม MONTHLY_FIELDS"""
+    refresh(_sh)
+    monthly = {}
+    with _lock:
+        for state in _current_states().values():
+            for month, fields in state.totals.get(MONTH, {}).items():
+                monthly.setdefault(month, {}).update(fields)
+    df = pd.DataFrame.from_dict(monthly, orient="index").reindex(columns=MONTHLY_FIELDS).fillna(0.0)
+    df.index = df.index.astype(str)
+    # แถวที่ Timestamp ว่างหรือผิดรูปแบบไม่นับเป็นเดือน
+    df = df[df.index.str.match(r"^\d{4}-\d{2}$")]
+    return df.sort_index().rename_axis("Month")
+
+# --- ตรวจยอดในเซลล์กับประวัติ ---
+@perf_utils.instrument(cached=True)
+def reconcile(_sh: gspread.Spreadsheet) -> pd.DataFrame:
+    versions = tuple(gsheet_utils.data_version(name) for name in ["Members", "Loans", *LEDGER_VIEWS])
+    return _reconcile(_sh, versions)
+
+@st.cache_data(ttl=300)
+@perf_utils.cache_miss
+def _reconcile(_sh: gspread.Spreadsheet, versions: tuple) -> pd.DataFrame:
+    """
+    รายการที่ยอดในเซลล์ไม่ตรงกับผลรวมจากประวัติ
+    คอลัมน์: Sheet, ID, Column, CellValue, LedgerValue, Difference
+    (ยอดยกมาก่อนเริ่มบันทึกประวัติจะแสดงเป็นส่วนต่างด้วย)
+    """
+    refresh(_sh)
+    frames = []
+    for worksheet_name, id_column, column, ledger_name, group_column, field in RECONCILED_COLUMNS:
+        df = gsheet_utils.get_data_as_dataframe(worksheet_name, _sh)
+        if df.empty or column not in df.columns:
+            continue
+        # สัญญาหนึ่งอาจมีหลายแถว ยอดชำระของสัญญาคือผลรวมทุกแถว
+        cells = df.groupby(df[id_column].astype(str), sort=False)[column].sum()
+        with _lock:
+            totals = _current_states()[ledger_name].totals.get(group_column, {})
+            ledger = pd.Series({k: v.get(field, 0.0) for k, v in totals.items()}, dtype="float64")
+        ledger = ledger.reindex(cells.index, fill_value=0.0)
+        frames.append(pd.DataFrame({
+            "Sheet": worksheet_name, "ID": cells.index, "Column": column,
+            "CellValue": cells.to_numpy(), "LedgerValue": ledger.to_numpy(),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["Sheet", "ID", "Column", "CellValue", "LedgerValue", "Difference"])
+    result = pd.concat(frames, ignore_index=True)
+    result["Difference"] = result["CellValue"] - result["LedgerValue"]
+    return result[result["Difference"].abs() > TOLERANCE].reset_index(drop=True)
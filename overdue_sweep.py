@@ -0,0 +1,102 @@
+# overdue_sweep.py
+# ปรับสถานะสัญญาที่เลยวันครบกำหนดแล้วเป็น "เกินกำหนดชำระ" โดยไม่ต้องเปิดหน้าเว็บ
+# ใช้ชั้นข้อมูลเดียวกับแอป (gsheet_utils): อ่านแท็บ Loans 1 ครั้ง แล้วเขียนสถานะทั้งหมดในคำขอเดียว
+#
+# วิธีใช้:
+#   python overdue_sweep.py                          # ใช้ Secrets เดียวกับแอป (.streamlit/secrets.toml)
+#   python overdue_sweep.py --credentials key.json   # ใช้ไฟล์ Service Account
+#   python overdue_sweep.py --dry-run                # แสดงรายการอย่างเดียว ไม่เขียนลง Sheet
+#
+# ตั้งเวลาด้วย cron (ทุกวัน 00:15 เวลาไทย):
+#   15 0 * * * cd /path/to/app && python overdue_sweep.py >> overdue_sweep.log 2>&1
+#
+# สคริปต์นี้ไม่ส่งคิว journal ของแอป (journal_utils.HEADLESS) ถ้าแอปยังมีรายการรอส่งอยู่จะหยุดแล้วให้ cron รอบถัดไปทำแทน
+import argparse
+import json
+import sys
+from datetime import datetime, date
+
+import pandas as pd
+from pytz import timezone
+
+# --- ค่าคงที่ ---
+ACTIVE_STATUSES = ['Active', 'ยังค้างชำระ']
+OVERDUE_STATUS = "เกินกำหนดชำระ"
+BANGKOK_TZ = timezone("Asia/Bangkok")
+
+# --- ฟังก์ชัน Helper ---
+def find_overdue_loans(loans_df: pd.DataFrame, today: date) -> pd.DataFrame:
+    """สัญญาที่ครบกำหนดแล้ว (DueDate <= today) แต่สถานะยังเป็นค้างชำระ"""
+    if loans_df.empty:
+        return loans_df
+    return loans_df[
+        (loans_df['DueDate'] <= pd.Timestamp(today)) &
+        (loans_df['Status'].isin(ACTIVE_STATUSES))
+    ].copy()
+
+def _log(message: str):
+    print(f"[{datetime.now(BANGKOK_TZ):%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+def _open_spreadsheet(credentials_path: str):
+    import gsheet_utils
+    if credentials_path:
+        with open(credentials_path, encoding="utf-8") as f:
+            return gsheet_utils.open_spreadsheet(json.load(f))
+    import streamlit as st
+    return gsheet_utils.open_spreadsheet(dict(st.secrets["gcp_service_account"]))
+
+# --- รันแบบ Command Line ---
+def run_sweep(_sh, today: date, dry_run: bool = False) -> int:
+    """คืนค่า exit code (0 = สำเร็จ)"""
+    import gsheet_utils
+    import journal_utils
+    # คิวเป็นของแอป: ไม่กู้/ไม่ส่งจาก Process นี้ (อาจถูกปิดกลางการส่งเมื่อจบสคริปต์)
+    journal_utils.HEADLESS = True
+    # โหลดแท็บ Loans ล่าสุดจาก Sheet (1 คำขอ) ไม่ใช้สำเนาเก่าในเครื่อง
+    gsheet_utils.prefetch_all_sheets(_sh, ["Loans"], force=True)
+    loans_df = gsheet_utils.get_data_as_dataframe("Loans", _sh)
+    overdue = find_overdue_loans(loans_df, today)
+    loan_ids = overdue['LoanID'].astype(str).unique().tolist() if not overdue.empty else []
+    _log(f"ตรวจสอบ {loans_df['LoanID'].nunique() if not loans_df.empty else 0} สัญญา ณ วันที่ {today}: "
+         f"พบเกินกำหนด {len(loan_ids)} สัญญา")
+    if not loan_ids:
+        return 0
+    if dry_run:
+        for loan in overdue.drop_duplicates('LoanID').itertuples(index=False):
+            _log(f"  {loan.LoanID} | สมาชิก {loan.MemberID} | บัญชี {loan.LoanAccount} | ครบกำหนด {loan.DueDate:%Y-%m-%d}")
+        _log("--dry-run: ไม่ได้เขียนลง Sheet")
+        return 0
+
+    pending = journal_utils.pending_count()
+    if pending > 0:
+        _log(f"ข้ามรอบนี้: แอปยังมี {pending} รายการรอส่งขึ้น Sheet (journal) เขียนตอนนี้อาจทับยอดที่ยังไม่ได้ส่ง")
+        return 1
+    # st.warning/st.error ไม่แสดงผลนอก `streamlit run` ให้ชั้นข้อมูลส่งสาเหตุมาลง log แทน
+    changed_rows = gsheet_utils.update_loans_status_bulk(_sh, loan_ids, OVERDUE_STATUS, chunk_size=None,
+                                                         error_callback=_log)
+    if changed_rows is None:
+        _log("อัปเดตสถานะไม่สำเร็จ")
+        return 1
+    _log(f"อัปเดตสถานะเป็น '{OVERDUE_STATUS}' เรียบร้อย {changed_rows} แถว ({len(loan_ids)} สัญญา)")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ปรับสถานะสัญญาเงินกู้ที่เลยวันครบกำหนดเป็น 'เกินกำหนดชำระ'")
+    parser.add_argument("--credentials", help="ไฟล์ JSON ของ Service Account (ไม่ระบุ = ใช้ Secrets ของ Streamlit)")
+    parser.add_argument("--date", type=date.fromisoformat, help="ตรวจสอบ ณ วันที่ (YYYY-MM-DD) ค่าเริ่มต้น = วันนี้ตามเวลาไทย")
+    parser.add_argument("--dry-run", action="store_true", help="แสดงรายการอย่างเดียว ไม่เขียนลง Sheet")
+    args = parser.parse_args(argv)
+
+    from streamlit import logger as st_logger
+    # ปิดคำเตือนของ Streamlit เมื่อรันนอก `streamlit run` (gsheet_utils จึง import ภายในฟังก์ชัน หลังบรรทัดนี้)
+    st_logger.set_log_level("error")
+    try:
+        _sh = _open_spreadsheet(args.credentials)
+    except Exception as e:
+        _log(f"เชื่อมต่อ Google Sheet ไม่สำเร็จ: {e}")
+        return 2
+    return run_sweep(_sh, args.date or datetime.now(BANGKOK_TZ).date(), args.dry_run)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
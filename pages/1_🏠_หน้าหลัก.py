@@ -1,7 +1,13 @@
 # pages/1_🏠_หน้าหลัก.py
 import streamlit as st
 import gsheet_utils
+import journal_utils
+import interest_utils
+import ledger_utils
+import perf_utils
 import pdf_utils
+import receipt_utils
+import search_utils
 from datetime import datetime, date, timedelta
 from babel.dates import format_date
 from pytz import timezone
@@ -17,12 +23,16 @@ THAI_HEADERS = {
     "LastSharePurchaseDate": "ซื้อหุ้นล่าสุด",
     "LastUpdated": "อัปเดตล่าสุด"
 }
+MEMBER_SORT_OPTIONS = {
+    "ลำดับในชีท": None, "ชื่อ-สกุล": "Name", "หมู่บ้าน": "Village", "อำเภอ": "District",
+    "เงินฝากสัจจะ": "Savings", "หุ้นสะสม": "Shares", "อัปเดตล่าสุด": "LastUpdated"
+}
 
 # --- 2. การตั้งค่าและฟังก์ชัน Helper ---
 st.set_page_config(page_title="ระบบจัดการสมาชิก", page_icon="🗂️", layout="wide")
 
 def format_thai_date(dt):
-    if dt is None: return "ไม่ได้ระบุ"
+    if dt is None or dt is pd.NaT: return "ไม่ได้ระบุ"
     if isinstance(dt, str):
         try: dt = datetime.strptime(dt, "%Y-%m-%d").date()
         except ValueError:
@@ -43,11 +53,12 @@ def get_address_suggestions(_sh):
         "provinces": sorted(df["Province"].dropna().unique().tolist())
     }
 
-def safe_float(value):
-    return float(value) if value not in [None, ''] else 0.0
-
 # --- 3. เชื่อมต่อและเตรียมข้อมูล ---
+perf_utils.start_rerun("หน้าหลัก")
 _sh = gsheet_utils.connect_to_sheet()
+gsheet_utils.use_snapshot(None)  # หน้าทำรายการใช้ข้อมูลจริงเสมอ (Snapshot เลือกได้เฉพาะหน้ารายงาน)
+# รายการรับเงินบันทึกลงคิวในเครื่องแล้วตอบทันที สถานะการส่งขึ้น Sheet แสดงใน Sidebar
+journal_utils.render_status(_sh)
 address_data = get_address_suggestions(_sh)
 
 st.title("🏠 หน้าหลัก: จัดการข้อมูล")
@@ -72,7 +83,7 @@ with st.form("add_member_form", clear_on_submit=True):
         today = date.today()
         dob = st.date_input("วันเดือนปีเกิด", value=None, format="DD/MM/YYYY",
                             min_value=date(today.year - 100, 1, 1), max_value=today)
-        member_id = f"M-{int(datetime.now().timestamp())}"
+        member_id = gsheet_utils.new_id("M")
     st.subheader("ส่วนที่ 2: ข้อมูลการเงิน (เริ่มต้น)")
     col_a, col_b = st.columns(2)
     with col_a: savings = st.number_input("เงินฝากสัจจะ (เริ่มต้น)", min_value=0.0, step=100.0)
@@ -105,7 +116,7 @@ if submitted:
             ""             # <-- LastSharePurchaseDate (ตำแหน่งที่ 12)
         ]
 
-        if gsheet_utils.add_row_to_sheet("Members", _sh, new_row_data):
+        if gsheet_utils.SheetTransaction(_sh).append_row("Members", new_row_data).commit_later(f"สมัครสมาชิก {name}", key=member_id):
             st.success(f"บันทึกข้อมูลคุณ '{name}' เรียบร้อย!")
             get_address_suggestions.clear()
         else:
@@ -114,22 +125,51 @@ if submitted:
 # --- 6. ส่วนของการแสดงข้อมูลทั้งหมด ---
 st.header("2. ข้อมูลสมาชิกทั้งหมด")
 if st.button("รีเฟรชข้อมูลสมาชิก"):
-    gsheet_utils.clear_all_caches()
+    gsheet_utils.reload_from_sheet()
     st.rerun()
 st.info("💡 หากต้องการ 'เพิ่มสัญญาเงินกู้ใหม่', แก้ไข หรือ ลบข้อมูลสมาชิก กรุณาไปที่เมนู '✏️ แก้ไขและลบข้อมูล' ด้านซ้ายมือ")
-members_df = gsheet_utils.get_data_as_dataframe("Members", _sh)
+member_filter_options = search_utils.get_member_filter_options(_sh)
 
-if members_df.empty:
+if member_filter_options["total"] == 0:
     st.info("ยังไม่มีข้อมูลสมาชิกในระบบ")
 else:
-    display_df = members_df.rename(columns=THAI_HEADERS)
+    # กรองและเรียงฝั่งเซิร์ฟเวอร์ (Cache ไว้) แล้วแปลงคอลัมน์เฉพาะแถวของหน้าที่แสดง
+    with st.expander("🔎 กรอง / เรียงข้อมูล"):
+        col_f1, col_f2, col_f3 = st.columns(3)
+        with col_f1:
+            filter_villages = st.multiselect("หมู่บ้าน", member_filter_options["villages"], key="member_table_villages")
+            filter_districts = st.multiselect("อำเภอ", member_filter_options["districts"], key="member_table_districts")
+        with col_f2:
+            max_savings = max(member_filter_options["max_savings"], 0.0)
+            filter_savings = st.slider("เงินฝากสัจจะ (บาท)", 0.0, max_savings, (0.0, max_savings),
+                                       key="member_table_savings") if max_savings > 0 else None
+            filter_updated = st.date_input("อัปเดตตั้งแต่วันที่", value=None, format="DD/MM/YYYY", key="member_table_updated")
+        with col_f3:
+            sort_label = st.selectbox("เรียงตาม", list(MEMBER_SORT_OPTIONS.keys()), key="member_table_sort")
+            sort_ascending = st.radio("ลำดับ", ("น้อยไปมาก", "มากไปน้อย"), horizontal=True, key="member_table_order") == "น้อยไปมาก"
+            page_size = st.selectbox("แถวต่อหน้า", (25, 50, 100, 200), index=1, key="member_table_page_size")
+
+    member_filters = dict(
+        villages=filter_villages, districts=filter_districts,
+        savings_range=filter_savings if filter_savings != (0.0, member_filter_options["max_savings"]) else None,
+        updated_since=filter_updated, sort_by=MEMBER_SORT_OPTIONS[sort_label], ascending=sort_ascending,
+    )
+    _, filtered_total = search_utils.get_member_page(_sh, page=1, page_size=page_size, **member_filters)
+    page_count = max(1, math.ceil(filtered_total / page_size))
+    if st.session_state.get("member_table_page", 1) > page_count:
+        st.session_state.member_table_page = 1  # ตัวกรองเปลี่ยนจนหน้าที่เลือกไว้ไม่มีแล้ว
+    page_number = st.number_input(f"หน้า (จาก {page_count})", min_value=1, max_value=page_count, value=1,
+                                  key="member_table_page") if page_count > 1 else 1
+    page_df, _ = search_utils.get_member_page(_sh, page=page_number, page_size=page_size, **member_filters)
+
+    display_df = page_df.rename(columns=THAI_HEADERS)
 
     if "หุ้นสะสม (บาท)" in display_df.columns:
-        numeric_shares = pd.to_numeric(display_df["หุ้นสะสม (บาท)"], errors='coerce')
-        safe_shares = numeric_shares.fillna(0)
-        display_df.loc[:, "หุ้น (หน่วย)"] = (safe_shares / 50).astype(int)
+        display_df.loc[:, "หุ้น (หน่วย)"] = (display_df["หุ้นสะสม (บาท)"] / 50).astype(int)
+    for date_col in ["วันเกิด (ป-ด-ว)", "ซื้อหุ้นล่าสุด"]:
+        if date_col in display_df.columns:
+            display_df[date_col] = display_df[date_col].dt.date
 
-    display_df.index = range(1, len(display_df) + 1)
     display_df.index.name = "ลำดับ"
 
     display_columns = [col for col in THAI_HEADERS.values() if col in display_df.columns]
@@ -140,6 +180,9 @@ else:
         except ValueError:
             pass
 
+    first_row = (page_number - 1) * page_size
+    st.caption(f"แสดง {min(first_row + 1, filtered_total):,}-{min(first_row + page_size, filtered_total):,} "
+               f"จาก {filtered_total:,} คน (สมาชิกทั้งหมด {member_filter_options['total']:,} คน)")
     st.dataframe(display_df[display_columns], use_container_width=True)
 
 # --- 7. ส่วนตรวจสอบยอดและทำธุรกรรม ---
@@ -151,17 +194,12 @@ members_df_for_payment = gsheet_utils.get_data_as_dataframe("Members", _sh)
 if members_df_for_payment.empty:
     st.info("กรุณาเพิ่มข้อมูลสมาชิกก่อน")
 else:
-    member_names = members_df_for_payment["Name"].tolist()
-    selected_name = st.selectbox(
-        "เลือกสมาชิก:",
-        options=member_names,
-        index=None,
-        placeholder="กรุณาเลือกชื่อ...",
-        key="transaction_member_name"
-    )
+    # ค้นหาจากดัชนี (ชื่อ/รหัส/หมู่บ้าน) แล้วได้ MemberID กลับมาตรงๆ ชื่อซ้ำกันก็เลือกถูกคน
+    selected_member_id = search_utils.member_selector(_sh, key="transaction_member_id")
+    member_info = gsheet_utils.get_member_by_id(_sh, selected_member_id) if selected_member_id else None
+    selected_name = member_info["Name"] if member_info else None
 
     if selected_name:
-        member_info = members_df_for_payment[members_df_for_payment["Name"] == selected_name].to_dict('records')[0]
         member_id = member_info["MemberID"]
         bangkok_tz = timezone("Asia/Bangkok")
 
@@ -178,30 +216,19 @@ else:
         if transaction_type == "ชำระหนี้เงินกู้":
             st.subheader(f"ชำระหนี้เงินกู้ (คุณ: {selected_name})")
 
-            active_loans_df = gsheet_utils.get_active_loans_by_member(_sh, member_id)
+            # สรุปยอดต่อสัญญา (1 แถวต่อ LoanID) จาก gsheet_utils + ดอกเบี้ยจาก interest_utils
+            loan_summary_df = interest_utils.add_interest_columns(_sh, gsheet_utils.get_loan_summary_by_member(_sh, member_id))
 
-            if active_loans_df.empty:
+            if loan_summary_df.empty:
                 st.success("✅ สมาชิกท่านนี้ไม่มีสัญญาเงินกู้ที่ยังค้างชำระ")
             else:
                 loan_options = {}
-                unique_loan_ids = active_loans_df['LoanID'].unique() 
-
-                for loan_id in unique_loan_ids:
-                    loan_group = active_loans_df[active_loans_df['LoanID'] == loan_id]
-                    details = loan_group.iloc[0]
-                    loan_account = details['LoanAccount']
-                    due_date_str = str(details['DueDate'])
-                    due_date = format_thai_date(due_date_str)
-                    
-                    principal = safe_float(loan_group['PrincipalAmount'].sum())
-                    paid = safe_float(loan_group['AmountPaid'].sum())
-                    remaining = principal - paid
-                    
+                for loan in loan_summary_df.itertuples(index=False):
                     option_label = (
-                        f"ID: {loan_id} | บช.{loan_account} | ต้น: {principal:,.0f} | "
-                        f"ค้าง: {remaining:,.0f} | ครบกำหนด: {due_date}"
+                        f"ID: {loan.LoanID} | บช.{loan.LoanAccount} | ต้น: {loan.PrincipalAmount:,.0f} | "
+                        f"ค้าง: {loan.Remaining:,.0f} | ครบกำหนด: {format_thai_date(loan.DueDate)}"
                     )
-                    loan_options[option_label] = loan_id
+                    loan_options[option_label] = loan.LoanID
                 
                 selected_loan_label = st.selectbox(
                     "เลือกสัญญาที่ต้องการชำระ:",
@@ -213,15 +240,15 @@ else:
                 if selected_loan_label:
                     selected_loan_id = loan_options[selected_loan_label]
                     
-                    selected_loans_group = active_loans_df[active_loans_df['LoanID'] == selected_loan_id]
+                    selected_loan = loan_summary_df.set_index('LoanID').loc[selected_loan_id]
                     
-                    principal_amount = safe_float(selected_loans_group['PrincipalAmount'].sum())
-                    amount_paid_so_far = safe_float(selected_loans_group['AmountPaid'].sum())
-                    interest_paid_so_far = safe_float(selected_loans_group['InterestPaid'].sum())
-                    remaining_principal = principal_amount - amount_paid_so_far
-                    interest_due_for_this_loan = principal_amount * 0.06
+                    principal_amount = float(selected_loan['PrincipalAmount'])
+                    interest_paid_so_far = float(selected_loan['InterestPaid'])
+                    remaining_principal = float(selected_loan['Remaining'])
+                    # อัตราดอกเบี้ยตามบัญชี/รอบสัญญาที่ตั้งไว้ใน SystemConfig
+                    interest_due_for_this_loan = float(selected_loan['InterestDue'])
                     remaining_interest = interest_due_for_this_loan - interest_paid_so_far
-                    loan_account_display = selected_loans_group.iloc[0]['LoanAccount']
+                    loan_account_display = selected_loan['LoanAccount']
 
                     st.info(f"สัญญาที่เลือก: ID {selected_loan_id} | บัญชี {loan_account_display}")
                     col_m1, col_m2, col_m3 = st.columns(3)
@@ -250,24 +277,32 @@ else:
                     if payment_submitted:
                         timestamp_str = datetime.now(bangkok_tz).strftime("%Y-%m-%d %H:%M:%S")
 
-                        transaction_id = f"T-{int(datetime.now().timestamp())}"
+                        transaction_id = gsheet_utils.new_id("T")
                         payment_row = [
                             transaction_id, timestamp_str, member_id,
                             selected_loan_id,
                             principal_paid_input, interest_paid_input
                         ]
-                        
-                        gsheet_utils.add_row_to_sheet("PaymentHistory", _sh, payment_row)
-                        gsheet_utils.update_loan_payment(_sh, selected_loan_id, principal_paid_input, interest_paid_input)
 
-                        new_total_paid = amount_paid_so_far + principal_paid_input
-                        if new_total_paid >= principal_amount:
-                            gsheet_utils.update_loan_status(_sh, selected_loan_id, "ชำระครบแล้ว")
+                        # รวมการเขียนทั้งหมดของการชำระครั้งนี้ แล้วส่งไป Google Sheet ในคำขอเดียว
+                        # สถานะ "ชำระครบแล้ว" ตัดสินจากยอดล่าสุดตอนเขียน ไม่ใช่ยอดที่หน้านี้โหลดไว้
+                        payment_tx = gsheet_utils.SheetTransaction(_sh)
+                        payment_tx.append_row("PaymentHistory", payment_row)
+                        payment_tx.increment("Loans", "LoanID", selected_loan_id, {
+                            "AmountPaid": principal_paid_input, "InterestPaid": interest_paid_input
+                        })
+                        payment_tx.update_when_paid("Loans", "LoanID", selected_loan_id, {"Status": "ชำระครบแล้ว"})
+                        payment_tx.update("Members", "MemberID", member_id, {"LastUpdated": timestamp_str})
+                        if not payment_tx.commit_later(f"ชำระเงินกู้ {selected_loan_id}", key=transaction_id):
+                            st.stop()
+
+                        # สัญญาที่ปิดแล้วจะไม่อยู่ในสรุปสัญญาที่ยังค้างชำระ (สำเนาในเครื่องได้ผลของธุรกรรมแล้ว)
+                        loan_summary_after = gsheet_utils.get_loan_summary_by_member(_sh, member_id)
+                        fully_paid = selected_loan_id not in set(loan_summary_after['LoanID'].astype(str))
+                        if fully_paid:
                             st.success(f"บันทึกการชำระเงินสำหรับสัญญา {selected_loan_id} เรียบร้อย และสถานะถูกเปลี่ยนเป็น 'ชำระครบแล้ว'!")
                         else:
                              st.success(f"บันทึกการชำระเงินสำหรับสัญญา {selected_loan_id} เรียบร้อย!")
-
-                        gsheet_utils.update_member_data("Members", _sh, member_id, "MemberID", {"LastUpdated": timestamp_str})
                         
                         latest_member_info = gsheet_utils.get_member_by_id(_sh, member_id)
                         
@@ -278,24 +313,22 @@ else:
                             receipt_line_items.append({'label': f"ดอกเบี้ย บัญชี {loan_account_display}", 'amount': interest_paid_input})
                         
                         receipt_balances = []
-                        remaining_loans_df = gsheet_utils.get_active_loans_by_member(_sh, member_id)
-                        if remaining_loans_df.empty:
+                        remaining_summary_df = loan_summary_after[loan_summary_after['Remaining'] > 0]
+                        if remaining_summary_df.empty:
                              receipt_balances.append({'label': 'ยอดหนี้คงเหลือทั้งหมด', 'amount': 0, 'unit': 'บาท'})
                         else:
-                            for l_id in remaining_loans_df['LoanID'].unique():
-                                grp = remaining_loans_df[remaining_loans_df['LoanID'] == l_id]
-                                p = safe_float(grp['PrincipalAmount'].sum())
-                                a = safe_float(grp['AmountPaid'].sum())
-                                r = p - a
-                                if r > 0: 
-                                   receipt_balances.append({'label': f'ยอดค้าง สัญญา {l_id}', 'amount': r, 'unit': 'บาท'})
+                            receipt_balances = [
+                                {'label': f'ยอดค้าง สัญญา {l_id}', 'amount': float(r), 'unit': 'บาท'}
+                                for l_id, r in zip(remaining_summary_df['LoanID'], remaining_summary_df['Remaining'])
+                            ]
                         
                         st.session_state['receipt_data'] = {
                             "member_info": latest_member_info,
                             "payment_date": format_thai_date(payment_date),
                             "line_items": receipt_line_items,
                             "balance_summary": receipt_balances,
-                            "loan_id": selected_loan_id
+                            "loan_id": selected_loan_id,
+                            "transaction_id": transaction_id
                         }
                         st.rerun()
 
@@ -308,7 +341,7 @@ else:
             today = date.today()
             purchase_period_start = date(today.year, 11, 5) # (เดือน 11, วันที่ 5)
 
-            current_shares_baht = safe_float(member_info.get('Shares'))
+            current_shares_baht = float(member_info.get('Shares', 0))
             current_shares_units = int(current_shares_baht / 50)
 
             col_share1, col_share2 = st.columns(2)
@@ -324,18 +357,9 @@ else:
                 st.info(f"รอบการซื้อหุ้นสำหรับปี {today.year} จะเริ่มในวันที่ 5 พฤศจิกายน {today.year} ครับ")
 
             else:
-                last_purchase_str = member_info.get("LastSharePurchaseDate")
-                needs_to_buy = False
-
-                if not last_purchase_str or last_purchase_str == "":
-                    needs_to_buy = True
-                else:
-                    try:
-                        last_purchase_date = datetime.strptime(last_purchase_str, "%Y-%m-%d").date()
-                        if last_purchase_date.year < today.year:
-                            needs_to_buy = True
-                    except ValueError:
-                        needs_to_buy = True
+                # LastSharePurchaseDate ถูกแปลงเป็นวันที่ตั้งแต่ตอนโหลด (ว่าง = None)
+                last_purchase_date = member_info.get("LastSharePurchaseDate")
+                needs_to_buy = last_purchase_date is None or last_purchase_date.year < today.year
 
                 if needs_to_buy:
                     st.warning(f"**สถานะ:** อยู่ในช่วงที่สามารถซื้อหุ้นรอบปี {today.year} ได้")
@@ -351,17 +375,18 @@ else:
                             timestamp_str = datetime.now(bangkok_tz).strftime("%Y-%m-%d %H:%M:%S")
                             today_str = date.today().strftime("%Y-%m-%d")
 
-                            new_share_balance = current_shares_baht + 100
-                            updates = {
-                                "Shares": new_share_balance,
+                            transaction_id = gsheet_utils.new_id("S")
+                            history_row = [transaction_id, timestamp_str, member_id, 2, 100, "Purchase"]
+                            # บวกหุ้นจากยอดล่าสุดใน Sheet พร้อมบันทึกประวัติในคำขอเดียว
+                            share_tx = gsheet_utils.SheetTransaction(_sh)
+                            share_tx.increment("Members", "MemberID", member_id, {"Shares": 100})
+                            share_tx.update("Members", "MemberID", member_id, {
                                 "LastSharePurchaseDate": today_str,
                                 "LastUpdated": timestamp_str
-                            }
-                            gsheet_utils.update_member_data("Members", _sh, member_id, "MemberID", updates)
-
-                            transaction_id = f"S-{int(datetime.now().timestamp())}"
-                            history_row = [transaction_id, timestamp_str, member_id, 2, 100, "Purchase"]
-                            gsheet_utils.add_row_to_sheet("ShareHistory", _sh, history_row)
+                            })
+                            share_tx.append_row("ShareHistory", history_row)
+                            if not share_tx.commit_later(f"ซื้อหุ้น {member_id}", key=transaction_id):
+                                st.stop()
 
                             st.success("บันทึกการซื้อหุ้นเรียบร้อย!")
 
@@ -372,8 +397,9 @@ else:
                                 "line_items": [{'label': "ซื้อหุ้นประจำปี (2 หุ้น)", 'amount': 100.00}],
                                 "balance_summary": [
                                     {'label': 'หุ้นสะสมคงเหลือ', 'amount': latest_member_info.get('Shares', 0), 'unit': 'บาท'},
-                                    {'label': 'จำนวนหุ้นคงเหลือ', 'amount': int(safe_float(latest_member_info.get('Shares')) / 50), 'unit': 'หุ้น'}
-                                ]
+                                    {'label': 'จำนวนหุ้นคงเหลือ', 'amount': int(latest_member_info.get('Shares', 0) / 50), 'unit': 'หุ้น'}
+                                ],
+                                "transaction_id": transaction_id
                             }
                             st.rerun()
 
@@ -382,15 +408,16 @@ else:
                             timestamp_str = datetime.now(bangkok_tz).strftime("%Y-%m-%d %H:%M:%S")
                             today_str = date.today().strftime("%Y-%m-%d")
 
-                            updates = {
+                            transaction_id = gsheet_utils.new_id("S")
+                            history_row = [transaction_id, timestamp_str, member_id, 0, 0, "Declined"]
+                            decline_tx = gsheet_utils.SheetTransaction(_sh)
+                            decline_tx.update("Members", "MemberID", member_id, {
                                 "LastSharePurchaseDate": today_str,
                                 "LastUpdated": timestamp_str
-                            }
-                            gsheet_utils.update_member_data("Members", _sh, member_id, "MemberID", updates)
-
-                            transaction_id = f"S-{int(datetime.now().timestamp())}"
-                            history_row = [transaction_id, timestamp_str, member_id, 0, 0, "Declined"]
-                            gsheet_utils.add_row_to_sheet("ShareHistory", _sh, history_row)
+                            })
+                            decline_tx.append_row("ShareHistory", history_row)
+                            if not decline_tx.commit_later(f"ไม่ซื้อหุ้น {member_id}", key=transaction_id):
+                                st.stop()
 
                             st.info(f"รับทราบการตัดสินใจ 'ไม่ซื้อหุ้น' ของคุณในปีนี้เรียบร้อยแล้ว (ปุ่มจะกลับมาอีกครั้งในปี {today.year + 1})")
                             st.rerun()
@@ -403,8 +430,11 @@ else:
         elif transaction_type == "ฝากเงินสัจจะ":
             st.subheader(f"ฝากเงินออมสัจจะ (คุณ: {selected_name})")
 
-            current_savings = safe_float(member_info.get('Savings'))
+            current_savings = float(member_info.get('Savings', 0))
             st.metric("ยอดเงินฝากสัจจะปัจจุบัน", f"{current_savings:,.2f} บาท")
+            ledger_savings = ledger_utils.get_member_balances(_sh, member_id)["Savings"]
+            if abs(ledger_savings - current_savings) > ledger_utils.TOLERANCE:
+                st.caption(f"ยอดตามประวัติการฝาก: {ledger_savings:,.2f} บาท (ไม่ตรงกับยอดปัจจุบัน)")
 
             with st.form("deposit_form"):
                 deposit_amount = st.number_input("จำนวนเงินที่ต้องการฝาก", min_value=1.0, step=50.0)
@@ -416,20 +446,19 @@ else:
                 with st.spinner("กำลังบันทึกเงินฝาก..."):
                     timestamp_str = datetime.now(bangkok_tz).strftime("%Y-%m-%d %H:%M:%S")
 
-                    new_savings_balance = current_savings + deposit_amount
-                    updates = {
-                        "Savings": new_savings_balance,
-                        "LastUpdated": timestamp_str
-                    }
-                    gsheet_utils.update_member_data("Members", _sh, member_id, "MemberID", updates)
-
-                    transaction_id = f"D-{int(datetime.now().timestamp())}"
+                    transaction_id = gsheet_utils.new_id("D")
                     history_row = [transaction_id, timestamp_str, member_id, deposit_amount]
-                    gsheet_utils.add_row_to_sheet("SavingsHistory", _sh, history_row)
-
-                    st.success(f"บันทึกเงินฝาก {deposit_amount:,.2f} บาท เรียบร้อย! ยอดคงเหลือใหม่: {new_savings_balance:,.2f} บาท")
+                    # บวกเงินฝากจากยอดล่าสุดใน Sheet (ไม่ใช่ยอดที่แสดงบนหน้าจอ) พร้อมบันทึกประวัติในคำขอเดียว
+                    deposit_tx = gsheet_utils.SheetTransaction(_sh)
+                    deposit_tx.increment("Members", "MemberID", member_id, {"Savings": deposit_amount})
+                    deposit_tx.update("Members", "MemberID", member_id, {"LastUpdated": timestamp_str})
+                    deposit_tx.append_row("SavingsHistory", history_row)
+                    if not deposit_tx.commit_later(f"ฝากเงินสัจจะ {member_id}", key=transaction_id):
+                        st.stop()
 
                     latest_member_info = gsheet_utils.get_member_by_id(_sh, member_id)
+                    st.success(f"บันทึกเงินฝาก {deposit_amount:,.2f} บาท เรียบร้อย! "
+                               f"ยอดคงเหลือใหม่: {float(latest_member_info.get('Savings', 0)):,.2f} บาท")
 
                     st.session_state['receipt_data'] = {
                         "member_info": latest_member_info,
@@ -439,20 +468,45 @@ else:
                         ],
                         "balance_summary": [
                             {'label': 'เงินฝากสัจจะคงเหลือ', 'amount': latest_member_info.get('Savings', 0), 'unit': 'บาท'}
-                        ]
+                        ],
+                        "transaction_id": transaction_id
                     }
                     st.rerun()
 
+        # ------------------------------------
+        #       พิมพ์ใบเสร็จย้อนหลัง
+        # ------------------------------------
+        with st.expander("🧾 พิมพ์ใบเสร็จย้อนหลัง"):
+            history_options = receipt_utils.get_receipt_history(_sh, member_id)
+            if not history_options:
+                st.info("ยังไม่มีประวัติการทำรายการของสมาชิกท่านนี้")
+            else:
+                selected_history = st.selectbox(
+                    "เลือกรายการ:",
+                    options=list(history_options.keys()),
+                    index=None,
+                    placeholder="--- เลือกรายการ ---",
+                    key="reprint_transaction"
+                )
+                if selected_history and st.button("สร้างใบเสร็จย้อนหลัง"):
+                    source, transaction_id = history_options[selected_history]
+                    st.session_state['receipt_data'] = receipt_utils.build_history_receipt(_sh, member_id, source, transaction_id)
+                    st.rerun()
+
 # --- 8. ส่วนแสดงปุ่มดาวน์โหลดใบเสร็จ และ ปุ่มเริ่มใหม่ ---
 if 'receipt_data' in st.session_state and st.session_state['receipt_data']:
     receipt_info = st.session_state['receipt_data']
     st.info(f"ข้อมูลสำหรับสร้างใบเสร็จของ '{receipt_info['member_info']['Name']}' พร้อมแล้ว")
+    journal_status = journal_utils.get_status(receipt_info.get('transaction_id'))
+    if journal_status is not None:
+        st.caption(f"สถานะการส่งขึ้น Google Sheet: {journal_utils.STATUS_LABELS[journal_status]}")
 
-    pdf_bytes = pdf_utils.generate_receipt_pdf(receipt_info)
+    # สร้าง PDF ครั้งเดียวต่อรายการ (rerun รอบถัดไปใช้ของเดิมจาก Cache)
+    pdf_bytes = pdf_utils.get_receipt_pdf(receipt_info)
 
     st.download_button(
         label="📄 ดาวน์โหลดใบเสร็จ (PDF)",
-        data=bytes(pdf_bytes),
+        data=pdf_bytes,
         file_name=f"Receipt_{receipt_info['member_info']['Name']}_{date.today().strftime('%Y%m%d')}.pdf",
         mime="application/pdf"
     )
@@ -463,3 +517,5 @@ if selected_name:
             del st.session_state['receipt_data']
         gsheet_utils.clear_all_caches()
         st.rerun()
+
+perf_utils.render_panel()
@@ -1,6 +1,8 @@
 # pages/2_✏️_แก้ไขและลบข้อมูล.py
 import streamlit as st
 import gsheet_utils
+import search_utils
+import perf_utils
 from datetime import datetime, date, timedelta
 from pytz import timezone
 
@@ -19,7 +21,9 @@ if 'confirm_delete_id' not in st.session_state:
 if 'confirm_delete_name' not in st.session_state:
     st.session_state.confirm_delete_name = None
 
+perf_utils.start_rerun("แก้ไขหรือลบข้อมูล")
 _sh = gsheet_utils.connect_to_sheet()
+gsheet_utils.use_snapshot(None)  # หน้าทำรายการใช้ข้อมูลจริงเสมอ (Snapshot เลือกได้เฉพาะหน้ารายงาน)
 bangkok_tz = timezone("Asia/Bangkok")
 
 st.set_page_config(page_title="แก้ไขข้อมูลสมาชิก", page_icon="✏️", layout="wide")
@@ -28,18 +32,11 @@ st.title("✏️ แก้ไข / ลบ / อนุมัติเงินก
 # --- 1. Member Selection ---
 members_df = gsheet_utils.get_data_as_dataframe("Members", _sh)
 if not members_df.empty:
-    member_options = dict(zip(members_df['Name'], members_df['MemberID']))
-
-    selected_name = st.selectbox(
-        "เลือกสมาชิก:",
-        options=member_options.keys(),
-        index=None,
-        placeholder="กรุณาเลือกชื่อ..."
-    )
+    selected_member_id = search_utils.member_selector(_sh, key="edit_member_id")
 
     # --- 2. Display Forms and Logic when member is selected ---
-    if selected_name:
-        member_id = member_options[selected_name]
+    if selected_member_id:
+        member_id = selected_member_id
 
         if st.session_state.confirm_delete_id and st.session_state.confirm_delete_id != member_id:
             st.session_state.confirm_delete_id = None
@@ -48,13 +45,14 @@ if not members_df.empty:
         member_data = gsheet_utils.get_member_by_id(_sh, member_id)
 
         if member_data:
+            selected_name = member_data['Name']
             st.markdown("---")
             st.subheader(f"👤 ข้อมูลสมาชิก: {selected_name}")
 
             # --- 2A. Edit Member Info Form ---
             with st.form("edit_form"):
                 st.markdown("**แก้ไขข้อมูลส่วนตัวและการเงินพื้นฐาน**")
-                dob_obj = datetime.strptime(member_data['DOB'], "%Y-%m-%d").date() if member_data.get('DOB') else None
+                dob_obj = member_data['DOB'].date() if member_data.get('DOB') is not None else None
 
                 col_form_1, col_form_2 = st.columns(2)
                 with col_form_1:
@@ -62,12 +60,12 @@ if not members_df.empty:
                     address_no = st.text_input("บ้านเลขที่", value=member_data.get('AddressNo'))
                     village = st.text_input("หมู่บ้าน", value=member_data.get('Village'))
                     sub_district = st.text_input("ตำบล", value=member_data.get('SubDistrict'))
-                    savings = st.number_input("เงินฝากสัจจะ (ยอดปัจจุบัน)", value=gsheet_utils.safe_float(member_data.get('Savings')))
+                    savings = st.number_input("เงินฝากสัจจะ (ยอดปัจจุบัน)", value=float(member_data.get('Savings', 0)))
                 with col_form_2:
                     district = st.text_input("อำเภอ", value=member_data.get('District'))
                     province = st.text_input("จังหวัด", value=member_data.get('Province'))
                     dob = st.date_input("วันเกิด", value=dob_obj, format="DD/MM/YYYY")
-                    shares = st.number_input("เงินหุ้น (บาท, ยอดปัจจุบัน)", value=gsheet_utils.safe_float(member_data.get('Shares')))
+                    shares = st.number_input("เงินหุ้น (บาท, ยอดปัจจุบัน)", value=float(member_data.get('Shares', 0)))
 
                 st.markdown("---")
                 col_btn_1, col_btn_2 = st.columns(2)
@@ -85,10 +83,19 @@ if not members_df.empty:
                 updates = {
                     "Name": name, "AddressNo": address_no, "Village": village,
                     "SubDistrict": sub_district, "District": district, "Province": province,
-                    "DOB": dob_str, "Savings": savings, "Shares": shares,
-                    "LastUpdated": timestamp_str
+                    "DOB": dob_str, "LastUpdated": timestamp_str
                 }
-                if gsheet_utils.update_member_data("Members", _sh, member_id, "MemberID", updates):
+                # เขียนยอดเงินเฉพาะที่แก้ในฟอร์ม และต้องตรงกับยอดที่เห็นตอนเปิดฟอร์ม
+                # (ถ้ามีคนฝากเงิน/ซื้อหุ้นระหว่างนี้ จะไม่เขียนทับยอดนั้น)
+                expected = {}
+                for column, value in (("Savings", savings), ("Shares", shares)):
+                    shown = float(member_data.get(column, 0))
+                    if value != shown:
+                        updates[column] = value
+                        expected[column] = shown
+                edit_tx = gsheet_utils.SheetTransaction(_sh)
+                edit_tx.update("Members", "MemberID", member_id, updates, expected=expected)
+                if edit_tx.commit():
                     st.success(f"อัปเดตข้อมูลของ '{name}' เรียบร้อยแล้ว!")
                 else:
                     st.error("ไม่สามารถอัปเดตข้อมูลได้")
@@ -166,7 +173,7 @@ if not members_df.empty:
                         issue_date_str = issue_date.strftime("%Y-%m-%d")
                         due_date_str = due_date.strftime("%Y-%m-%d")
                         
-                        loan_id = f"L-{member_id}-{loan_account}-{int(data_entry_datetime.timestamp())}"
+                        loan_id = gsheet_utils.new_id(f"L-{member_id}-{loan_account}")
 
                         # LoanID, MemberID, LoanAccount, IssueDate, DueDate,
                         # PrincipalAmount, AmountPaid, InterestPaid, Status, DataEntryDate
@@ -185,3 +192,5 @@ if not members_df.empty:
                             st.error("ไม่สามารถสร้างสัญญาเงินกู้ได้")
 else:
     st.info("ยังไม่มีข้อมูลสมาชิกในระบบ")
+
+perf_utils.render_panel()
@@ -1,13 +1,23 @@
 # pages/3_⚙️_เครื่องมือแอดมิน.py
 import streamlit as st
 import gsheet_utils
+import interest_utils
+import journal_utils
+import ledger_utils
+import overdue_sweep
+import perf_utils
+import pdf_utils
+import receipt_utils
+import snapshot_utils
 from datetime import datetime, date
 from babel.dates import format_date
 import pandas as pd
+import os
+import zipfile
 
 # --- ฟังก์ชัน Helper ---
 def format_thai_date_admin(dt):
-    if dt is None: return "ไม่ได้ระบุ"
+    if dt is None or dt is pd.NaT: return "ไม่ได้ระบุ"
     if isinstance(dt, str):
         try: dt = datetime.strptime(dt, "%Y-%m-%d").date()
         except ValueError:
@@ -23,7 +33,9 @@ def safe_float(value):
 st.set_page_config(page_title="เครื่องมือแอดมิน", page_icon="⚙️", layout="wide")
 st.title("⚙️ เครื่องมือสำหรับผู้ดูแลระบบ")
 
+perf_utils.start_rerun("เครื่องมือแอดมิน")
 _sh = gsheet_utils.connect_to_sheet()
+snapshot_path = snapshot_utils.data_source_selector()
 
 today = date.today()
 st.info(f"วันนี้วันที่: **{format_thai_date_admin(today)}**")
@@ -46,16 +58,8 @@ if st.button("🔍 เริ่มการตรวจสอบ"):
         st.session_state.overdue_loans_df = pd.DataFrame() # เคลียร์ค่า
     else:
         try:
-            all_loans_df['DueDate'] = pd.to_datetime(all_loans_df['DueDate'], errors='coerce').dt.date
-            all_loans_df['PrincipalAmount'] = pd.to_numeric(all_loans_df['PrincipalAmount'], errors='coerce').fillna(0)
-            all_loans_df['AmountPaid'] = pd.to_numeric(all_loans_df['AmountPaid'], errors='coerce').fillna(0)
-
-            active_statuses = ['Active', 'ยังค้างชำระ']
-            
-            overdue_loans_check = all_loans_df[
-                (all_loans_df['DueDate'] <= today) &
-                (all_loans_df['Status'].isin(active_statuses))
-            ].copy()
+            # เงื่อนไขเดียวกับสคริปต์ overdue_sweep.py (ที่ตั้งเวลารันอัตโนมัติได้)
+            overdue_loans_check = overdue_sweep.find_overdue_loans(all_loans_df, today)
             
             # เก็บผลลัพธ์ไว้ใน Session State
             st.session_state.overdue_loans_df = overdue_loans_check
@@ -66,6 +70,9 @@ if st.button("🔍 เริ่มการตรวจสอบ"):
             st.session_state.overdue_loans_df = pd.DataFrame()
 
 # --- แสดงผลลัพธ์ (จาก Session State) ---
+if st.session_state.get('overdue_update_message'):
+    st.success(st.session_state.pop('overdue_update_message'))
+
 if not st.session_state.overdue_loans_df.empty:
     overdue_loans_to_show = st.session_state.overdue_loans_df
     st.error(f"🚨 พบสัญญาเงินกู้ที่ครบกำหนดแต่ยังค้างชำระ {len(overdue_loans_to_show)} ฉบับ:")
@@ -85,37 +92,283 @@ if not st.session_state.overdue_loans_df.empty:
         'PrincipalAmount': 'เงินต้น', 'เงินต้นคงเหลือ': 'คงเหลือ (ต้น)', 'วันครบกำหนด': 'ครบกำหนด'
     }), use_container_width=True)
 
-    # --- *** นี่คือส่วนแก้ไข: บังคับอัปเดตทีละรายการ *** ---
+    # --- อัปเดตสถานะทั้งหมดในครั้งเดียว ---
     st.markdown("---")
-    st.warning("ดูเหมือนการอัปเดตแบบ 'ทั้งหมด' มีปัญหา ลองอัปเดต 'ทีละรายการ' ด้านล่างนี้แทนครับ")
-    
-    # 1. สร้าง Dropdown จาก ID ที่พบ
-    loan_id_list = overdue_loans_to_show['LoanID'].tolist()
-    
-    selected_loan_id_to_fix = st.selectbox(
-        "เลือก LoanID ที่ต้องการบังคับอัปเดต:",
-        options=loan_id_list,
-        index=None,
-        placeholder="--- เลือก ID สัญญา ---"
-    )
-    
-    # 2. สร้างปุ่มสำหรับ ID ที่เลือก
-    if selected_loan_id_to_fix:
-        if st.button(f"บังคับอัปเดต {selected_loan_id_to_fix} เป็น 'เกินกำหนดชำระ'", type="primary"):
-            st.info(f"กำลังส่งคำสั่งอัปเดตสำหรับ {selected_loan_id_to_fix}...")
-            
-            # เรียกฟังก์ชัน (ที่เราใส่ st.write ไว้)
-            success = gsheet_utils.update_loan_status(_sh, str(selected_loan_id_to_fix), "เกินกำหนดชำระ")
-            
-            if success:
-                st.success(f"อัปเดต {selected_loan_id_to_fix} สำเร็จ! (ดูข้อความดีบักด้านบน)")
-                # เคลียร์ State เพื่อให้ตารางโหลดใหม่
-                st.session_state.overdue_loans_df = pd.DataFrame() 
-                st.rerun()
-            else:
-                st.error(f"การอัปเดต {selected_loan_id_to_fix} ล้มเหลว (ดู Error ด้านบน)")
+    loan_id_list = overdue_loans_to_show['LoanID'].astype(str).unique().tolist()
+
+    if snapshot_path is not None:
+        st.info("กำลังดูข้อมูลจาก Snapshot: เปลี่ยนแหล่งข้อมูลเป็น Google Sheet เพื่ออัปเดตสถานะ")
+    elif st.button(f"อัปเดตทั้ง {len(loan_id_list)} สัญญา เป็น '{overdue_sweep.OVERDUE_STATUS}'", type="primary"):
+        progress_bar = st.progress(0.0, text="กำลังอัปเดตสถานะ...")
+        changed_rows = gsheet_utils.update_loans_status_bulk(
+            _sh, loan_id_list, overdue_sweep.OVERDUE_STATUS,
+            progress_callback=lambda done, total: progress_bar.progress(done / total, text=f"อัปเดตแล้ว {done}/{total} แถว")
+        )
+        if changed_rows is not None:
+            progress_bar.progress(1.0, text="เสร็จสิ้น")
+            st.session_state.overdue_update_message = f"อัปเดตสถานะเป็น 'เกินกำหนดชำระ' เรียบร้อย {changed_rows} แถว ({len(loan_id_list)} สัญญา)"
+            # เคลียร์ State เพื่อให้ตารางโหลดใหม่
+            st.session_state.overdue_loans_df = pd.DataFrame()
+            st.rerun()
 
 else:
     # (แสดงเฉพาะเมื่อกดตรวจสอบแล้ว และไม่พบอะไร)
     if st.session_state.get('overdue_loans_df') is not None and st.session_state.overdue_loans_df.empty:
          st.success("✅ ไม่พบสัญญาเงินกู้ที่ครบกำหนดและยังค้างชำระ")
+
+st.markdown("---")
+
+# --- ส่วนที่ 2: ดอกเบี้ยทั้งพอร์ต ---
+st.subheader("2. ดอกเบี้ยของสัญญาที่ยังค้างชำระ (ทั้งพอร์ต)")
+
+# คำนวณทุกสัญญาในครั้งเดียว และ Cache ไว้จนกว่าแท็บ Loans / SystemConfig จะเปลี่ยน
+portfolio_df = interest_utils.get_portfolio_interest(_sh)
+if portfolio_df.empty:
+    st.info("ยังไม่มีข้อมูลสัญญาเงินกู้ในระบบ")
+else:
+    interest_rules = interest_utils.get_interest_rules(_sh)
+    if interest_rules:
+        st.caption("อัตราดอกเบี้ยจาก SystemConfig: " + ", ".join(f"{k} = {v:.2%}" for k, v in sorted(interest_rules.items())))
+    else:
+        st.caption(f"ยังไม่ได้ตั้งอัตราดอกเบี้ยใน SystemConfig (ใช้ค่าเริ่มต้น {interest_utils.DEFAULT_INTEREST_RATE:.2%})")
+
+    by_account = interest_utils.summarize_by_account(portfolio_df)
+    col_i1, col_i2, col_i3 = st.columns(3)
+    with col_i1: st.metric("ดอกเบี้ยที่ต้องชำระ", f"{by_account['InterestDue'].sum():,.2f} บาท")
+    with col_i2: st.metric("ชำระแล้ว", f"{by_account['InterestPaid'].sum():,.2f} บาท")
+    with col_i3: st.metric("ค้างชำระ", f"{by_account['InterestArrears'].sum():,.2f} บาท")
+
+    st.dataframe(by_account.rename(columns={
+        'LoanAccount': 'บัญชี', 'Loans': 'จำนวนสัญญา', 'Remaining': 'เงินต้นคงเหลือ',
+        'InterestDue': 'ดอกเบี้ยที่ต้องชำระ', 'InterestPaid': 'ชำระแล้ว', 'InterestArrears': 'ค้างชำระ'
+    }), hide_index=True, use_container_width=True)
+
+    with st.expander("รายสัญญาที่ยังค้างดอกเบี้ย"):
+        arrears_df = portfolio_df[portfolio_df['IsActive'] & (portfolio_df['InterestArrears'] > 0)]
+        st.dataframe(arrears_df[['LoanID', 'MemberID', 'LoanAccount', 'InterestRate', 'InterestDue', 'InterestPaid', 'InterestArrears']].rename(columns={
+            'LoanID': 'รหัสสัญญา', 'MemberID': 'รหัสสมาชิก', 'LoanAccount': 'บัญชี', 'InterestRate': 'อัตรา',
+            'InterestDue': 'ดอกเบี้ยที่ต้องชำระ', 'InterestPaid': 'ชำระแล้ว', 'InterestArrears': 'ค้างชำระ'
+        }), hide_index=True, use_container_width=True)
+
+st.markdown("---")
+
+# --- ส่วนที่ 3: ตรวจยอดคงเหลือกับประวัติรายการ ---
+st.subheader("3. ตรวจยอดคงเหลือกับประวัติรายการ")
+st.caption("เทียบยอดในแท็บ Members / Loans กับผลรวมจาก SavingsHistory, ShareHistory และ PaymentHistory "
+           "(ยอดยกมาก่อนเริ่มบันทึกประวัติจะแสดงเป็นส่วนต่างด้วย)")
+
+mismatch_df = ledger_utils.reconcile(_sh)
+if mismatch_df.empty:
+    st.success("✅ ยอดคงเหลือทุกรายการตรงกับประวัติรายการ")
+else:
+    st.warning(f"พบยอดที่ไม่ตรงกับประวัติรายการ {len(mismatch_df):,} รายการ")
+    st.dataframe(mismatch_df.rename(columns={
+        'Sheet': 'แท็บ', 'ID': 'รหัส', 'Column': 'คอลัมน์', 'CellValue': 'ยอดในแท็บ',
+        'LedgerValue': 'ยอดตามประวัติ', 'Difference': 'ส่วนต่าง'
+    }), hide_index=True, use_container_width=True)
+
+st.markdown("---")
+
+# --- ส่วนที่ 4: พิมพ์ใบเสร็จ / ใบแจ้งยอด แบบกลุ่ม ---
+st.subheader("4. พิมพ์ใบเสร็จ / ใบแจ้งยอด แบบกลุ่ม")
+
+batch_mode = st.radio(
+    "เลือกสิ่งที่ต้องการพิมพ์:",
+    ("ใบเสร็จของรายการในวันที่เลือก", "ใบแจ้งยอดสมาชิก"),
+    horizontal=True
+)
+
+if batch_mode == "ใบเสร็จของรายการในวันที่เลือก":
+    col_b1, col_b2 = st.columns(2)
+    with col_b1:
+        batch_source = st.selectbox("ประเภทรายการ:", options=list(receipt_utils.RECEIPT_SOURCES.keys()),
+                                    format_func=receipt_utils.RECEIPT_SOURCES.get)
+    with col_b2:
+        batch_date = st.date_input("วันที่ทำรายการ", value=today, format="DD/MM/YYYY")
+else:
+    members_df_batch = gsheet_utils.get_data_as_dataframe("Members", _sh)
+    member_name_by_id = dict(zip(members_df_batch["MemberID"], members_df_batch["Name"])) if not members_df_batch.empty else {}
+    batch_members = st.multiselect("เลือกสมาชิก (ไม่เลือก = ทุกคน):", options=list(member_name_by_id.keys()),
+                                   format_func=lambda m: f"{member_name_by_id[m]} ({m})")
+    batch_date = st.date_input("ยอด ณ วันที่", value=today, format="DD/MM/YYYY")
+
+batch_format = st.radio("รูปแบบไฟล์:", ("PDF ไฟล์เดียว (พิมพ์ต่อเนื่อง)", "ZIP (PDF แยกรายใบ)"), horizontal=True)
+
+if st.button("🖨️ สร้างไฟล์"):
+    with st.spinner("กำลังเตรียมข้อมูล..."):
+        if batch_mode == "ใบเสร็จของรายการในวันที่เลือก":
+            batch_receipts = receipt_utils.build_receipts_for_date(_sh, batch_source, batch_date)
+        else:
+            batch_receipts = [
+                receipt_utils.build_member_statement(_sh, m, batch_date)
+                for m in (batch_members or list(member_name_by_id.keys()))
+            ]
+
+    if not batch_receipts:
+        st.info("ไม่พบรายการสำหรับสร้างไฟล์")
+    else:
+        combine = batch_format.startswith("PDF")
+        with st.spinner(f"กำลังสร้างเอกสาร {len(batch_receipts)} ใบ..."):
+            try:
+                st.session_state.batch_file = (
+                    pdf_utils.generate_receipts_batch(batch_receipts, combine=combine),
+                    f"{'Receipts' if batch_mode.startswith('ใบเสร็จ') else 'Statements'}_{batch_date.strftime('%Y%m%d')}.{'pdf' if combine else 'zip'}",
+                    len(batch_receipts),
+                )
+            except Exception as e:
+                st.error(f"เกิดข้อผิดพลาดในการสร้างเอกสาร: {e}")
+
+if st.session_state.get('batch_file'):
+    batch_bytes, batch_file_name, batch_count = st.session_state.batch_file
+    st.success(f"สร้างเอกสารเรียบร้อย {batch_count} ใบ")
+    st.download_button(
+        label=f"📄 ดาวน์โหลด {batch_file_name}",
+        data=batch_bytes,
+        file_name=batch_file_name,
+        mime="application/pdf" if batch_file_name.endswith(".pdf") else "application/zip"
+    )
+
+st.markdown("---")
+
+# --- ส่วนที่ 5: นำเข้าสมาชิก / สัญญาเงินกู้จากไฟล์ CSV ---
+st.subheader("5. นำเข้าสมาชิก / สัญญาเงินกู้จากไฟล์ CSV")
+if snapshot_path is not None:
+    st.info("กำลังดูข้อมูลจาก Snapshot: เปลี่ยนแหล่งข้อมูลเป็น Google Sheet เพื่อนำเข้าข้อมูล")
+else:
+    import_sheet = st.radio("นำเข้าไปที่แท็บ:", ("Members", "Loans"), horizontal=True,
+                            format_func=lambda s: "สมาชิก (Members)" if s == "Members" else "สัญญาเงินกู้ (Loans)")
+    import_header = gsheet_utils.get_header(import_sheet, _sh)
+    st.caption(
+        f"หัวตารางในไฟล์ใช้ชื่อคอลัมน์ภาษาอังกฤษตามแท็บ {import_sheet} "
+        f"(ต้องมี: {', '.join(gsheet_utils.IMPORT_REQUIRED_COLUMNS[import_sheet])}) "
+        f"ไม่ระบุ {gsheet_utils.IMPORT_ID_COLUMNS[import_sheet]} ระบบจะสร้างรหัสให้ วันที่ใช้ 2025-07-05 หรือ 05/07/2568"
+    )
+    st.download_button("⬇️ ดาวน์โหลดไฟล์ตัวอย่าง", data=(",".join(import_header) + "\n").encode("utf-8-sig"),
+                       file_name=f"{import_sheet}_template.csv", mime="text/csv")
+    import_file = st.file_uploader("เลือกไฟล์ CSV", type="csv", key=f"import_file_{import_sheet}")
+
+    if st.session_state.get('import_message'):
+        st.success(st.session_state.pop('import_message'))
+
+    if import_file is not None:
+        try:
+            import_df = pd.read_csv(import_file, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        except Exception as e:
+            st.error(f"อ่านไฟล์ CSV ไม่ได้: {e}")
+            import_df = None
+
+        if import_df is not None:
+            import_rows, import_errors = gsheet_utils.validate_import(_sh, import_sheet, import_df)
+            if import_errors:
+                st.error("ยังนำเข้าไม่ได้ กรุณาแก้ไขไฟล์:\n\n" + "\n".join(f"- {e}" for e in import_errors))
+            else:
+                st.info(f"พร้อมนำเข้า {len(import_rows):,} แถว "
+                        f"(ใช้ {-(-len(import_rows) // gsheet_utils.IMPORT_CHUNK_SIZE)} คำขอ)")
+                st.dataframe(pd.DataFrame(import_rows[:20], columns=import_header), hide_index=True, use_container_width=True)
+                if st.button(f"📥 นำเข้า {len(import_rows):,} แถว", type="primary"):
+                    import_progress = st.progress(0.0, text="กำลังนำเข้า...")
+                    imported = gsheet_utils.append_rows_bulk(
+                        import_sheet, _sh, import_rows,
+                        progress_callback=lambda done, total: import_progress.progress(done / total, text=f"นำเข้าแล้ว {done:,}/{total:,} แถว")
+                    )
+                    if imported is not None:
+                        st.session_state.import_message = f"นำเข้า {imported:,} แถวไปที่แท็บ {import_sheet} เรียบร้อย"
+                        # ล้างไฟล์ที่เลือกไว้ กันการกดนำเข้าซ้ำ
+                        st.session_state.pop(f"import_file_{import_sheet}", None)
+                        st.rerun()
+
+st.markdown("---")
+
+# --- ส่วนที่ 6: สำรองข้อมูล (Snapshot) ---
+st.subheader("6. สำรองข้อมูล (Snapshot)")
+st.caption("บันทึกทุกแท็บเป็นไฟล์ Arrow ในเครื่อง (เก็บชนิดข้อมูลครบ) ใช้สำรองข้อมูล หรือเลือกเป็น \"แหล่งข้อมูล\" "
+           "ใน Sidebar ของหน้านี้และหน้าภาพรวม เพื่อดูรายงานจากไฟล์โดยไม่เรียก Google Sheets")
+
+if st.session_state.get('snapshot_message'):
+    st.success(st.session_state.pop('snapshot_message'))
+
+if snapshot_path is None:
+    snapshot_compression = st.radio(
+        "การบีบอัด:", snapshot_utils.COMPRESSIONS, horizontal=True,
+        format_func=lambda c: "ไม่บีบอัด (เปิดไฟล์เร็วที่สุด)" if c == "uncompressed" else c
+    )
+    if st.button("💾 สร้าง Snapshot จากข้อมูลปัจจุบัน"):
+        with st.spinner("กำลังบันทึก Snapshot..."):
+            try:
+                new_snapshot = snapshot_utils.export_snapshot(_sh, compression=snapshot_compression)
+                st.session_state.snapshot_message = f"สร้าง Snapshot เรียบร้อย: {new_snapshot}"
+                st.rerun()
+            except OSError as e:
+                st.error(f"บันทึก Snapshot ไม่สำเร็จ: {e}")
+
+snapshots = snapshot_utils.list_snapshots()
+if not snapshots:
+    st.info("ยังไม่มี Snapshot ในเครื่อง")
+else:
+    selected_snapshot = st.selectbox("Snapshot ในเครื่อง:", options=[path for path, _ in snapshots],
+                                     format_func=lambda p: snapshot_utils.describe(p, dict(snapshots)[p]))
+    st.download_button("⬇️ ดาวน์โหลด Snapshot (ZIP)", data=snapshot_utils.pack_snapshot(selected_snapshot),
+                       file_name=f"snapshot_{os.path.basename(selected_snapshot)}.zip",
+                       mime="application/zip")
+
+snapshot_upload = st.file_uploader("นำ Snapshot (ZIP) เข้ามาในเครื่อง", type="zip", key="snapshot_upload")
+if snapshot_upload is not None and st.button("📂 เพิ่ม Snapshot จากไฟล์"):
+    try:
+        uploaded_path = snapshot_utils.unpack_snapshot(snapshot_upload.getvalue())
+        st.session_state.snapshot_message = f"เพิ่ม Snapshot เรียบร้อย: {uploaded_path}"
+        st.session_state.pop("snapshot_upload", None)
+        st.rerun()
+    except (ValueError, zipfile.BadZipFile) as e:
+        st.error(f"ไฟล์ Snapshot ไม่ถูกต้อง: {e}")
+
+st.markdown("---")
+
+# --- ส่วนที่ 7: คิวการบันทึกที่รอส่งขึ้น Google Sheet ---
+st.subheader("7. คิวการบันทึกที่รอส่งขึ้น Google Sheet")
+st.caption("รายการรับเงินบันทึกลงคิวในเครื่องก่อน แล้วระบบส่งขึ้น Sheet เบื้องหลัง "
+           "รายการที่ส่งไม่สำเร็จถาวรจะถูกพักไว้ที่นี่ ตรวจยอดใน Sheet ก่อนกดส่งซ้ำหรือยกเลิก")
+
+if st.session_state.get('journal_message'):
+    st.success(st.session_state.pop('journal_message'))
+
+journal_summary = journal_utils.get_summary()
+col_j1, col_j2, col_j3 = st.columns(3)
+with col_j1: st.metric("รอส่ง", f"{journal_summary['pending']:,} รายการ")
+with col_j2: st.metric("ส่งไม่สำเร็จ", f"{journal_summary['failed']:,} รายการ")
+with col_j3: st.metric("ส่งล่าสุดใช้เวลา", "-" if journal_summary['last_flush_ms'] is None
+                       else f"{journal_summary['last_flush_ms']:,.0f} ms")
+if journal_summary['worker_error']:
+    st.error(f"ระบบส่งคิวขัดข้อง จะลองใหม่อัตโนมัติ: {journal_summary['worker_error']}")
+
+journal_df = journal_utils.list_entries()
+if journal_df.empty:
+    st.info("ยังไม่มีรายการในคิว")
+else:
+    st.dataframe(journal_df.assign(status=journal_df['status'].map(journal_utils.STATUS_LABELS)).rename(columns={
+        'id': 'ลำดับ', 'key': 'รหัสอ้างอิง', 'label': 'รายการ', 'status': 'สถานะ', 'attempts': 'ลองใหม่',
+        'last_error': 'ข้อผิดพลาดล่าสุด', 'created_at': 'เข้าคิว', 'flushed_at': 'ส่งแล้วเมื่อ',
+        'flush_ms': 'เวลาส่ง (ms)', 'batch_size': 'รายการ/คำขอ'
+    }), hide_index=True, use_container_width=True)
+
+    failed_df = journal_df[journal_df['status'] == journal_utils.FAILED]
+    if snapshot_path is None and journal_summary['pending'] and st.button("📤 ส่งคิวทันที"):
+        with st.spinner("กำลังส่งคิวขึ้น Google Sheet..."):
+            sent = journal_utils.drain(_sh)
+        st.session_state.journal_message = "ส่งคิวครบแล้ว" if sent else "ยังมีรายการค้างอยู่ ระบบจะลองใหม่อัตโนมัติ"
+        st.rerun()
+    if snapshot_path is None and not failed_df.empty:
+        failed_id = st.selectbox("รายการที่ส่งไม่สำเร็จ:", options=failed_df['id'].tolist(),
+                                 format_func=lambda i: f"#{i} {failed_df.set_index('id').at[i, 'label']}")
+        col_r1, col_r2 = st.columns(2)
+        with col_r1:
+            if st.button("🔁 ส่งรายการนี้อีกครั้ง", use_container_width=True):
+                journal_utils.retry(failed_id)
+                st.session_state.journal_message = f"นำรายการ #{failed_id} กลับเข้าคิวแล้ว"
+                st.rerun()
+        with col_r2:
+            if st.button("🗑️ ยกเลิกรายการนี้", use_container_width=True):
+                journal_utils.discard(failed_id)
+                st.session_state.journal_message = f"ยกเลิกรายการ #{failed_id} แล้ว (ข้อมูลในเครื่องซิงก์ใหม่จาก Sheet)"
+                st.rerun()
+
+perf_utils.render_panel()
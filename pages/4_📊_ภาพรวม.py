@@ -0,0 +1,85 @@
+# pages/4_📊_ภาพรวม.py
+import streamlit as st
+import gsheet_utils
+import ledger_utils
+import perf_utils
+import rollup_utils
+import snapshot_utils
+
+# --- ค่าคงที่ ---
+LEVEL_LABELS = {"Province": "จังหวัด", "District": "อำเภอ", "SubDistrict": "ตำบล", "Village": "หมู่บ้าน"}
+COLUMN_LABELS = {
+    **LEVEL_LABELS, "LoanAccount": "บัญชี",
+    "Members": "สมาชิก", "Savings": "เงินฝากสัจจะ", "Shares": "หุ้นสะสม",
+    "Loans": "สัญญาทั้งหมด", "ActiveLoans": "สัญญาค้างชำระ", "Principal": "เงินต้นรวม",
+    "Outstanding": "เงินต้นคงค้าง", "OverdueLoans": "สัญญาเกินกำหนด", "OverdueOutstanding": "คงค้างเกินกำหนด",
+    "OverdueRatio": "สัดส่วนเกินกำหนด (ยอดเงิน)", "OverdueLoanRatio": "สัดส่วนเกินกำหนด (สัญญา)",
+}
+MONTHLY_LABELS = {
+    "Deposits": "ฝากเงินสัจจะ", "SharePurchases": "ซื้อหุ้น",
+    "PrincipalPaid": "ชำระเงินต้น", "InterestPaid": "ชำระดอกเบี้ย",
+}
+RATIO_FORMAT = {label: st.column_config.NumberColumn(label, format="percent")
+                for label in (COLUMN_LABELS["OverdueRatio"], COLUMN_LABELS["OverdueLoanRatio"])}
+
+st.set_page_config(page_title="ภาพรวม", page_icon="📊", layout="wide")
+st.title("📊 ภาพรวมพอร์ตสินเชื่อและเงินออม")
+
+perf_utils.start_rerun("ภาพรวม")
+_sh = gsheet_utils.connect_to_sheet()
+snapshot_utils.data_source_selector()
+
+# ตารางสรุปคำนวณไว้ครั้งเดียว และอัปเดตเฉพาะสมาชิกที่มีการเขียนข้อมูล (ดู rollup_utils)
+totals = rollup_utils.get_totals(_sh)
+
+col1, col2, col3, col4, col5 = st.columns(5)
+with col1: st.metric("สมาชิก", f"{totals['Members']:,.0f} คน")
+with col2: st.metric("เงินฝากสัจจะรวม", f"{totals['Savings']:,.2f} บาท")
+with col3: st.metric("หุ้นสะสมรวม", f"{totals['Shares']:,.2f} บาท")
+with col4: st.metric("เงินต้นคงค้าง", f"{totals['Outstanding']:,.2f} บาท", f"{totals['ActiveLoans']:,.0f} สัญญา",
+                     delta_color="off")
+with col5: st.metric("เกินกำหนดชำระ", f"{totals['OverdueRatio']:.1%}",
+                     f"{totals['OverdueOutstanding']:,.2f} บาท / {totals['OverdueLoans']:,.0f} สัญญา",
+                     delta_color="off")
+
+st.markdown("---")
+
+# --- ส่วนที่ 1: ตามพื้นที่ ---
+st.subheader("1. แยกตามพื้นที่")
+level = st.radio("ระดับพื้นที่:", options=rollup_utils.GEO_LEVELS, index=1,
+                 format_func=LEVEL_LABELS.get, horizontal=True)
+geo_df = rollup_utils.get_geo_rollup(_sh, level)
+if geo_df.empty:
+    st.info("ยังไม่มีข้อมูลสมาชิกในระบบ")
+else:
+    chart_df = geo_df.head(20).set_index(level)[["Outstanding", "OverdueOutstanding"]]
+    st.bar_chart(chart_df.rename(columns=COLUMN_LABELS), stack=False)
+    if len(geo_df) > 20:
+        st.caption(f"กราฟแสดง 20 พื้นที่ที่มีเงินต้นคงค้างมากที่สุด จากทั้งหมด {len(geo_df):,} พื้นที่")
+    st.dataframe(geo_df.rename(columns=COLUMN_LABELS), hide_index=True, use_container_width=True,
+                 column_config=RATIO_FORMAT)
+
+st.markdown("---")
+
+# --- ส่วนที่ 2: ตามบัญชีเงินกู้ ---
+st.subheader("2. แยกตามบัญชีเงินกู้")
+account_df = rollup_utils.get_account_rollup(_sh)
+if account_df.empty:
+    st.info("ยังไม่มีข้อมูลสัญญาเงินกู้ในระบบ")
+else:
+    st.dataframe(account_df.rename(columns=COLUMN_LABELS), hide_index=True, use_container_width=True,
+                 column_config=RATIO_FORMAT)
+
+st.markdown("---")
+
+# --- ส่วนที่ 3: แนวโน้มรายเดือน ---
+st.subheader("3. แนวโน้มรายเดือน (จากประวัติรายการ)")
+monthly_df = ledger_utils.get_monthly_totals(_sh)
+if monthly_df.empty:
+    st.info("ยังไม่มีประวัติรายการ")
+else:
+    months = st.slider("จำนวนเดือนย้อนหลัง", min_value=1, max_value=len(monthly_df),
+                       value=min(12, len(monthly_df))) if len(monthly_df) > 1 else 1
+    st.line_chart(monthly_df.tail(months).rename(columns=MONTHLY_LABELS))
+
+perf_utils.render_panel()
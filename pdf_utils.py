@@ -1,42 +1,146 @@
 # pdf_utils.py
+import copy
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+import streamlit as st
 from fpdf import FPDF
+from fontTools import ttLib
+from pypdf import PdfWriter
 from datetime import datetime
 
+import perf_utils
+
+# --- ค่าคงที่ ---
+FONT_FILES = {
+    '': 'fonts/Sarabun-Regular.ttf',
+    'B': 'fonts/Sarabun-Bold.ttf',
+}
+SIGNATURE_Y = -30  # (มม. จากขอบล่าง) ตำแหน่งช่องลงชื่อ
+RECEIPT_TITLE = 'ใบเสร็จรับเงิน'
+BATCH_MIN_PARALLEL = 20  # ต่ำกว่านี้สร้างใน process เดิม (ไม่คุ้มค่าเปิด process ใหม่)
+RECEIPT_CACHE_SIZE = 256  # จำนวนใบเสร็จ (PDF) ล่าสุดที่เก็บไว้ในหน่วยความจำ
+
+_template_lock = threading.Lock()
+
 class PDF(FPDF):
+    title_text = RECEIPT_TITLE
+    # หน้าที่วาดช่องลงชื่อ (ส่วนคงที่ของ footer) ไว้แล้วในแม่แบบ
+    static_footer_pages = ()
+
     def header(self):
-        self.add_font('Sarabun', 'B', 'fonts/Sarabun-Bold.ttf', uni=True)
         self.set_font('Sarabun', 'B', 16)
-        self.cell(0, 10, 'ใบเสร็จรับเงิน', border=0, ln=1, align='C')
+        self.cell(0, 10, self.title_text, border=0, ln=1, align='C')
         self.ln(10) # ลดระยะห่างเล็กน้อยสำหรับ A5
 
-    def footer(self):
-        self.set_y(-30)
-        self.add_font('Sarabun', '', 'fonts/Sarabun-Regular.ttf', uni=True)
+    def draw_signature_lines(self):
+        """ส่วนคงที่ของช่องลงชื่อ (ไม่มีชื่อสมาชิก)"""
+        self.set_y(SIGNATURE_Y)
         self.set_font('Sarabun', '', 10)
         col_width = (self.w - self.l_margin - self.r_margin) / 2
         self.cell(col_width, 10, 'ผู้ชำระเงิน ........................................', align='L') 
         self.cell(col_width, 10, 'ผู้รับเงิน ........................................', align='R', ln=1)
+        self.set_x(self.l_margin + col_width)
+        self.cell(col_width, 10, '(........................................)', align='R', ln=1)
+
+    def footer(self):
+        if self.page not in self.static_footer_pages:
+            self.draw_signature_lines()
+        # ส่วนที่เปลี่ยนตามผู้ทำรายการ: ชื่อใต้ช่อง "ผู้ชำระเงิน"
+        self.set_xy(self.l_margin, self.h + SIGNATURE_Y + 10)
+        self.set_font('Sarabun', '', 10)
+        col_width = (self.w - self.l_margin - self.r_margin) / 2
         member_name = self.member_info.get("Name", "")
         self.cell(col_width, 10, f'({member_name})', align='C')
-        self.cell(col_width, 10, '(........................................)', align='R', ln=1)
 
-def generate_receipt_pdf(receipt_data: dict):
+# --- แม่แบบใบเสร็จ (สร้างครั้งเดียวต่อ process) ---
+@lru_cache(maxsize=None)
+def _font_bytes(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _build_template(with_loan_line: bool, title: str) -> PDF:
     """
-    สร้างไฟล์ PDF อเนกประสงค์สำหรับธุรกรรมทุกประเภท (ขนาด A5)
+    วาดส่วนคงที่ของใบเสร็จ A5 ไว้ล่วงหน้า: หัวเรื่อง, หัวข้อข้อมูลผู้ทำรายการ, หัวตาราง และช่องลงชื่อ
+    แล้วจำตำแหน่งของช่องข้อมูลที่ต้องเติมทีหลัง (body_y, table_y)
     """
     pdf = PDF(format='A5')          # <-- ตั้งค่าขนาดเป็น A5
+    pdf.title_text = title
     pdf.set_text_shaping(True)     # <-- เปิดโหมดภาษาไทย
-    pdf.member_info = receipt_data['member_info']
-
-    pdf.add_font('Sarabun', '', 'fonts/Sarabun-Regular.ttf', uni=True)
-    pdf.add_font('Sarabun', 'B', 'fonts/Sarabun-Bold.ttf', uni=True)
-    
+    for style, path in FONT_FILES.items():
+        pdf.add_font('Sarabun', style, path)
     pdf.add_page()
-    pdf.set_font('Sarabun', '', 12) # ขนาดปกติสำหรับข้อมูลส่วนตัว
+    top_y = pdf.get_y()
+
+    # ช่องลงชื่อ (ปิดการขึ้นหน้าใหม่อัตโนมัติชั่วคราว เพราะอยู่ในระยะขอบล่าง)
+    bottom_margin = pdf.b_margin
+    pdf.set_auto_page_break(False)
+    pdf.draw_signature_lines()
+    pdf.set_auto_page_break(True, margin=bottom_margin)
+    pdf.static_footer_pages = (1,)
 
     # --- ส่วนข้อมูลส่วนตัว ---
+    pdf.set_y(top_y)
     pdf.set_font('Sarabun', 'B', 12)
-    pdf.cell(0, 8, f"ข้อมูลผู้ทำรายการ", ln=1)
+    pdf.cell(0, 8, "ข้อมูลผู้ทำรายการ", ln=1)
+    pdf.body_y = pdf.get_y()
+    # เว้นที่ให้ ชื่อ / ที่อยู่ / วันที่ทำรายการ (+ เลขที่สัญญา) ตามผังเดิม
+    pdf.set_y(pdf.body_y + 3 * 8 + 2)
+    if with_loan_line:
+        pdf.set_y(pdf.get_y() + 8)
+    pdf.ln(3) # เว้นบรรทัดก่อนตาราง
+
+    # --- หัวตาราง ---
+    pdf.set_font('Sarabun', 'B', 10)
+    pdf.cell(100, 8, 'รายการ', border=1)
+    pdf.cell(30, 8, 'จำนวนเงิน (บาท)', border=1, ln=1, align='C')
+    pdf.table_y = pdf.get_y()
+
+    # โหลด HarfBuzz ไว้ก่อน ให้ทุกใบเสร็จใช้ร่วมกัน
+    for font in pdf.fonts.values():
+        font.hbfont
+    return pdf
+
+@lru_cache(maxsize=None)
+def _get_template(with_loan_line: bool, title: str) -> PDF:
+    with _template_lock:
+        return _build_template(with_loan_line, title)
+
+def _new_receipt(with_loan_line: bool, title: str) -> PDF:
+    """
+    สำเนาของแม่แบบสำหรับใบเสร็จ 1 ใบ
+    (ข้อมูลฟอนต์ที่อ่านแล้วใช้ร่วมกัน แต่ ttfont ต้องแยกกัน เพราะตอน output จะถูกตัด subset ทับ)
+    """
+    template = _get_template(with_loan_line, title)
+    # ตารางความกว้าง/รหัสตัวอักษรของฟอนต์อ่านอย่างเดียว ใช้อ้างอิงร่วมกันได้ ไม่ต้องคัดลอก
+    shared = {}
+    for font in template.fonts.values():
+        for table in (getattr(font, "cw", None), getattr(font, "glyph_ids", None)):
+            if table is not None:
+                shared[id(table)] = table
+    pdf = copy.deepcopy(template, shared)
+    for font in pdf.fonts.values():
+        if getattr(font, "ttffile", None) is not None:
+            font.ttfont = ttLib.TTFont(BytesIO(_font_bytes(font.ttffile)), recalcTimestamp=False, recalcBBoxes=False, lazy=True)
+    return pdf
+
+@perf_utils.instrument
+def generate_receipt_pdf(receipt_data: dict):
+    """
+    สร้างไฟล์ PDF อเนกประสงค์สำหรับธุรกรรมทุกประเภท (ขนาด A5)
+    ส่วนคงที่มาจากแม่แบบที่สร้างไว้แล้ว เหลือวาดเฉพาะข้อมูลของรายการนี้
+    """
+    loan_id = receipt_data.get('loan_id')
+    pdf = _new_receipt(bool(loan_id), receipt_data.get('title', RECEIPT_TITLE))
+    pdf.member_info = receipt_data['member_info']
+
+    # --- ส่วนข้อมูลส่วนตัว ---
+    pdf.set_y(pdf.body_y)
     pdf.set_font('Sarabun', '', 12)
     pdf.cell(0, 8, f"  ชื่อ: {receipt_data['member_info'].get('Name', '')}", ln=1)
     address = (
@@ -50,23 +154,13 @@ def generate_receipt_pdf(receipt_data: dict):
     pdf.cell(0, 8, f"  วันที่ทำรายการ: {receipt_data['payment_date']}", ln=1)
     pdf.ln(2) # เว้นบรรทัดเล็กน้อย
 
-    # --- *** นี่คือส่วนที่แก้ไข (ข้อ 2) *** ---
     # เพิ่ม LoanID ถ้ามี
-    loan_id = receipt_data.get('loan_id')
     if loan_id:
         pdf.set_font('Sarabun', 'B', 11) # ตั้งค่าฟอนต์สำหรับ LoanID
         pdf.cell(0, 8, f"  สำหรับสัญญาเลขที่: {loan_id}", ln=1, border=0)
-    pdf.ln(3) # เว้นบรรทัดก่อนตาราง
-    # --- *** สิ้นสุดการแก้ไข *** ---
 
-    # --- ส่วนตารางรายการ (แบบไดนามิก) ---
-    
-    # --- *** นี่คือส่วนที่แก้ไข (ข้อ 3) *** ---
-    # ลดขนาดฟอนต์หัวตาราง และลดความสูงแถว
-    pdf.set_font('Sarabun', 'B', 10) # <-- ลดขนาดฟอนต์หัวตาราง
-    pdf.cell(100, 8, 'รายการ', border=1) # <-- ลดความสูงแถว
-    pdf.cell(30, 8, 'จำนวนเงิน (บาท)', border=1, ln=1, align='C') # <-- ลดความสูงแถว
-    
+    # --- ส่วนตารางรายการ (แบบไดนามิก) --- หัวตารางอยู่ในแม่แบบแล้ว
+    pdf.set_y(pdf.table_y)
     pdf.set_font('Sarabun', '', 10) # <-- ลดขนาดฟอนต์เนื้อหาตาราง
     total_paid = 0
     for item in receipt_data.get('line_items', []):
@@ -80,7 +174,6 @@ def generate_receipt_pdf(receipt_data: dict):
     pdf.cell(100, 8, f"  รวมทั้งสิ้น", border=1) # <-- ลดความสูงแถว
     pdf.cell(30, 8, f"{total_paid:,.2f}", border=1, ln=1, align='R') # <-- ลดความสูงแถว
     pdf.ln(10)
-    # --- *** สิ้นสุดการแก้ไข *** ---
 
     # --- ส่วนยอดคงเหลือ (แบบไดนามิก) ---
     pdf.set_font('Sarabun', 'B', 12) # (กลับมาใช้ขนาด 12)
@@ -98,3 +191,47 @@ def generate_receipt_pdf(receipt_data: dict):
     
     # ส่งออกไฟล์ PDF เป็น bytes
     return pdf.output(dest='S')
+
+# --- ใบเสร็จที่สร้างแล้ว (Cache) ---
+@perf_utils.instrument(cached=True)
+@st.cache_data(max_entries=RECEIPT_CACHE_SIZE, show_spinner=False)
+@perf_utils.cache_miss
+def get_receipt_pdf(receipt_data: dict) -> bytes:
+    """
+    ใบเสร็จ PDF ของรายการเดียวกัน (เนื้อหา + transaction_id เดิม) สร้างครั้งเดียวแล้วใช้ซ้ำ
+    เช่น ตอน Streamlit rerun หรือพิมพ์ใบเสร็จย้อนหลังซ้ำ (เกิน RECEIPT_CACHE_SIZE ใบ จะลบใบที่ไม่ได้ใช้นานที่สุด)
+    """
+    return bytes(generate_receipt_pdf(receipt_data))
+
+# --- สร้างใบเสร็จแบบกลุ่ม (หลาย CPU) ---
+def _receipt_file_name(receipt_data: dict, number: int) -> str:
+    name = str(receipt_data['member_info'].get('Name', '')).replace('/', '-')
+    return f"{number:04d}_{receipt_data.get('transaction_id', '')}_{name}.pdf"
+
+@perf_utils.instrument
+def generate_receipts_batch(receipts: list, combine: bool = True, max_workers: int = None) -> bytes:
+    """
+    สร้างใบเสร็จ/ใบแจ้งยอดหลายใบพร้อมกัน กระจายงานไปทุก CPU core (ProcessPoolExecutor)
+    combine=True  : รวมเป็น PDF ไฟล์เดียว (1 ใบ = 1 หน้า A5 ตามลำดับใน receipts)
+    combine=False : ไฟล์ ZIP ที่มี PDF แยกรายใบ
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(receipts) < BATCH_MIN_PARALLEL or max_workers == 1:
+        pdf_files = [bytes(generate_receipt_pdf(r)) for r in receipts]
+    else:
+        # ใช้ spawn เพราะ process หลัก (Streamlit) มีหลาย thread การ fork อาจติด lock ค้าง
+        chunk_size = max(1, len(receipts) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pdf_files = [bytes(b) for b in pool.map(generate_receipt_pdf, receipts, chunksize=chunk_size)]
+
+    output = BytesIO()
+    if combine:
+        writer = PdfWriter()
+        for pdf_bytes in pdf_files:
+            writer.append(BytesIO(pdf_bytes))
+        writer.write(output)
+    else:
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+            for number, (receipt_data, pdf_bytes) in enumerate(zip(receipts, pdf_files), start=1):
+                zf.writestr(_receipt_file_name(receipt_data, number), pdf_bytes)
+    return output.getvalue()
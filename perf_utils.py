@@ -0,0 +1,177 @@
+# perf_utils.py
+# เครื่องมือวัดเวลา (เปิดใช้เมื่อต้องการเท่านั้น) สำหรับตอบคำถาม "ทำไมหน้านี้ช้า"
+# - บันทึกเวลาของแต่ละฟังก์ชันใน gsheet_utils / pdf_utils ในแต่ละรอบ (rerun) ของ Streamlit
+# - บอกว่าเป็น Cache hit หรือ miss, เรียก API กี่ครั้ง และรับ/ส่งข้อมูลกี่ไบต์
+# - แสดงผลใน Sidebar และเขียน Log เป็น JSON (1 บรรทัดต่อ 1 รอบ)
+#
+# เปิดใช้: ตั้งค่า LOANAPP_DEBUG=1 (ทุก Session) หรือเปิดหน้าเว็บด้วย ?debug=1 (เฉพาะ Session นั้น)
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+# --- ค่าคงที่ ---
+ENABLED_BY_DEFAULT = os.environ.get("LOANAPP_DEBUG") == "1"
+PERF_LOG_PATH = os.environ.get("LOANAPP_PERF_LOG", "perf_log.jsonl")
+
+# รอบที่กำลังวัดอยู่ของ Thread นี้ (None = ไม่ได้เปิดใช้ ฟังก์ชันที่ครอบไว้จะทำงานตามปกติ)
+_current_run = contextvars.ContextVar("perf_current_run", default=None)
+_log_lock = threading.Lock()
+
+
+class _Run:
+    """ข้อมูลการวัดของ 1 รอบ (rerun)"""
+    def __init__(self, page: str):
+        self.page = page
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.records = []
+        self.stack = []
+
+    def summary(self) -> dict:
+        top = [r for r in self.records if r["depth"] == 0]
+        return {
+            "page": self.page,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_ms": round(self.total_ms if self.total_ms is not None else (time.perf_counter() - self.started) * 1000, 1),
+            "tracked_ms": round(sum(r["ms"] for r in top), 1),
+            "api_calls": sum(r["api_calls"] for r in self.records),
+            "bytes_sent": sum(r["bytes_sent"] for r in self.records),
+            "bytes_received": sum(r["bytes_received"] for r in self.records),
+            "cache_hits": sum(r["cache"] == "hit" for r in self.records),
+            "cache_misses": sum(r["cache"] == "miss" for r in self.records),
+            "calls": self.records,
+        }
+
+
+# --- เปิด/ปิด และจัดการรอบ ---
+def _is_enabled() -> bool:
+    # ตรวจ ?debug=1 ทุกรอบ (เพิ่มทีหลังได้) เปิดแล้วเปิดค้างไว้ทั้ง Session เพราะเปลี่ยนหน้าแล้ว Query param หาย
+    if not st.session_state.get("perf_enabled"):
+        st.session_state.perf_enabled = ENABLED_BY_DEFAULT or st.query_params.get("debug") == "1"
+    return st.session_state.perf_enabled
+
+def start_rerun(page: str):
+    """เรียกที่ต้นไฟล์ของทุกหน้า (หลัง set_page_config)"""
+    # รอบก่อนหน้าที่จบด้วย st.rerun()/st.stop() จะยังไม่ถูกเขียน Log ให้เขียนตอนนี้
+    previous = st.session_state.get("perf_run")
+    if previous is not None and previous.total_ms is None:
+        _finish(previous)
+    if not _is_enabled():
+        _current_run.set(None)
+        st.session_state.perf_run = None
+        return
+    run = _Run(page)
+    st.session_state.perf_previous_run = previous
+    st.session_state.perf_run = run
+    _current_run.set(run)
+
+def _finish(run: _Run):
+    run.total_ms = (time.perf_counter() - run.started) * 1000
+    try:
+        line = json.dumps(run.summary(), ensure_ascii=False, default=str)
+        with _log_lock, open(PERF_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass  # Log เป็นแค่ตัวช่วย เขียนไม่ได้ก็ไม่ควรทำให้หน้าเว็บพัง
+
+
+# --- ตัวครอบฟังก์ชัน ---
+def instrument(func=None, *, name: str = None, cached: bool = False):
+    """
+    จับเวลาฟังก์ชัน (ใช้เป็น @instrument หรือ @instrument(cached=True))
+    cached=True: ฟังก์ชันนี้อ่านผ่าน Cache ที่มี @cache_miss อยู่ข้างใน ถ้าไม่มี miss ระหว่างเรียก = hit
+    """
+    if func is None:
+        return functools.partial(instrument, name=name, cached=cached)
+    label = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _current_run.get()
+        if run is None:
+            return func(*args, **kwargs)
+        record = {"name": label, "depth": len(run.stack), "ms": 0.0, "cache": None,
+                  "api_calls": 0, "bytes_sent": 0, "bytes_received": 0}
+        run.records.append(record)
+        run.stack.append(record)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["ms"] = round((time.perf_counter() - started) * 1000, 2)
+            run.stack.pop()
+            if cached and record["cache"] is None:
+                record["cache"] = "hit"
+    return wrapper
+
+def cache_miss(func):
+    """ใส่ไว้ใต้ @st.cache_data: ตัวฟังก์ชันจะทำงานเฉพาะตอน Cache miss จึงใช้ทำเครื่องหมายได้"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _current_run.get()
+        if run is not None and run.stack and run.stack[-1]["cache"] is None:
+            run.stack[-1]["cache"] = "miss"
+        return func(*args, **kwargs)
+    return wrapper
+
+def record_api_call(bytes_received: int, payload=None):
+    """เรียกจาก gsheet_client ทุกครั้งที่ยิงคำขอจริง (นับให้ฟังก์ชันที่อยู่ในสุด)"""
+    run = _current_run.get()
+    if run is None or not run.stack:
+        return
+    record = run.stack[-1]
+    record["api_calls"] += 1
+    record["bytes_received"] += bytes_received
+    if payload is not None:
+        sent = payload if isinstance(payload, (bytes, str)) else json.dumps(payload, default=str)
+        record["bytes_sent"] += len(sent)
+
+
+# --- แผงแสดงผลใน Sidebar ---
+def _show_run(run: _Run):
+    summary = run.summary()
+    col1, col2 = st.columns(2)
+    col1.metric("เวลาทั้งรอบ", f"{summary['total_ms']:,.0f} ms")
+    col2.metric("ในฟังก์ชันที่วัด", f"{summary['tracked_ms']:,.0f} ms")
+    col1.metric("เรียก API", f"{summary['api_calls']:,} ครั้ง")
+    col2.metric("รับข้อมูล", f"{summary['bytes_received'] / 1024:,.1f} KB")
+    st.caption(f"Cache hit {summary['cache_hits']} / miss {summary['cache_misses']}")
+    if run.records:
+        calls = pd.DataFrame(run.records)
+        calls["name"] = ["· " * d + n for d, n in zip(calls["depth"], calls["name"])]
+        st.dataframe(calls[["name", "ms", "cache", "api_calls", "bytes_received"]],
+                     hide_index=True, use_container_width=True)
+
+def render_panel():
+    """เรียกที่ท้ายไฟล์ของทุกหน้า: แสดงผลการวัดของรอบนี้ (และรอบก่อน) แล้วเขียน Log"""
+    run = st.session_state.get("perf_run")
+    if run is None:
+        return
+    import gsheet_client, gsheet_utils  # import ตรงนี้ เพราะทั้งสองโมดูลเรียกใช้โมดูลนี้
+    with st.sidebar.expander("🐞 เวลาที่ใช้ (Debug)", expanded=True):
+        st.markdown("**รอบนี้**")
+        _show_run(run)
+        previous = st.session_state.get("perf_previous_run")
+        if previous is not None:
+            st.markdown("**รอบก่อนหน้า** (เช่น รอบที่กดปุ่มบันทึก)")
+            _show_run(previous)
+        metrics = gsheet_client.get_metrics()
+        st.caption(
+            f"ทั้งระบบตั้งแต่เปิดเซิร์ฟเวอร์: API {metrics['calls']:,} ครั้ง, ลองใหม่ {metrics['retries']:,} ครั้ง, "
+            f"รอโควตา {metrics['throttle_wait_s']:.1f} วินาที, เฉลี่ย {metrics['latency_avg_s'] * 1000:,.0f} ms/ครั้ง"
+        )
+        for name, (failed_at, message) in gsheet_utils.get_background_errors().items():
+            st.warning(f"โหลด/ซิงก์ {name} เบื้องหลังไม่สำเร็จ ({failed_at:%H:%M:%S}) ใช้สำเนาเดิมอยู่: {message}")
+        st.caption(f"Log: {PERF_LOG_PATH}")
+    _finish(run)
@@ -0,0 +1,194 @@
+# receipt_utils.py
+# เตรียมข้อมูลใบเสร็จ / ใบแจ้งยอด (dict ที่ส่งให้ pdf_utils) จากข้อมูลใน Google Sheet
+# ใช้ร่วมกันทั้งการพิมพ์ใบเสร็จย้อนหลัง (หน้าหลัก) และการพิมพ์แบบกลุ่ม (หน้าแอดมิน)
+from datetime import datetime, date
+
+import gspread
+import pandas as pd
+from babel.dates import format_date
+
+import gsheet_utils
+import interest_utils
+
+# --- ค่าคงที่ ---
+STATEMENT_TITLE = "ใบแจ้งยอดสมาชิก"
+RECEIPT_SOURCES = {
+    "PaymentHistory": "ชำระหนี้เงินกู้",
+    "ShareHistory": "ซื้อหุ้นประจำปี",
+    "SavingsHistory": "ฝากเงินสัจจะ",
+}
+
+# --- ฟังก์ชัน Helper ---
+def format_thai_date(dt):
+    if dt is None or dt is pd.NaT: return "ไม่ได้ระบุ"
+    if isinstance(dt, str):
+        try: dt = datetime.strptime(dt, "%Y-%m-%d").date()
+        except ValueError:
+             try: dt = datetime.strptime(dt, "%Y-%m-%d %H:%M:%S").date()
+             except ValueError: return dt
+    if isinstance(dt, date):
+        return format_date(dt, format='d MMMM yyyy', locale='th_TH')
+    return str(dt)
+
+# --- ใบเสร็จย้อนหลัง (รายการเดียว) ---
+def get_receipt_history(_sh: gspread.Spreadsheet, member_id: str):
+    """
+    รายการที่พิมพ์ใบเสร็จย้อนหลังได้ของสมาชิก {ข้อความที่แสดง: (แท็บ, TransactionID)} ล่าสุดขึ้นก่อน
+    """
+    rows = []
+    for source, describe in (
+        ("PaymentHistory", lambda r: f"ชำระหนี้ สัญญา {r['LoanID']} | {r['PrincipalPaid'] + r['InterestPaid']:,.2f} บาท"),
+        ("ShareHistory", lambda r: f"ซื้อหุ้นประจำปี | {r['Amount']:,.2f} บาท"),
+        ("SavingsHistory", lambda r: f"ฝากเงินสัจจะ | {r['Amount']:,.2f} บาท"),
+    ):
+        df = gsheet_utils.get_data_as_dataframe(source, _sh)
+        if df.empty: continue
+        df = df[df["MemberID"] == member_id]
+        if source == "ShareHistory":
+            df = df[df["Type"] == "Purchase"] # (รายการ "ไม่ซื้อหุ้น" ไม่มีใบเสร็จ)
+        for r in df.to_dict('records'):
+            label = f"{format_thai_date(r['Timestamp'])} | {r['TransactionID']} | {describe(r)}"
+            rows.append((r['Timestamp'], label, source, r['TransactionID']))
+    rows.sort(key=lambda x: pd.Timestamp.min if x[0] is pd.NaT else x[0], reverse=True)
+    return {label: (source, tx_id) for _, label, source, tx_id in rows}
+
+def build_history_receipt(_sh: gspread.Spreadsheet, member_id: str, source: str, transaction_id: str):
+    """
+    สร้างข้อมูลใบเสร็จจากประวัติ (PaymentHistory / ShareHistory / SavingsHistory)
+    ยอดคงเหลือ = ยอดปัจจุบัน ย้อนกลับด้วยรายการที่เกิดขึ้นหลังรายการนี้ (ให้ตรงกับใบเสร็จตอนทำรายการ)
+    """
+    member = gsheet_utils.get_member_by_id(_sh, member_id)
+    history = gsheet_utils.get_data_as_dataframe(source, _sh)
+    history = history[history["MemberID"] == member_id]
+    position = history.index[history["TransactionID"] == transaction_id][0]
+    tx = history.loc[position]
+    later = history[history.index > position]
+    receipt = {
+        "member_info": member,
+        "payment_date": format_thai_date(tx['Timestamp']),
+        "transaction_id": transaction_id,
+    }
+
+    if source == "PaymentHistory":
+        loans = gsheet_utils.get_data_as_dataframe("Loans", _sh)
+        loans = loans[loans["MemberID"] == member_id]
+        if tx['Timestamp'] is not pd.NaT:
+            loans = loans[loans["IssueDate"].isna() | (loans["IssueDate"] <= tx['Timestamp'])]
+        loan_summary = loans.groupby("LoanID", sort=False, observed=True).agg(
+            LoanAccount=("LoanAccount", "first"),
+            PrincipalAmount=("PrincipalAmount", "sum"),
+            AmountPaid=("AmountPaid", "sum"),
+        )
+        paid_later = later.groupby("LoanID", observed=True)["PrincipalPaid"].sum()
+        remaining = loan_summary["PrincipalAmount"] - loan_summary["AmountPaid"] + paid_later.reindex(loan_summary.index, fill_value=0)
+        loan_account = loan_summary["LoanAccount"].get(tx['LoanID'], "")
+        line_items = []
+        if tx['PrincipalPaid'] > 0:
+            line_items.append({'label': f"เงินต้น บัญชี {loan_account}", 'amount': float(tx['PrincipalPaid'])})
+        if tx['InterestPaid'] > 0:
+            line_items.append({'label': f"ดอกเบี้ย บัญชี {loan_account}", 'amount': float(tx['InterestPaid'])})
+        remaining = remaining[remaining > 0]
+        receipt.update({
+            "line_items": line_items,
+            "balance_summary": [
+                {'label': f'ยอดค้าง สัญญา {l_id}', 'amount': float(r), 'unit': 'บาท'} for l_id, r in remaining.items()
+            ] or [{'label': 'ยอดหนี้คงเหลือทั้งหมด', 'amount': 0, 'unit': 'บาท'}],
+            "loan_id": tx['LoanID'],
+        })
+    elif source == "ShareHistory":
+        shares_then = float(member.get('Shares', 0)) - float(later["Amount"].sum())
+        receipt.update({
+            "line_items": [{'label': f"ซื้อหุ้นประจำปี ({int(tx['Units'])} หุ้น)", 'amount': float(tx['Amount'])}],
+            "balance_summary": [
+                {'label': 'หุ้นสะสมคงเหลือ', 'amount': shares_then, 'unit': 'บาท'},
+                {'label': 'จำนวนหุ้นคงเหลือ', 'amount': int(shares_then / 50), 'unit': 'หุ้น'}
+            ],
+        })
+    else:
+        savings_then = float(member.get('Savings', 0)) - float(later["Amount"].sum())
+        receipt.update({
+            "line_items": [{'label': "ฝากเงินออมสัจจะ", 'amount': float(tx['Amount'])}],
+            "balance_summary": [{'label': 'เงินฝากสัจจะคงเหลือ', 'amount': savings_then, 'unit': 'บาท'}],
+        })
+    return receipt
+
+# --- ใบเสร็จ / ใบแจ้งยอด แบบกลุ่ม ---
+def build_receipts_for_date(_sh: gspread.Spreadsheet, source: str, day: date) -> list:
+    """
+    ใบเสร็จของทุกรายการในแท็บ source ที่ทำในวันที่ day (เช่น รอบซื้อหุ้น 5 พ.ย.) เรียงตามลำดับในชีต
+    """
+    history = gsheet_utils.get_data_as_dataframe(source, _sh)
+    if history.empty:
+        return []
+    on_day = history[history["Timestamp"].dt.date == day]
+    if source == "ShareHistory":
+        on_day = on_day[on_day["Type"] == "Purchase"]
+    return [
+        build_history_receipt(_sh, member_id, source, transaction_id)
+        for member_id, transaction_id in zip(on_day["MemberID"], on_day["TransactionID"])
+    ]
+
+def _history_after(_sh: gspread.Spreadsheet, source: str, member_id: str, as_of: date) -> pd.DataFrame:
+    """รายการของสมาชิกในแท็บ source ที่เกิดหลังวันที่ as_of (ใช้ย้อนยอดปัจจุบันกลับไป ณ วันนั้น)"""
+    history = gsheet_utils.get_data_as_dataframe(source, _sh)
+    if history.empty:
+        return history
+    return history[(history["MemberID"] == member_id) &
+                   (history["Timestamp"] >= pd.Timestamp(as_of) + pd.Timedelta(days=1))]
+
+def _later_sum(history: pd.DataFrame, column: str) -> float:
+    return float(history[column].sum()) if not history.empty else 0.0
+
+def build_member_statement(_sh: gspread.Spreadsheet, member_id: str, as_of: date) -> dict:
+    """
+    ใบแจ้งยอดของสมาชิก 1 คน ณ วันที่ as_of: ยอดที่ต้องชำระของทุกสัญญาที่ยังค้าง (เงินต้น + ดอกเบี้ย)
+    และยอดเงินฝาก/หุ้นสะสม ยอดปัจจุบันย้อนกลับด้วยรายการที่เกิดหลัง as_of (แบบเดียวกับ build_history_receipt)
+    """
+    member = gsheet_utils.get_member_by_id(_sh, member_id)
+    line_items = []
+    loans = gsheet_utils.get_data_as_dataframe("Loans", _sh)
+    if not loans.empty:
+        loans = loans[(loans["MemberID"] == member_id) &
+                      (loans["IssueDate"].isna() | (loans["IssueDate"] <= pd.Timestamp(as_of)))]
+    if not loans.empty:
+        loan_summary = loans.groupby("LoanID", sort=False, observed=True).agg(
+            LoanAccount=("LoanAccount", "first"),
+            IssueDate=("IssueDate", "first"),
+            DueDate=("DueDate", "first"),
+            Status=("Status", "first"),
+            PrincipalAmount=("PrincipalAmount", "sum"),
+            AmountPaid=("AmountPaid", "sum"),
+            InterestPaid=("InterestPaid", "sum"),
+        )
+        payments_later = _history_after(_sh, "PaymentHistory", member_id, as_of)
+        if not payments_later.empty:
+            paid_later = payments_later.groupby("LoanID", observed=True)[["PrincipalPaid", "InterestPaid"]].sum()
+            paid_later = paid_later.reindex(loan_summary.index, fill_value=0)
+            loan_summary["AmountPaid"] -= paid_later["PrincipalPaid"]
+            loan_summary["InterestPaid"] -= paid_later["InterestPaid"]
+        loan_summary["Remaining"] = loan_summary["PrincipalAmount"] - loan_summary["AmountPaid"]
+        loan_summary = interest_utils.add_interest_columns(_sh, loan_summary.reset_index())
+        # สัญญาที่ยังค้างชำระ + สัญญาที่ปิดไปแล้วหลัง as_of (ณ วันนั้นเงินต้นยังค้างอยู่)
+        loan_summary = loan_summary[loan_summary["Status"].isin(interest_utils.ACTIVE_STATUSES) |
+                                    (loan_summary["Remaining"] > 0)]
+        for loan in loan_summary.itertuples(index=False):
+            line_items.append({
+                'label': f"เงินต้นคงเหลือ สัญญา {loan.LoanID} (ครบกำหนด {format_thai_date(loan.DueDate)})",
+                'amount': float(loan.Remaining),
+            })
+            if loan.InterestArrears > 0:
+                line_items.append({'label': f"ดอกเบี้ยค้างชำระ สัญญา {loan.LoanID}", 'amount': float(loan.InterestArrears)})
+    savings = float(member.get('Savings', 0)) - _later_sum(_history_after(_sh, "SavingsHistory", member_id, as_of), "Amount")
+    shares = float(member.get('Shares', 0)) - _later_sum(_history_after(_sh, "ShareHistory", member_id, as_of), "Amount")
+    return {
+        "title": STATEMENT_TITLE,
+        "member_info": member,
+        "payment_date": format_thai_date(as_of),
+        "line_items": line_items,
+        "balance_summary": [
+            {'label': 'เงินฝากสัจจะคงเหลือ', 'amount': savings, 'unit': 'บาท'},
+            {'label': 'หุ้นสะสมคงเหลือ', 'amount': shares, 'unit': 'บาท'},
+            {'label': 'จำนวนหุ้นคงเหลือ', 'amount': int(shares / 50), 'unit': 'หุ้น'},
+        ],
+        "transaction_id": f"STATEMENT-{member_id}-{as_of.isoformat()}",
+    }
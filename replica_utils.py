@@ -0,0 +1,254 @@
+# replica_utils.py
+# สำเนาข้อมูล (Read Replica) ของ Google Sheet เก็บไว้ใน SQLite บนเครื่อง
+# - หน้าเว็บอ่านข้อมูลจากไฟล์นี้แทนการเรียก Google API ทุกครั้ง
+# - Google Sheet ยังเป็นข้อมูลหลัก (System of Record) เสมอ
+import os
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+from gspread.utils import numericise
+
+# --- ค่าคงที่ ---
+REPLICA_PATH = os.environ.get("LOANAPP_REPLICA_PATH", "replica.db")
+REPLICA_MAX_AGE = 300  # (วินาที) อายุสูงสุดของสำเนา ก่อนจะซิงก์ใหม่จาก Google Sheet
+MIRRORED_SHEETS = ["Members", "Loans", "PaymentHistory", "ShareHistory", "SavingsHistory", "SystemConfig"]
+# แท็บประวัติที่มีแต่การ append_row ต่อท้าย (ไม่มีการแก้/ลบแถวเดิม) ซิงก์เฉพาะแถวใหม่ได้
+APPEND_ONLY_SHEETS = ["PaymentHistory", "ShareHistory", "SavingsHistory"]
+
+_lock = threading.RLock()
+_conn = None
+
+# --- การเชื่อมต่อ ---
+def _connect():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(REPLICA_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS _sheets ("
+            "name TEXT PRIMARY KEY, header TEXT NOT NULL, synced_at REAL NOT NULL)"
+        )
+    return _conn
+
+def _table(name: str) -> str:
+    # ชื่อแท็บมาจากค่าคงที่ในโค้ด แต่ครอบด้วย "" กันชื่อแปลกๆ ไว้ก่อน
+    return '"sheet_' + name.replace('"', '""') + '"'
+
+def _cell_value(value):
+    """แปลงค่าที่เขียนลง Sheet ให้เหมือนค่าที่ get_all_records() จะอ่านกลับมา"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return numericise(str(value))
+
+# --- ข้อมูลทั่วไปของแต่ละแท็บ ---
+def get_header(name: str):
+    with _lock:
+        row = _connect().execute("SELECT header FROM _sheets WHERE name = ?", (name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def has_sheet(name: str) -> bool:
+    return get_header(name) is not None
+
+def is_fresh(name: str, max_age: float = REPLICA_MAX_AGE) -> bool:
+    with _lock:
+        row = _connect().execute("SELECT synced_at FROM _sheets WHERE name = ?", (name,)).fetchone()
+    return row is not None and (time.time() - row[0]) < max_age
+
+def mark_stale(name: str = None):
+    """บังคับให้การอ่านครั้งถัดไปซิงก์ใหม่จาก Google Sheet (ไม่ลบข้อมูลเดิม)"""
+    with _lock:
+        if name is None:
+            _connect().execute("UPDATE _sheets SET synced_at = 0")
+        else:
+            _connect().execute("UPDATE _sheets SET synced_at = 0 WHERE name = ?", (name,))
+
+# --- อ่านข้อมูล ---
+def load_sheet(name: str) -> pd.DataFrame:
+    """
+    อ่านแท็บจากสำเนาเป็น DataFrame (index คือเลขแถวจริงใน Sheet)
+    """
+    header = get_header(name)
+    if not header:
+        return pd.DataFrame()
+    with _lock:
+        rows = _connect().execute(f"SELECT * FROM {_table(name)} ORDER BY _row").fetchall()
+    df = pd.DataFrame([r[1:] for r in rows], columns=header)
+    df.index = pd.Index([r[0] for r in rows], name="_row")
+    return df
+
+# --- เขียนข้อมูล ---
+def replace_sheet(name: str, header: list, rows: list):
+    """แทนที่ข้อมูลทั้งแท็บ (ใช้ตอนซิงก์จาก Google Sheet) แถวแรกของข้อมูลคือแถวที่ 2 ใน Sheet"""
+    width = len(header)
+    columns = ", ".join(["_row INTEGER NOT NULL"] + [f"c{i}" for i in range(width)])
+    placeholders = ", ".join(["?"] * (width + 1))
+    data = [
+        [row_no] + [numericise(v) for v in (list(r) + [""] * width)[:width]]
+        for row_no, r in enumerate(rows, start=2)
+    ]
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {_table(name)}")
+            conn.execute(f"CREATE TABLE {_table(name)} ({columns})")
+            conn.executemany(f"INSERT INTO {_table(name)} VALUES ({placeholders})", data)
+            conn.execute(
+                "INSERT OR REPLACE INTO _sheets (name, header, synced_at) VALUES (?, ?, ?)",
+                (name, json.dumps(header, ensure_ascii=False), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def append_row(name: str, values: list, row_number: int = None):
+    """เพิ่มแถวต่อท้ายในสำเนา (row_number = เลขแถวที่ Sheet ตอบกลับมา ถ้ามี) คืนค่าเลขแถวที่ใช้"""
+    header = get_header(name)
+    if header is None:
+        return None
+    width = len(header)
+    data = [_cell_value(v) for v in (list(values) + [""] * width)[:width]]
+    with _lock:
+        conn = _connect()
+        if row_number is None:
+            row_number = (conn.execute(f"SELECT MAX(_row) FROM {_table(name)}").fetchone()[0] or 1) + 1
+        conn.execute(
+            f"INSERT INTO {_table(name)} VALUES ({', '.join(['?'] * (width + 1))})",
+            [row_number] + data,
+        )
+    return row_number
+
+def update_by_id(name: str, id_column: str, item_id, updates: dict, all_rows: bool = False) -> int:
+    """อัปเดตคอลัมน์ของแถวที่ id ตรงกัน คืนค่าจำนวนแถวที่ถูกแก้ไข"""
+    header = get_header(name)
+    if header is None or id_column not in header:
+        return 0
+    assignments, params = [], []
+    for column_name, new_value in updates.items():
+        if column_name in header:
+            assignments.append(f"c{header.index(column_name)} = ?")
+            params.append(_cell_value(new_value))
+    if not assignments:
+        return 0
+    id_col = f"c{header.index(id_column)}"
+    where = f"{id_col} = ?"
+    if not all_rows:
+        where = f"_row = (SELECT MIN(_row) FROM {_table(name)} WHERE {id_col} = ?)"
+    with _lock:
+        cur = _connect().execute(
+            f"UPDATE {_table(name)} SET {', '.join(assignments)} WHERE {where}",
+            params + [_cell_value(item_id)],
+        )
+    return cur.rowcount
+
+def delete_by_id(name: str, id_column: str, item_id) -> bool:
+    """ลบแถวแรกที่ id ตรงกัน แล้วเลื่อนเลขแถวที่อยู่ด้านล่างขึ้นมา (เหมือน delete_rows ใน Sheet)"""
+    header = get_header(name)
+    if header is None or id_column not in header:
+        return False
+    id_col = f"c{header.index(id_column)}"
+    with _lock:
+        conn = _connect()
+        row = conn.execute(
+            f"SELECT MIN(_row) FROM {_table(name)} WHERE {id_col} = ?", (_cell_value(item_id),)
+        ).fetchone()[0]
+        if row is None:
+            return False
+        conn.execute("BEGIN")
+        conn.execute(f"DELETE FROM {_table(name)} WHERE _row = ?", (row,))
+        conn.execute(f"UPDATE {_table(name)} SET _row = _row - 1 WHERE _row > ?", (row,))
+        conn.execute("COMMIT")
+    return True
+
+def lookup(name: str, id_column: str, item_id, column: str) -> list:
+    """ค่าของคอลัมน์ column ในทุกแถวที่ id ตรงกัน (เช่น หา MemberID ของ LoanID)"""
+    header = get_header(name)
+    if header is None or id_column not in header or column not in header:
+        return []
+    with _lock:
+        rows = _connect().execute(
+            f"SELECT c{header.index(column)} FROM {_table(name)} WHERE c{header.index(id_column)} = ? ORDER BY _row",
+            (_cell_value(item_id),),
+        ).fetchall()
+    return [r[0] for r in rows]
+
+def replace_rows(name: str, rows: dict):
+    """แทนที่ทั้งแถวตามเลขแถว {เลขแถว: [ค่าดิบจาก Sheet, ...]} (ใช้หลังอ่านแถวที่เพิ่งเขียนกลับมา)"""
+    header = get_header(name)
+    if header is None or not rows:
+        return
+    width = len(header)
+    assignments = ", ".join(f"c{i} = ?" for i in range(width))
+    with _lock:
+        conn = _connect()
+        for row_number, values in rows.items():
+            data = [numericise(v) for v in (list(values) + [""] * width)[:width]]
+            conn.execute(f"UPDATE {_table(name)} SET {assignments} WHERE _row = ?", data + [row_number])
+
+def last_row(name: str):
+    """เลขแถวสุดท้ายที่สำเนารู้จัก และค่าของแถวนั้น (แถวหัวตาราง = 1)"""
+    header = get_header(name)
+    if header is None:
+        return None, None
+    with _lock:
+        row = _connect().execute(f"SELECT * FROM {_table(name)} ORDER BY _row DESC LIMIT 1").fetchone()
+    if row is None:
+        return 1, list(header)
+    return row[0], list(row[1:])
+
+def append_rows(name: str, rows: list, start_row: int, mark_synced: bool = True):
+    """
+    ต่อท้ายหลายแถวเริ่มที่เลขแถว start_row
+    mark_synced=True : แถวมาจากการอ่าน Sheet (ซิงก์ส่วนท้าย) นับเป็นการซิงก์ล่าสุดด้วย
+    """
+    header = get_header(name)
+    if header is None:
+        return
+    width = len(header)
+    data = [
+        [row_no] + [_cell_value(v) for v in (list(r) + [""] * width)[:width]]
+        for row_no, r in enumerate(rows, start=start_row)
+    ]
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        conn.executemany(f"INSERT INTO {_table(name)} VALUES ({', '.join(['?'] * (width + 1))})", data)
+        if mark_synced:
+            conn.execute("UPDATE _sheets SET synced_at = ? WHERE name = ?", (time.time(), name))
+        conn.execute("COMMIT")
+
+def rows_from(name: str, start_row: int) -> list:
+    """แถวตั้งแต่เลขแถว start_row ลงไป [(เลขแถว, [ค่า]), ...] (ใช้อ่านเฉพาะแถวใหม่ของแท็บประวัติ)"""
+    header = get_header(name)
+    if header is None:
+        return []
+    with _lock:
+        rows = _connect().execute(
+            f"SELECT * FROM {_table(name)} WHERE _row >= ? ORDER BY _row", (start_row,)
+        ).fetchall()
+    return [(r[0], list(r[1:])) for r in rows]
+
+def load_rows(name: str, column: str, values: list) -> pd.DataFrame:
+    """เหมือน load_sheet แต่เฉพาะแถวที่คอลัมน์ column มีค่าอยู่ใน values"""
+    header = get_header(name)
+    if not header or column not in header:
+        return pd.DataFrame()
+    params = [_cell_value(v) for v in values]
+    with _lock:
+        rows = _connect().execute(
+            f"SELECT * FROM {_table(name)} WHERE c{header.index(column)} IN ({', '.join(['?'] * len(params))}) "
+            f"ORDER BY _row", params,
+        ).fetchall() if params else []
+    df = pd.DataFrame([r[1:] for r in rows], columns=header)
+    df.index = pd.Index([r[0] for r in rows], name="_row")
+    return df
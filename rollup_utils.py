@@ -0,0 +1,196 @@
+# rollup_utils.py
+# ตารางสรุปภาพรวม (Rollup) ตามพื้นที่ (จังหวัด/อำเภอ/ตำบล/หมู่บ้าน) และตามบัญชีเงินกู้
+# - คำนวณทั้งหมดครั้งแรกครั้งเดียว แล้วเก็บยอดของแต่ละสมาชิกไว้
+# - เมื่อ gsheet_utils เขียนข้อมูล จะรู้จาก changes_since() ว่าสมาชิกคนไหนเปลี่ยน
+#   จึงลบยอดเดิมของคนนั้นออกแล้วบวกยอดใหม่เข้าไป (ไม่ต้อง join ทั้ง Members + Loans ใหม่)
+# - ซิงก์ทั้งแท็บใหม่ หรือขึ้นวันใหม่ (สถานะเกินกำหนดเปลี่ยนตามวันที่) จะคำนวณใหม่ทั้งหมด
+# - ขณะดู Snapshot (snapshot_utils) จะคำนวณจากไฟล์ครั้งเดียวเก็บแยกไว้ ไม่ยุ่งกับตารางสรุปของข้อมูลจริง
+import threading
+from datetime import date
+
+import gspread
+import pandas as pd
+
+import gsheet_utils
+import overdue_sweep
+import perf_utils
+import replica_utils
+import schema_utils
+from interest_utils import ACTIVE_STATUSES
+
+# --- ค่าคงที่ ---
+GEO_LEVELS = ["Province", "District", "SubDistrict", "Village"]  # จากใหญ่ไปเล็ก
+UNKNOWN_AREA = "(ไม่ระบุ)"
+MEMBER_FIELDS = ["Members", "Savings", "Shares"]
+LOAN_FIELDS = ["Loans", "ActiveLoans", "Principal", "Outstanding", "OverdueLoans", "OverdueOutstanding"]
+ROLLUP_FIELDS = MEMBER_FIELDS + LOAN_FIELDS
+INCREMENTAL_LIMIT = 500  # สมาชิกที่เปลี่ยนมากกว่านี้ (เช่น ปรับสถานะทั้งพอร์ต) คำนวณใหม่ทั้งหมดเร็วกว่า
+SNAPSHOT_CACHE_SIZE = 4  # จำนวน Snapshot ที่เก็บตารางสรุปไว้ในหน่วยความจำ
+
+
+class _Rollup:
+    """ยอดของแต่ละสมาชิก และยอดรวมตามพื้นที่ / บัญชี ณ เวอร์ชันข้อมูลหนึ่ง"""
+    def __init__(self, day: date, versions: dict):
+        self.day = day
+        self.versions = versions
+        self.members = {}  # MemberID -> (พื้นที่, {Members, Savings, Shares})
+        self.loans = {}    # MemberID -> {บัญชี: {LOAN_FIELDS}}
+        self.geo = {level: {} for level in GEO_LEVELS}  # ระดับ -> {(จังหวัด, ..., ระดับนั้น): {ROLLUP_FIELDS}}
+        self.accounts = {}  # บัญชี -> {LOAN_FIELDS}
+
+_state = None
+_snapshot_states = {}  # โฟลเดอร์ Snapshot -> _Rollup
+_lock = threading.Lock()
+
+# --- ยอดของแต่ละสมาชิก ---
+def _member_contributions(members: pd.DataFrame) -> dict:
+    if members.empty:
+        return {}
+    areas = members.reindex(columns=GEO_LEVELS).astype("string").fillna("").apply(lambda s: s.str.strip())
+    areas = areas.mask(areas == "", UNKNOWN_AREA)
+    return {
+        str(member_id): (tuple(area), {"Members": 1, "Savings": float(savings), "Shares": float(shares)})
+        for member_id, area, savings, shares in zip(
+            members["MemberID"], areas.itertuples(index=False), members["Savings"], members["Shares"])
+    }
+
+def _loan_contributions(loans: pd.DataFrame, today: date) -> dict:
+    """{MemberID: {บัญชี: {LOAN_FIELDS}}} (สัญญาหนึ่งอาจมีหลายแถว นับเป็น 1 สัญญา)"""
+    if loans.empty:
+        return {}
+    per_loan = loans.groupby("LoanID", sort=False, observed=True).agg(
+        MemberID=("MemberID", "first"),
+        LoanAccount=("LoanAccount", "first"),
+        DueDate=("DueDate", "first"),
+        Status=("Status", "first"),
+        Principal=("PrincipalAmount", "sum"),
+        AmountPaid=("AmountPaid", "sum"),
+    )
+    active = per_loan["Status"].isin(ACTIVE_STATUSES)
+    # เกินกำหนด = สถานะเกินกำหนดแล้ว หรือยังค้างชำระแต่เลยวันครบกำหนด (ยังไม่ได้รัน overdue_sweep)
+    overdue = active & ((per_loan["Status"] == overdue_sweep.OVERDUE_STATUS) |
+                        (per_loan["DueDate"] <= pd.Timestamp(today)))
+    outstanding = (per_loan["Principal"] - per_loan["AmountPaid"]).clip(lower=0).where(active, 0.0)
+    frame = pd.DataFrame({
+        "MemberID": per_loan["MemberID"].astype(str),
+        "LoanAccount": per_loan["LoanAccount"].astype(str),
+        "Loans": 1,
+        "ActiveLoans": active.astype(int),
+        "Principal": per_loan["Principal"],
+        "Outstanding": outstanding,
+        "OverdueLoans": overdue.astype(int),
+        "OverdueOutstanding": outstanding.where(overdue, 0.0),
+    })
+    grouped = frame.groupby(["MemberID", "LoanAccount"], sort=False)[LOAN_FIELDS].sum()
+    contributions = {}
+    for (member_id, account), values in zip(grouped.index, grouped.itertuples(index=False)):
+        contributions.setdefault(member_id, {})[account] = dict(zip(LOAN_FIELDS, values))
+    return contributions
+
+def _apply(state: _Rollup, member_id: str, sign: int):
+    """บวก (sign=1) หรือลบ (sign=-1) ยอดของสมาชิกคนนี้ในตารางสรุป"""
+    area, member_fields = state.members.get(member_id, ((UNKNOWN_AREA,) * len(GEO_LEVELS), {}))
+    accounts = state.loans.get(member_id, {})
+    totals = dict(member_fields)
+    for account, fields in accounts.items():
+        entry = state.accounts.setdefault(account, dict.fromkeys(LOAN_FIELDS, 0))
+        for name, value in fields.items():
+            entry[name] += sign * value
+            totals[name] = totals.get(name, 0) + value
+    for depth, level in enumerate(GEO_LEVELS, start=1):
+        entry = state.geo[level].setdefault(area[:depth], dict.fromkeys(ROLLUP_FIELDS, 0))
+        for name, value in totals.items():
+            entry[name] += sign * value
+
+# --- คำนวณใหม่ทั้งหมด / เฉพาะสมาชิกที่เปลี่ยน ---
+def _build(_sh: gspread.Spreadsheet, today: date, versions: dict) -> _Rollup:
+    state = _Rollup(today, versions)
+    state.members = _member_contributions(gsheet_utils.get_data_as_dataframe("Members", _sh))
+    state.loans = _loan_contributions(gsheet_utils.get_data_as_dataframe("Loans", _sh), today)
+    for member_id in state.members.keys() | state.loans.keys():
+        _apply(state, member_id, 1)
+    return state
+
+def _load_member_rows(worksheet_name: str, member_ids: list, _sh: gspread.Spreadsheet) -> pd.DataFrame:
+    gsheet_utils.ensure_replica(worksheet_name, _sh)
+    return schema_utils.apply_schema(worksheet_name, replica_utils.load_rows(worksheet_name, "MemberID", member_ids))
+
+def _update_members(state: _Rollup, member_ids: set, _sh: gspread.Spreadsheet):
+    member_ids = list(member_ids)
+    for member_id in member_ids:
+        _apply(state, member_id, -1)
+        state.members.pop(member_id, None)
+        state.loans.pop(member_id, None)
+    # อ่านแถวของสมาชิกที่เปลี่ยนทั้งหมดในคำสั่งเดียวต่อแท็บ
+    state.members.update(_member_contributions(_load_member_rows("Members", member_ids, _sh)))
+    state.loans.update(_loan_contributions(_load_member_rows("Loans", member_ids, _sh), state.day))
+    for member_id in member_ids:
+        _apply(state, member_id, 1)
+
+@perf_utils.instrument
+def refresh(_sh: gspread.Spreadsheet) -> _Rollup:
+    """ให้ตารางสรุปตรงกับข้อมูลล่าสุด (อัปเดตเฉพาะสมาชิกที่ถูกเขียนตั้งแต่ครั้งก่อน)"""
+    global _state
+    with _lock:
+        snapshot = gsheet_utils.active_snapshot()
+        if snapshot is not None:
+            state = _snapshot_states.get(snapshot)
+            if state is None or state.day != date.today():
+                if len(_snapshot_states) >= SNAPSHOT_CACHE_SIZE:
+                    _snapshot_states.pop(next(iter(_snapshot_states)))
+                state = _snapshot_states[snapshot] = _build(_sh, date.today(), {})
+            return state
+        # อ่านเวอร์ชันก่อนอ่านข้อมูล: ถ้ามีการเขียนระหว่างนี้ รอบถัดไปจะอัปเดตซ้ำให้อีกครั้ง
+        versions = {name: gsheet_utils.data_version(name) for name in ("Members", "Loans")}
+        today = date.today()
+        changed = None
+        if _state is not None and _state.day == today:
+            changed = set()
+            for name, version in _state.versions.items():
+                ids = gsheet_utils.changes_since(name, version)
+                if ids is None:
+                    changed = None
+                    break
+                changed |= ids
+        if changed is None or len(changed) > INCREMENTAL_LIMIT:
+            _state = _build(_sh, today, versions)
+        elif changed:
+            _update_members(_state, changed, _sh)
+            _state.versions = versions
+        return _state
+
+# --- อ่านตารางสรุป ---
+def _ratios(df: pd.DataFrame) -> pd.DataFrame:
+    df["OverdueRatio"] = (df["OverdueOutstanding"] / df["Outstanding"].where(df["Outstanding"] > 0)).fillna(0.0)
+    df["OverdueLoanRatio"] = (df["OverdueLoans"] / df["ActiveLoans"].where(df["ActiveLoans"] > 0)).fillna(0.0)
+    return df
+
+def get_totals(_sh: gspread.Spreadsheet) -> dict:
+    """ยอดรวมทั้งระบบ {ROLLUP_FIELDS, OverdueRatio, OverdueLoanRatio}"""
+    state = refresh(_sh)
+    with _lock:
+        rows = list(state.geo[GEO_LEVELS[0]].values())
+    totals = pd.DataFrame(rows, columns=ROLLUP_FIELDS).sum().to_frame().T if rows else \
+        pd.DataFrame([dict.fromkeys(ROLLUP_FIELDS, 0)])
+    return _ratios(totals).iloc[0].to_dict()
+
+def get_geo_rollup(_sh: gspread.Spreadsheet, level: str = "District") -> pd.DataFrame:
+    """ยอดรวมตามพื้นที่ระดับ level (มีคอลัมน์พื้นที่ระดับที่ใหญ่กว่าด้วย) เรียงตามเงินต้นคงค้าง"""
+    state = refresh(_sh)
+    depth = GEO_LEVELS.index(level) + 1
+    with _lock:
+        items = [(area, dict(fields)) for area, fields in state.geo[level].items()
+                 if fields["Members"] > 0 or fields["Loans"] > 0]
+    df = pd.DataFrame([fields for _, fields in items], columns=ROLLUP_FIELDS)
+    areas = pd.DataFrame([area for area, _ in items], columns=GEO_LEVELS[:depth])
+    df = pd.concat([areas, df], axis=1)
+    return _ratios(df).sort_values("Outstanding", ascending=False, ignore_index=True)
+
+def get_account_rollup(_sh: gspread.Spreadsheet) -> pd.DataFrame:
+    """ยอดรวมตามบัญชีเงินกู้ (LoanAccount)"""
+    state = refresh(_sh)
+    with _lock:
+        items = [(account, dict(fields)) for account, fields in state.accounts.items() if fields["Loans"] > 0]
+    df = pd.DataFrame([fields for _, fields in items], columns=LOAN_FIELDS)
+    df.insert(0, "LoanAccount", [account for account, _ in items])
+    return _ratios(df).sort_values("LoanAccount", ignore_index=True)
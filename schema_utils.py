@@ -0,0 +1,106 @@
+# schema_utils.py
+# ทะเบียนโครงสร้างข้อมูล (Schema) ของแต่ละแท็บใน Google Sheet
+# แปลงชนิดข้อมูลครั้งเดียวตอนโหลด เพื่อให้ทุกหน้าได้ DataFrame ที่พร้อมใช้
+import pandas as pd
+import streamlit as st
+
+# --- ลำดับคอลัมน์ตามที่แอปเขียนลง Sheet ---
+SHEET_COLUMNS = {
+    "Members": [
+        "MemberID", "Name", "AddressNo", "Village", "SubDistrict", "District", "Province", "DOB",
+        "Savings", "Shares", "LastUpdated", "LastSharePurchaseDate",
+    ],
+    "Loans": [
+        "LoanID", "MemberID", "LoanAccount", "IssueDate", "DueDate",
+        "PrincipalAmount", "AmountPaid", "InterestPaid", "Status", "DataEntryDate",
+    ],
+    "PaymentHistory": ["TransactionID", "Timestamp", "MemberID", "LoanID", "PrincipalPaid", "InterestPaid"],
+    "ShareHistory": ["TransactionID", "Timestamp", "MemberID", "Units", "Amount", "Type"],
+    "SavingsHistory": ["TransactionID", "Timestamp", "MemberID", "Amount"],
+    "SystemConfig": ["Key", "Value"],
+}
+
+# --- ชนิดข้อมูลของแต่ละคอลัมน์ ---
+# money    : ตัวเลขทศนิยม (ตัดตัวคั่นหลักพัน "1,500" -> 1500, ช่องว่าง = 0, ค่าผิดรูปแบบ = 0 พร้อมแจ้งเตือน)
+# integer  : จำนวนเต็ม (เหมือน money)
+# dates    : วันที่/เวลา (ช่องว่าง = NaT)
+# category : ค่าที่ซ้ำกันบ่อย เก็บแบบ Categorical เพื่อประหยัดหน่วยความจำ
+# text     : ข้อความ (กันกรณีที่ Sheet แปลงรหัสเป็นตัวเลข เช่น บ้านเลขที่)
+SHEET_SCHEMAS = {
+    "Members": {
+        "money": ["Savings", "Shares"],
+        "dates": ["DOB", "LastUpdated", "LastSharePurchaseDate"],
+        "category": ["Village", "SubDistrict", "District", "Province"],
+        "text": ["MemberID", "Name", "AddressNo"],
+    },
+    "Loans": {
+        "money": ["PrincipalAmount", "AmountPaid", "InterestPaid"],
+        "dates": ["IssueDate", "DueDate", "DataEntryDate"],
+        "category": ["MemberID", "LoanAccount", "Status"],
+        "text": ["LoanID"],
+    },
+    "PaymentHistory": {
+        "money": ["PrincipalPaid", "InterestPaid"],
+        "dates": ["Timestamp"],
+        "category": ["MemberID", "LoanID"],
+        "text": ["TransactionID"],
+    },
+    "ShareHistory": {
+        "money": ["Amount"],
+        "integer": ["Units"],
+        "dates": ["Timestamp"],
+        "category": ["MemberID", "Type"],
+        "text": ["TransactionID"],
+    },
+    "SavingsHistory": {
+        "money": ["Amount"],
+        "dates": ["Timestamp"],
+        "category": ["MemberID"],
+        "text": ["TransactionID"],
+    },
+    "SystemConfig": {
+        "text": ["Key", "Value"],
+    },
+}
+
+def _as_text(series: pd.Series) -> pd.Series:
+    # ตัวเลขที่ Sheet อ่านเป็น float เช่น 12.0 ให้กลับเป็น "12"
+    return series.map(lambda v: "" if v is None else (str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)))
+
+def _as_number(worksheet_name: str, column: str, series: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0)
+    # ค่าจาก Sheet อาจมีตัวคั่นหลักพัน เช่น "1,500" (ให้ตรงกับ gsheet_utils.safe_float)
+    cleaned = series.map(lambda v: v.replace(",", "").strip() if isinstance(v, str) else v)
+    numbers = pd.to_numeric(cleaned, errors="coerce")
+    invalid = numbers.isna() & cleaned.notna() & (cleaned != "")
+    if invalid.any():
+        samples = ", ".join(f"'{v}'" for v in series[invalid].astype(str).unique()[:3])
+        st.warning(f"แท็บ {worksheet_name} คอลัมน์ {column} มีค่าที่ไม่ใช่ตัวเลข {int(invalid.sum())} ช่อง "
+                   f"(เช่น {samples}) ระบบนับเป็น 0 กรุณาแก้ไขใน Google Sheet")
+    return numbers.fillna(0)
+
+def apply_schema(worksheet_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    แปลงชนิดข้อมูลตาม SHEET_SCHEMAS (เฉพาะคอลัมน์ที่มีอยู่จริง) คืนค่า DataFrame ใหม่
+    """
+    schema = SHEET_SCHEMAS.get(worksheet_name)
+    if schema is None or len(df.columns) == 0:
+        return df
+    df = df.copy()
+    for column in schema.get("money", []):
+        if column in df.columns:
+            df[column] = _as_number(worksheet_name, column, df[column]).astype("float64")
+    for column in schema.get("integer", []):
+        if column in df.columns:
+            df[column] = _as_number(worksheet_name, column, df[column]).astype("int64")
+    for column in schema.get("dates", []):
+        if column in df.columns:
+            df[column] = pd.to_datetime(_as_text(df[column]).replace("", None), errors="coerce", format="mixed")
+    for column in schema.get("category", []):
+        if column in df.columns:
+            df[column] = _as_text(df[column]).astype("category")
+    for column in schema.get("text", []):
+        if column in df.columns:
+            df[column] = _as_text(df[column])
+    return df
@@ -0,0 +1,237 @@
+# search_utils.py
+# ดัชนีค้นหาสมาชิก (ชื่อ / รหัสสมาชิก / หมู่บ้าน) สำหรับช่องเลือกสมาชิก
+# - สร้างครั้งเดียวต่อเวอร์ชันข้อมูลของแท็บ Members แล้วใช้ร่วมกันทุก Session
+# - ค้นหาแบบขึ้นต้นด้วย (prefix) ด้วย bisect และแบบคลาดเคลื่อนได้ (fuzzy) ด้วย bigram
+# - คืนค่าเป็น MemberID เสมอ (ชื่อซ้ำกันก็เลือกถูกคน)
+# - ตารางสมาชิกแบบแบ่งหน้า: กรอง/เรียงฝั่งเซิร์ฟเวอร์ ส่งให้หน้าเว็บเฉพาะแถวที่แสดง
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Hashable
+
+import gspread
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import gsheet_utils
+import perf_utils
+
+# --- ค่าคงที่ ---
+PAGE_SIZE = 50  # จำนวนตัวเลือกต่อหน้าในช่องเลือกสมาชิก
+FUZZY_MIN_SCORE = 0.6  # สัดส่วน bigram ที่ตรงกันขั้นต่ำของการค้นหาแบบคลาดเคลื่อน
+NAME_PREFIXES = ("นางสาว", "น.ส.", "นาย", "นาง", "ด.ช.", "ด.ญ.")
+
+# ตารางแปลงอักขระ (translate ครั้งเดียว): เลขไทย -> เลขอารบิก, ตัดอักขระที่มองไม่เห็น
+# และตัดวรรณยุกต์ ไม้ไต่คู้ การันต์ นิคหิต (พิมพ์ผิด/ตกหล่นบ่อย จึงไม่นำมาเทียบ)
+_TRANSLATION = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789", "\u0e47\u0e48\u0e49\u0e4a\u0e4b\u0e4c\u0e4d\u200b\u200c\u200d\ufeff")
+
+# --- ฟังก์ชัน Helper ---
+def normalize(text) -> str:
+    """
+    ทำให้ข้อความภาษาไทยเทียบกันได้: ตัดช่องว่างซ้ำ/อักขระที่มองไม่เห็น, ตัวพิมพ์เล็ก,
+    เลขไทย -> เลขอารบิก, "ํา" -> "ำ" และตัดวรรณยุกต์ออก
+    """
+    text = unicodedata.normalize("NFC", str(text or "")).replace("\u0e4d\u0e32", "\u0e33")  # "ํา" -> "ำ"
+    return " ".join(text.translate(_TRANSLATION).lower().split())
+
+def _strip_prefix(name: str) -> str:
+    for prefix in NAME_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):].strip()
+    return name
+
+def _bigrams(text: str) -> set:
+    text = text.replace(" ", "")
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class MemberIndex:
+    """ดัชนีค้นหาสมาชิก (อ่านอย่างเดียว สร้างใหม่ทุกครั้งที่ข้อมูล Members เปลี่ยน)"""
+    def __init__(self, member_ids: list, names: list, villages: list):
+        self.member_ids = [str(m) for m in member_ids]
+        self.labels = {}
+        self.name_keys = []
+        keys = []
+        self.grams = defaultdict(set)
+        village_keys = {}
+        # ชื่อซ้ำ: ใส่รหัสสมาชิกกับหมู่บ้านในข้อความที่แสดง เพื่อให้แยกออกว่าเป็นใคร
+        for row, (member_id, name, village) in enumerate(zip(self.member_ids, names, villages)):
+            name, village = str(name or ""), str(village or "")
+            self.labels[member_id] = f"{name} ({member_id})" + (f" - {village}" if village else "")
+            full_name = _strip_prefix(normalize(name))
+            self.name_keys.append(full_name)
+            if village not in village_keys:
+                village_keys[village] = normalize(village)
+            words = full_name.split()
+            # คีย์สำหรับค้นแบบ prefix: ชื่อเต็ม, แต่ละคำ (ค้นด้วยนามสกุลได้), รหัส และหมู่บ้าน
+            id_key = normalize(member_id)
+            for key, rank in [(full_name, 0), *((w, 1) for w in words[1:]), (id_key, 0),
+                              (re.sub(r"\D", "", id_key), 0), (village_keys[village], 2)]:
+                if key:
+                    keys.append((key, rank, row))
+            for gram in _bigrams(full_name):
+                self.grams[gram].add(row)
+        keys.sort()
+        self.keys = [k for k, _, _ in keys]
+        self.key_rows = [(rank, row) for _, rank, row in keys]
+        self.by_name = sorted(range(len(self.member_ids)), key=lambda r: self.name_keys[r])
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    def _prefix_rows(self, query: str) -> list:
+        start = bisect_left(self.keys, query)
+        hits = {}
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(query):
+                break
+            rank, row = self.key_rows[i]
+            hits[row] = min(rank, hits.get(row, rank))
+        return sorted(hits, key=lambda r: (hits[r], self.name_keys[r]))
+
+    def _fuzzy_rows(self, query: str, exclude: set) -> list:
+        query_grams = _bigrams(query)
+        counts = defaultdict(int)
+        for gram in query_grams:
+            for row in self.grams.get(gram, ()):
+                counts[row] += 1
+        scored = [
+            (count / len(query_grams), row) for row, count in counts.items()
+            if row not in exclude and count / len(query_grams) >= FUZZY_MIN_SCORE
+        ]
+        scored.sort(key=lambda x: (-x[0], self.name_keys[x[1]]))
+        return [row for _, row in scored]
+
+    def search(self, query: str) -> list:
+        """MemberID ที่ตรงกับคำค้น เรียงตามความตรง (ไม่มีคำค้น = ทุกคนเรียงตามชื่อ)"""
+        query = _strip_prefix(normalize(query))
+        if not query:
+            rows = self.by_name
+        else:
+            rows = self._prefix_rows(query)
+            # ไม่พบหรือพบน้อย (เช่น พิมพ์ผิด) จึงค่อยหาแบบคลาดเคลื่อนเพิ่ม
+            if len(rows) < PAGE_SIZE:
+                rows += self._fuzzy_rows(query, set(rows))
+        return [self.member_ids[r] for r in rows]
+
+    def label(self, member_id: str) -> str:
+        return self.labels.get(str(member_id), str(member_id))
+
+
+@perf_utils.instrument(cached=True)
+def get_member_index(_sh: gspread.Spreadsheet) -> MemberIndex:
+    return _get_member_index(_sh, gsheet_utils.data_version("Members"))
+
+@st.cache_resource(max_entries=2)
+@perf_utils.cache_miss
+def _get_member_index(_sh: gspread.Spreadsheet, version: Hashable) -> MemberIndex:
+    # ใช้ cache_resource (ไม่ copy ทุกครั้งที่อ่านแบบ cache_data) เพราะดัชนีไม่ถูกแก้ไขหลังสร้าง
+    df = gsheet_utils.get_data_as_dataframe("Members", _sh)
+    if df.empty:
+        return MemberIndex([], [], [])
+    villages = df["Village"].astype(str) if "Village" in df.columns else [""] * len(df)
+    return MemberIndex(df["MemberID"].tolist(), df["Name"].tolist(), list(villages))
+
+def search_members(_sh: gspread.Spreadsheet, query: str, page: int = 1, page_size: int = PAGE_SIZE):
+    """คืนค่า (MemberID ของหน้าที่ขอ, จำนวนที่พบทั้งหมด)"""
+    results = get_member_index(_sh).search(query)
+    start = (max(page, 1) - 1) * page_size
+    return results[start:start + page_size], len(results)
+
+# --- ช่องเลือกสมาชิก (ใช้ร่วมกันหลายหน้า) ---
+def member_selector(_sh: gspread.Spreadsheet, key: str, label: str = "เลือกสมาชิก:"):
+    """ช่องค้นหา + ช่องเลือกสมาชิก (แสดงทีละ PAGE_SIZE คน) คืนค่า MemberID ที่เลือก หรือ None"""
+    index = get_member_index(_sh)
+    col_q, col_p = st.columns([4, 1])
+    with col_q:
+        # เปลี่ยนคำค้นแล้วกลับไปหน้าแรก
+        query = st.text_input("ค้นหาสมาชิก (ชื่อ / นามสกุล / รหัสสมาชิก / หมู่บ้าน)", key=f"{key}_query",
+                              on_change=st.session_state.pop, args=(f"{key}_page", None))
+    results = index.search(query)
+    pages = max(1, -(-len(results) // PAGE_SIZE))
+    with col_p:
+        page = st.number_input(f"หน้า (จาก {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page") if pages > 1 else 1
+    options = results[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+
+    # สมาชิกที่เลือกไว้แล้วต้องยังอยู่ในตัวเลือก แม้จะเปลี่ยนคำค้นหรือหน้า
+    selected = st.session_state.get(key)
+    if selected and selected not in options and selected in index.labels:
+        options = [selected] + options
+    if query and not results:
+        st.caption("ไม่พบสมาชิกที่ตรงกับคำค้น")
+    return st.selectbox(
+        label,
+        options=options,
+        format_func=index.label,
+        index=None,
+        placeholder=f"พบ {len(results):,} คน - กรุณาเลือก...",
+        key=key,
+    )
+
+
+# --- ตารางสมาชิกแบบแบ่งหน้า (กรอง/เรียงฝั่งเซิร์ฟเวอร์) ---
+# ผลการกรอง (ตำแหน่งแถว) และแต่ละหน้าถูก Cache แยกกัน: เปลี่ยนหน้าไม่ต้องกรองใหม่
+# และหน้าเว็บได้รับเฉพาะแถวของหน้าที่แสดง ไม่ใช่ทั้งตาราง
+def get_member_filter_options(_sh: gspread.Spreadsheet) -> dict:
+    return _get_member_filter_options(_sh, gsheet_utils.data_version("Members"))
+
+@st.cache_data(ttl=300)
+@perf_utils.cache_miss
+def _get_member_filter_options(_sh: gspread.Spreadsheet, version: Hashable) -> dict:
+    df = gsheet_utils.get_data_as_dataframe("Members", _sh)
+    if df.empty:
+        return {"villages": [], "districts": [], "max_savings": 0.0, "total": 0}
+    return {
+        "villages": sorted(df["Village"].dropna().unique().tolist()),
+        "districts": sorted(df["District"].dropna().unique().tolist()),
+        "max_savings": float(df["Savings"].max()),
+        "total": len(df),
+    }
+
+@st.cache_data(ttl=300, max_entries=16)
+@perf_utils.cache_miss
+def _filter_members(_sh: gspread.Spreadsheet, version: Hashable, villages: tuple, districts: tuple,
+                    savings_range: tuple, updated_since, sort_by: str, ascending: bool) -> np.ndarray:
+    """ตำแหน่งแถว (0 = แถวแรกของข้อมูล) ที่ผ่านตัวกรอง เรียงตาม sort_by (None = ตามลำดับใน Sheet)"""
+    df = gsheet_utils.get_data_as_dataframe("Members", _sh)
+    if df.empty:
+        return np.array([], dtype="int64")
+    mask = np.ones(len(df), dtype=bool)
+    if villages:
+        mask &= df["Village"].isin(villages).to_numpy()
+    if districts:
+        mask &= df["District"].isin(districts).to_numpy()
+    if savings_range:
+        mask &= df["Savings"].between(*savings_range).to_numpy()
+    if updated_since:
+        mask &= (df["LastUpdated"] >= pd.Timestamp(updated_since)).to_numpy()
+    positions = np.flatnonzero(mask)
+    if sort_by:
+        ordered = df[sort_by].iloc[positions].sort_values(ascending=ascending, na_position="last", kind="stable")
+        positions = ordered.index.to_numpy()
+    elif not ascending:
+        positions = positions[::-1]
+    return positions
+
+@perf_utils.instrument(cached=True)
+def get_member_page(_sh: gspread.Spreadsheet, page: int = 1, page_size: int = PAGE_SIZE, villages=(), districts=(),
+                    savings_range=None, updated_since=None, sort_by: str = None, ascending: bool = True):
+    """
+    คืนค่า (DataFrame ของหน้าที่ขอ, จำนวนที่ผ่านตัวกรองทั้งหมด)
+    index ของ DataFrame คือลำดับแถวในข้อมูล (เริ่มที่ 1)
+    """
+    return _get_member_page(_sh, gsheet_utils.data_version("Members"), max(page, 1), page_size,
+                            tuple(villages), tuple(districts), tuple(savings_range) if savings_range else None,
+                            updated_since, sort_by, ascending)
+
+@st.cache_data(ttl=300, max_entries=64)
+@perf_utils.cache_miss
+def _get_member_page(_sh: gspread.Spreadsheet, version: Hashable, page: int, page_size: int, villages: tuple, districts: tuple,
+                     savings_range: tuple, updated_since, sort_by: str, ascending: bool):
+    positions = _filter_members(_sh, version, villages, districts, savings_range, updated_since, sort_by, ascending)
+    visible = positions[(page - 1) * page_size:page * page_size]
+    rows = gsheet_utils.get_data_as_dataframe("Members", _sh).iloc[visible]
+    rows.index = pd.Index(visible + 1, name="RowNumber")
+    return rows, len(positions)
@@ -0,0 +1,141 @@
+# snapshot_utils.py
+# สำเนาข้อมูลทั้งสมุดงาน (Snapshot) เป็นไฟล์ Arrow IPC (Feather v2) แบบคอลัมน์ เก็บชนิดข้อมูลตาม schema_utils ไว้ครบ
+# - ใช้สำรองข้อมูล และให้หน้ารายงาน/เครื่องมือแอดมินอ่านจากไฟล์ในเครื่องแทน Google Sheet (อ่านอย่างเดียว)
+# - 1 Snapshot = 1 โฟลเดอร์: <แท็บ>.arrow + manifest.json
+# - บีบอัด zstd เป็นค่าเริ่มต้น (ไฟล์เล็ก) หรือไม่บีบอัดเพื่อเปิดแบบ Memory-map ได้ทันที
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+
+import gspread
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import streamlit as st
+
+import gsheet_utils
+import perf_utils
+import replica_utils
+
+# --- ค่าคงที่ ---
+SNAPSHOT_DIR = os.environ.get("LOANAPP_SNAPSHOT_DIR", "snapshots")
+MANIFEST_NAME = "manifest.json"
+TABLE_SUFFIX = ".arrow"
+COMPRESSIONS = ["zstd", "lz4", "uncompressed"]
+
+# --- ฟังก์ชัน Helper ---
+def _table_path(path: str, worksheet_name: str) -> str:
+    return os.path.join(path, worksheet_name + TABLE_SUFFIX)
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    df = df.copy()
+    for column in df.columns:
+        # คอลัมน์ที่ไม่ได้อยู่ใน Schema อาจมีทั้งตัวเลขและข้อความปนกัน เก็บเป็นข้อความ
+        if df[column].dtype == object:
+            df[column] = df[column].map(lambda v: "" if v is None else str(v))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def read_manifest(path: str):
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# --- สร้าง Snapshot ---
+@perf_utils.instrument
+def export_snapshot(_sh: gspread.Spreadsheet, compression: str = "zstd", path: str = None) -> str:
+    """บันทึกทุกแท็บ (ข้อมูลจริงล่าสุดจากสำเนาในเครื่อง) เป็น Snapshot คืนค่าโฟลเดอร์ที่สร้าง"""
+    created_at = datetime.now()
+    path = path or os.path.join(SNAPSHOT_DIR, created_at.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(path, exist_ok=True)
+    manifest = {"created_at": created_at.isoformat(timespec="seconds"), "compression": compression, "tables": {}}
+    previous = gsheet_utils.active_snapshot()
+    gsheet_utils.use_snapshot(None)  # สร้างจากข้อมูลจริงเสมอ แม้หน้านี้กำลังดู Snapshot อื่นอยู่
+    try:
+        for worksheet_name in replica_utils.MIRRORED_SHEETS:
+            df = gsheet_utils.get_data_as_dataframe(worksheet_name, _sh)
+            feather.write_feather(_to_arrow(df), _table_path(path, worksheet_name), compression=compression)
+            manifest["tables"][worksheet_name] = {"rows": len(df), "columns": list(map(str, df.columns))}
+    finally:
+        gsheet_utils.use_snapshot(previous)
+    # เขียน manifest เป็นไฟล์สุดท้าย: โฟลเดอร์ที่ไม่มี manifest = ยังสร้างไม่เสร็จ
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return path
+
+def list_snapshots() -> list:
+    """[(โฟลเดอร์, manifest)] ใหม่สุดก่อน (เฉพาะที่สร้างเสร็จแล้ว)"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(SNAPSHOT_DIR), reverse=True):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        manifest = read_manifest(path)
+        if manifest is not None:
+            snapshots.append((path, manifest))
+    return sorted(snapshots, key=lambda s: s[1].get("created_at", ""), reverse=True)
+
+# --- อ่าน Snapshot ---
+@perf_utils.instrument
+def load_table(path: str, worksheet_name: str) -> pd.DataFrame:
+    """DataFrame ของแท็บจาก Snapshot (ชนิดข้อมูลเหมือน get_data_as_dataframe) ไม่มีแท็บนี้ = DataFrame ว่าง"""
+    table_path = _table_path(path, worksheet_name)
+    if not os.path.exists(table_path):
+        return pd.DataFrame()
+    # ไฟล์ที่ไม่บีบอัดจะถูก Memory-map โดยไม่ต้องคัดลอกทั้งไฟล์เข้าหน่วยความจำ
+    return feather.read_table(table_path, memory_map=True).to_pandas()
+
+# --- ดาวน์โหลด / อัปโหลด ---
+def pack_snapshot(path: str) -> bytes:
+    """รวม Snapshot เป็นไฟล์ ZIP (ไฟล์ Arrow บีบอัดอยู่แล้ว จึงเก็บแบบไม่บีบอัดซ้ำ)"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        for name in sorted(os.listdir(path)):
+            if name == MANIFEST_NAME or name.endswith(TABLE_SUFFIX):
+                zf.write(os.path.join(path, name), arcname=name)
+    return buffer.getvalue()
+
+def unpack_snapshot(data: bytes) -> str:
+    """แตกไฟล์ ZIP ที่ได้จาก pack_snapshot เป็น Snapshot ใหม่ในเครื่อง คืนค่าโฟลเดอร์ (ไฟล์ไม่ถูกต้อง = ValueError)"""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        # รับเฉพาะไฟล์ระดับบนสุดที่รู้จัก กันชื่อไฟล์แบบ ../
+        names = [n for n in zf.namelist() if n == os.path.basename(n) and
+                 (n == MANIFEST_NAME or n.endswith(TABLE_SUFFIX))]
+        if MANIFEST_NAME not in names:
+            raise ValueError("ไม่พบ manifest.json ในไฟล์")
+        manifest = json.loads(zf.read(MANIFEST_NAME))
+        path = os.path.join(SNAPSHOT_DIR, "upload-" + datetime.now().strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(path, exist_ok=True)
+        for name in names:
+            if name != MANIFEST_NAME:
+                with open(os.path.join(path, name), "wb") as f:
+                    f.write(zf.read(name))
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return path
+
+# --- เลือกแหล่งข้อมูลในหน้าเว็บ ---
+def describe(path: str, manifest: dict) -> str:
+    rows = sum(t.get("rows", 0) for t in manifest.get("tables", {}).values())
+    return f"Snapshot {manifest.get('created_at', '?').replace('T', ' ')} ({rows:,} แถว) - {os.path.basename(path)}"
+
+def data_source_selector() -> str:
+    """
+    ตัวเลือกแหล่งข้อมูลใน Sidebar (Google Sheet หรือ Snapshot) แล้วตั้งค่าให้การอ่านของรอบนี้
+    คืนค่าโฟลเดอร์ Snapshot ที่เลือก หรือ None = ข้อมูลจริง
+    """
+    manifests = dict(list_snapshots())
+    options = [None] + list(manifests)
+    if st.session_state.get("data_source") not in options:
+        st.session_state.data_source = None
+    path = st.sidebar.selectbox(
+        "แหล่งข้อมูล", options=options, key="data_source",
+        format_func=lambda p: "Google Sheet (ข้อมูลจริง)" if p is None else describe(p, manifests[p]),
+    )
+    gsheet_utils.use_snapshot(path)
+    if path is not None:
+        st.sidebar.warning("กำลังดูข้อมูลจาก Snapshot (อ่านอย่างเดียว) ปุ่มที่บันทึกข้อมูลจะถูกซ่อนไว้")
+    return path